@@ -58,7 +58,9 @@ def drop_tables(cursor):
     tables_to_drop = [
         "phone_returns", "asset_history_log", "ticket_updates", "tickets", "assignments",
         "phone_numbers", "sim_cards", "phones", "rh_data", "workers", "manager_secteurs", 
-        "secteurs", "users", "roles", "phone_requests"
+        "secteurs", "users", "roles", "phone_requests", "change_log", "change_log_horizon",
+        "import_jobs", "report_snapshots", "phone_status_changes", "daily_sector_rollups",
+        "daily_ticket_rollups", "daily_rollup_state", "ticket_metrics"
     ]
     for table in tables_to_drop:
         cursor.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE").format(sql.Identifier(table)))
@@ -253,11 +255,285 @@ def create_schema(cursor):
         $$ language 'plpgsql';
         """,
         """
-        -- Trigger to automatically update updated_at for phones table
+        -- Trigger to automatically update updated_at for phones table; no-op
+        -- updates (e.g. re-imports of unchanged rows) keep the old timestamp
         CREATE TRIGGER update_phones_updated_at 
             BEFORE UPDATE ON phones 
             FOR EACH ROW 
+            WHEN (OLD.* IS DISTINCT FROM NEW.*)
             EXECUTE FUNCTION update_updated_at_column();
+        """,
+        """
+        -- Indexes for keyset pagination of the ticket history, newest first
+        CREATE INDEX idx_tickets_created_at_id ON tickets (created_at DESC, id DESC);
+        CREATE INDEX idx_tickets_reporter_created_at_id ON tickets (reported_by_manager_id, created_at DESC, id DESC);
+        """,
+        """
+        -- Indexes for the filters and sort keys of the admin workers overview
+        CREATE INDEX idx_workers_secteur_full_name ON workers (secteur_id, full_name, id);
+        CREATE INDEX idx_workers_full_name ON workers (full_name, id);
+        CREATE INDEX idx_workers_status ON workers (status, full_name, id);
+        CREATE INDEX idx_rh_data_contract ON rh_data (contract_type, contract_end_date);
+        -- Trigram indexes for the ?q= substring search (ILIKE '%...%') on names and worker ids
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX idx_workers_full_name_trgm ON workers USING gin (full_name gin_trgm_ops);
+        CREATE INDEX idx_workers_worker_id_trgm ON workers USING gin (worker_id gin_trgm_ops);
+        """,
+        """
+        -- Indexes for the status filter and sort of the inventory lists
+        CREATE INDEX idx_phones_status_id ON phones (status, id);
+        CREATE INDEX idx_sim_cards_status_id ON sim_cards (status, id);
+        CREATE INDEX idx_phone_numbers_status_id ON phone_numbers (status, id);
+        """,
+        """
+        -- Per-phone indexes for the asset lifecycle timeline and ticket update lookups
+        CREATE INDEX idx_assignments_phone_date ON assignments (phone_id, assignment_date);
+        CREATE INDEX idx_tickets_phone_created_at ON tickets (phone_id, created_at);
+        CREATE INDEX idx_asset_history_log_asset ON asset_history_log (asset_type, asset_id, event_timestamp);
+        CREATE INDEX idx_ticket_updates_ticket_created_at ON ticket_updates (ticket_id, created_at);
+        """,
+        """
+        -- Change feed for delta sync: one row per insert, update or delete on the synced
+        -- tables, stamped with the writing transaction's id. Deletes keep the old row so
+        -- tombstones can still be scoped to the right users.
+        CREATE TABLE change_log (
+            id BIGSERIAL PRIMARY KEY,
+            txid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+            table_name VARCHAR(50) NOT NULL,
+            row_id INTEGER NOT NULL,
+            op CHAR(1) NOT NULL CHECK (op IN ('I', 'U', 'D')),
+            row_data JSONB NOT NULL,
+            old_data JSONB NULL,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX idx_change_log_txid ON change_log (txid);
+        CREATE INDEX idx_change_log_changed_at ON change_log (changed_at);
+        """,
+        """
+        -- Highest txid removed by pruning: sync tokens at or below it must do a full reload
+        CREATE TABLE change_log_horizon (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            max_pruned_txid XID8 NOT NULL
+        );
+        """,
+        """
+        CREATE OR REPLACE FUNCTION record_change()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO change_log (table_name, row_id, op, row_data)
+                VALUES (TG_TABLE_NAME, OLD.id, 'D', to_jsonb(OLD));
+            ELSIF TG_OP = 'UPDATE' THEN
+                -- An update that changed nothing is not a change
+                IF OLD IS NOT DISTINCT FROM NEW THEN
+                    RETURN NULL;
+                END IF;
+                INSERT INTO change_log (table_name, row_id, op, row_data, old_data)
+                VALUES (TG_TABLE_NAME, NEW.id, 'U', to_jsonb(NEW), to_jsonb(OLD));
+            ELSE
+                INSERT INTO change_log (table_name, row_id, op, row_data)
+                VALUES (TG_TABLE_NAME, NEW.id, 'I', to_jsonb(NEW));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+        """,
+        """
+        CREATE TRIGGER workers_change_log AFTER INSERT OR UPDATE OR DELETE ON workers
+            FOR EACH ROW EXECUTE FUNCTION record_change();
+        CREATE TRIGGER phones_change_log AFTER INSERT OR UPDATE OR DELETE ON phones
+            FOR EACH ROW EXECUTE FUNCTION record_change();
+        CREATE TRIGGER assignments_change_log AFTER INSERT OR UPDATE OR DELETE ON assignments
+            FOR EACH ROW EXECUTE FUNCTION record_change();
+        CREATE TRIGGER tickets_change_log AFTER INSERT OR UPDATE OR DELETE ON tickets
+            FOR EACH ROW EXECUTE FUNCTION record_change();
+        """,
+        """
+        -- Background CSV imports: one row per job, updated after every committed chunk.
+        -- rows_processed doubles as the resume offset into the staged upload.
+        CREATE TABLE import_jobs (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            kind VARCHAR(20) NOT NULL,
+            target_table VARCHAR(50),
+            upload_id VARCHAR(36) NOT NULL,
+            options JSONB NOT NULL DEFAULT '{}',
+            status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'completed', 'failed', 'cancelled')),
+            rows_processed INTEGER NOT NULL DEFAULT 0,
+            run_start_rows INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            unchanged INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            bytes_processed BIGINT NOT NULL DEFAULT 0,
+            bytes_total BIGINT NOT NULL DEFAULT 0,
+            cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+            error TEXT NULL,
+            details JSONB NOT NULL DEFAULT '{}',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            started_at TIMESTAMPTZ NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            finished_at TIMESTAMPTZ NULL
+        );
+        CREATE INDEX idx_import_jobs_user_created ON import_jobs (user_id, created_at DESC);
+        """,
+        """
+        -- Point-in-time copies of the admin reports, stored as gzip-compressed JSON
+        CREATE TABLE report_snapshots (
+            id SERIAL PRIMARY KEY,
+            report VARCHAR(50) NOT NULL,
+            taken_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            trigger VARCHAR(20) NOT NULL DEFAULT 'scheduled' CHECK (trigger IN ('scheduled', 'manual')),
+            created_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+            payload BYTEA NOT NULL,
+            raw_bytes INTEGER NOT NULL,
+            compressed_bytes INTEGER NOT NULL
+        );
+        CREATE INDEX idx_report_snapshots_report_taken ON report_snapshots (report, taken_at DESC);
+        """,
+        """
+        -- Status transitions of phones, recorded by trigger whichever code path made them
+        CREATE TABLE phone_status_changes (
+            id BIGSERIAL PRIMARY KEY,
+            phone_id INTEGER NOT NULL REFERENCES phones(id) ON DELETE CASCADE,
+            old_status VARCHAR(50) NULL,
+            new_status VARCHAR(50) NOT NULL,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX idx_phone_status_changes_changed_at ON phone_status_changes (changed_at);
+        CREATE INDEX idx_phone_status_changes_phone ON phone_status_changes (phone_id, new_status);
+        -- Retirements logged before phone_status_changes existed are a rollup source too
+        CREATE INDEX idx_asset_history_log_retired ON asset_history_log (event_timestamp)
+            WHERE asset_type = 'Phone' AND event_type = 'Retired';
+        """,
+        """
+        CREATE OR REPLACE FUNCTION record_phone_status_change()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO phone_status_changes (phone_id, old_status, new_status)
+            VALUES (NEW.id, CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END, NEW.status);
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+        CREATE TRIGGER phones_status_insert AFTER INSERT ON phones
+            FOR EACH ROW EXECUTE FUNCTION record_phone_status_change();
+        CREATE TRIGGER phones_status_update AFTER UPDATE OF status ON phones
+            FOR EACH ROW
+            WHEN (OLD.status IS DISTINCT FROM NEW.status)
+            EXECUTE FUNCTION record_phone_status_change();
+        """,
+        """
+        -- Daily trend rollups, per sector (NULL: no sector could be attributed).
+        -- Rebuilt from rolled_up_through on by the rollup refresh; never edited by hand.
+        CREATE TABLE daily_sector_rollups (
+            day DATE NOT NULL,
+            secteur_id INTEGER NULL REFERENCES secteurs(id) ON DELETE CASCADE,
+            assignments_created INTEGER NOT NULL DEFAULT 0,
+            assignments_returned INTEGER NOT NULL DEFAULT 0,
+            phones_to_repair INTEGER NOT NULL DEFAULT 0,
+            phones_retired INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX idx_daily_sector_rollups_day ON daily_sector_rollups (day, secteur_id);
+        CREATE TABLE daily_ticket_rollups (
+            day DATE NOT NULL,
+            secteur_id INTEGER NULL REFERENCES secteurs(id) ON DELETE CASCADE,
+            priority VARCHAR(20) NOT NULL,
+            tickets_opened INTEGER NOT NULL DEFAULT 0,
+            tickets_resolved INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX idx_daily_ticket_rollups_day ON daily_ticket_rollups (day, secteur_id);
+        CREATE TABLE daily_rollup_state (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            rolled_up_through DATE NOT NULL,
+            refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        -- Range reads on the event timestamps for the rollup refresh
+        CREATE INDEX idx_assignments_assignment_date ON assignments (assignment_date);
+        CREATE INDEX idx_assignments_return_date ON assignments (return_date);
+        CREATE INDEX idx_tickets_resolved_at ON tickets (resolved_at);
+        """,
+        """
+        -- Per-ticket response and resolution times for SLA analytics, kept current by the
+        -- triggers below. First response: the first public update by someone other than
+        -- the reporting manager.
+        CREATE TABLE ticket_metrics (
+            ticket_id INTEGER PRIMARY KEY REFERENCES tickets(id) ON DELETE CASCADE,
+            priority VARCHAR(20) NOT NULL,
+            secteur_id INTEGER NULL REFERENCES secteurs(id) ON DELETE SET NULL,
+            assignee_id INTEGER NULL REFERENCES users(id) ON DELETE SET NULL,
+            created_at TIMESTAMPTZ NOT NULL,
+            first_response_at TIMESTAMPTZ NULL,
+            resolved_at TIMESTAMPTZ NULL,
+            first_response_seconds DOUBLE PRECISION
+                GENERATED ALWAYS AS (EXTRACT(epoch FROM first_response_at - created_at)::double precision) STORED,
+            resolution_seconds DOUBLE PRECISION
+                GENERATED ALWAYS AS (EXTRACT(epoch FROM resolved_at - created_at)::double precision) STORED
+        );
+        CREATE INDEX idx_ticket_metrics_created_at ON ticket_metrics (created_at);
+        """,
+        """
+        -- Recomputes one ticket's metrics row; the sector is that of the worker who last
+        -- received the ticket's phone before it was opened
+        CREATE OR REPLACE FUNCTION refresh_ticket_metrics(p_ticket_id INTEGER)
+        RETURNS VOID AS $$
+        BEGIN
+            INSERT INTO ticket_metrics
+                (ticket_id, priority, secteur_id, assignee_id, created_at, first_response_at, resolved_at)
+            SELECT t.id, t.priority, holder.secteur_id, t.assigned_to_support_id, t.created_at,
+                   (SELECT MIN(tu.created_at) FROM ticket_updates tu
+                    WHERE tu.ticket_id = t.id AND NOT tu.is_internal_note
+                      AND tu.update_author_id <> t.reported_by_manager_id),
+                   t.resolved_at
+            FROM tickets t
+            LEFT JOIN LATERAL (
+                SELECT w.secteur_id
+                FROM assignments a
+                JOIN workers w ON a.worker_id = w.id
+                WHERE a.phone_id = t.phone_id AND a.assignment_date <= t.created_at
+                ORDER BY a.assignment_date DESC
+                LIMIT 1
+            ) holder ON TRUE
+            WHERE t.id = p_ticket_id
+            ON CONFLICT (ticket_id) DO UPDATE
+                SET priority = EXCLUDED.priority,
+                    secteur_id = EXCLUDED.secteur_id,
+                    assignee_id = EXCLUDED.assignee_id,
+                    created_at = EXCLUDED.created_at,
+                    first_response_at = EXCLUDED.first_response_at,
+                    resolved_at = EXCLUDED.resolved_at;
+        END;
+        $$ language 'plpgsql';
+        CREATE OR REPLACE FUNCTION ticket_metrics_changed()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'tickets' THEN
+                PERFORM refresh_ticket_metrics(NEW.id);
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM refresh_ticket_metrics(OLD.ticket_id);
+            ELSE
+                PERFORM refresh_ticket_metrics(NEW.ticket_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+        CREATE TRIGGER tickets_metrics
+            AFTER INSERT OR UPDATE OF priority, assigned_to_support_id, resolved_at, created_at, phone_id, reported_by_manager_id
+            ON tickets
+            FOR EACH ROW EXECUTE FUNCTION ticket_metrics_changed();
+        CREATE TRIGGER ticket_updates_metrics AFTER INSERT OR UPDATE OR DELETE ON ticket_updates
+            FOR EACH ROW EXECUTE FUNCTION ticket_metrics_changed();
+        """,
+        """
+        -- Used by import dry runs to test whether a CSV value casts to a column type
+        CREATE OR REPLACE FUNCTION import_value_is_valid(value TEXT, type_name TEXT)
+        RETURNS BOOLEAN AS $$
+        BEGIN
+            EXECUTE format('SELECT %L::%s', value, type_name);
+            RETURN TRUE;
+        EXCEPTION WHEN others THEN
+            RETURN FALSE;
+        END;
+        $$ language 'plpgsql' STABLE;
         """
     ]
     execute_queries(cursor, schema_queries)
@@ -4,16 +4,27 @@
 import os
 import csv
 import io
+import itertools
+import re
 import logging
 from logging.handlers import RotatingFileHandler
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from functools import wraps
 from werkzeug.security import check_password_hash
 from flask import (
-    Flask, request, jsonify, render_template, session, redirect, url_for, g, send_from_directory
+    Flask, request, jsonify, render_template, session, redirect, url_for, g, send_from_directory,
+    has_app_context, before_render_template, template_rendered
 )
+from flask.json.provider import JSONProvider
+from contextlib import contextmanager
+import base64
+import codecs
+import decimal
+import json
+import orjson
 from flask_sqlalchemy import SQLAlchemy
+from flask_socketio import SocketIO, join_room
 from flask_migrate import Migrate
 from dotenv import load_dotenv
 import time
@@ -21,6 +32,19 @@ from collections import defaultdict, deque
 import tempfile
 import os
 import uuid
+import zlib
+import gzip
+import mimetypes
+import queue
+import select
+import threading
+from werkzeug.security import safe_join
+from werkzeug.datastructures import FileStorage
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
 
 # Rate Limiter Implementation (inline)
 class RateLimiter:
@@ -293,16 +317,274 @@ def add_security_headers(response):
             "script-src 'self' 'unsafe-inline' https://cdn.tailwindcss.com https://cdn.jsdelivr.net; "
             "style-src 'self' 'unsafe-inline' https://cdn.tailwindcss.com https://cdn.jsdelivr.net; "
             "img-src 'self' data:; "
-            "font-src 'self' https://fonts.googleapis.com https://fonts.gstatic.com"
+            "font-src 'self' https://fonts.googleapis.com https://fonts.gstatic.com; "
+            f"connect-src 'self' ws://{request.host} wss://{request.host}"
         )
     
     return response
 
+# --- Server-Timing Instrumentation ---
+# Each request accumulates the time spent in a few coarse phases so that browser
+# devtools can show whether a slow page is waiting on Postgres, JSON
+# serialization, template rendering or the session checks.
+app.config['SERVER_TIMING_ENABLED'] = os.environ.get('SERVER_TIMING_ENABLED', 'True').lower() == 'true'
+
+SERVER_TIMING_PHASES = [
+    ('db', 'Postgres'),
+    ('serialize', 'JSON serialization'),
+    ('render', 'Template rendering'),
+    ('auth', 'Session checks'),
+]
+
+@contextmanager
+def phase_timer(phase):
+    """Adds the wall time of the wrapped block to the current request's phase total."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_app_context():
+            timings = g.setdefault('server_timing', defaultdict(float))
+            timings[phase] += time.perf_counter() - start
+
+class TimedCursor(RealDictCursor):
+    """RealDictCursor that reports its execution time to the 'db' phase."""
+
+    def execute(self, query, vars=None):
+        with phase_timer('db'):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with phase_timer('db'):
+            return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        with phase_timer('db'):
+            return super().copy_expert(sql, file, size)
+
+def _json_default(value):
+    """Encodes the few types orjson does not handle natively."""
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FleetJSONProvider(JSONProvider):
+    """
+    orjson-backed JSON provider. Rows from RealDictCursor, datetime and date
+    values are encoded natively, so endpoints can pass query results straight
+    to jsonify. Time spent building responses is reported to the 'serialize'
+    Server-Timing phase.
+    """
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS
+        if self._app.debug:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_json_default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        # Flask's session serializer passes an object_hook, which orjson does not support
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with phase_timer('serialize'):
+            body = orjson.dumps(obj, default=_json_default, option=self._options())
+        return self._app.response_class(body, mimetype='application/json')
+
+app.json = FleetJSONProvider(app)
+
+@before_render_template.connect_via(app)
+def _start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def _stop_render_timer(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        timings = g.setdefault('server_timing', defaultdict(float))
+        timings['render'] += time.perf_counter() - started
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def add_server_timing_header(response):
+    """Emit a Server-Timing header with the per-phase totals of this request."""
+    if not app.config['SERVER_TIMING_ENABLED']:
+        return response
+
+    timings = g.get('server_timing', {})
+    metrics = [
+        f'{name};dur={timings.get(name, 0.0) * 1000:.1f};desc="{description}"'
+        for name, description in SERVER_TIMING_PHASES
+    ]
+    started = g.get('request_started')
+    if started is not None:
+        metrics.append(f'total;dur={(time.perf_counter() - started) * 1000:.1f};desc="Total"')
+    response.headers['Server-Timing'] = ', '.join(metrics)
+    return response
+
+# --- Response Compression ---
+# JSON and CSV payloads compress very well. Responses above COMPRESS_MIN_SIZE are
+# compressed with brotli or gzip depending on the client's Accept-Encoding.
+# Streamed responses are compressed chunk by chunk with a sync flush after each
+# chunk so the client still receives data as it is produced.
+app.config['COMPRESS_ENABLED'] = os.environ.get('COMPRESS_ENABLED', 'True').lower() == 'true'
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+app.config['COMPRESS_GZIP_LEVEL'] = 6
+app.config['COMPRESS_BROTLI_QUALITY'] = 4
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'text/javascript', 'text/css',
+    'text/csv', 'text/html', 'text/plain', 'image/svg+xml',
+}
+
+class StreamCompressor:
+    """Incremental brotli/gzip compressor with a common compress/flush/finish interface."""
+
+    def __init__(self, encoding, gzip_level=6, brotli_quality=4):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31 produces a gzip container rather than a raw zlib stream
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        if self.encoding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+def negotiate_content_encoding():
+    """Returns 'br', 'gzip' or None according to the request's Accept-Encoding."""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+def _compress_stream(chunks, original, compressor):
+    try:
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush()
+        yield compressor.finish()
+    finally:
+        if hasattr(original, 'close'):
+            original.close()
+
+@app.after_request
+def compress_response(response):
+    """Compress eligible responses with the best encoding the client accepts."""
+    if not app.config['COMPRESS_ENABLED']:
+        return response
+    if (response.direct_passthrough
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or request.method == 'HEAD'):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_content_encoding()
+    if encoding is None:
+        return response
+
+    compressor = StreamCompressor(
+        encoding,
+        gzip_level=app.config['COMPRESS_GZIP_LEVEL'],
+        brotli_quality=app.config['COMPRESS_BROTLI_QUALITY'],
+    )
+    if response.is_streamed:
+        original = response.response
+        response.response = _compress_stream(response.iter_encoded(), original, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        compressed = compressor.compress(data) + compressor.finish()
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# Precompressed variants (e.g. static/css/custom.css.br or .gz) are produced by
+# `flask --app main compress-static` and served in place of the original file.
+PRECOMPRESSED_SUFFIXES = [('br', '.br'), ('gzip', '.gz')]
+
+def send_precompressed_static(filename):
+    """Static file view that prefers a precompressed variant the client accepts."""
+    accepted = request.accept_encodings
+    for encoding, suffix in PRECOMPRESSED_SUFFIXES:
+        if not accepted[encoding]:
+            continue
+        variant = safe_join(app.static_folder, filename + suffix)
+        if variant and os.path.isfile(variant):
+            response = send_from_directory(
+                app.static_folder, filename + suffix,
+                mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                max_age=app.get_send_file_max_age(filename),
+            )
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+
+    response = app.send_static_file(filename)
+    response.vary.add('Accept-Encoding')
+    return response
+
+app.view_functions['static'] = send_precompressed_static
+
+@app.cli.command('compress-static')
+def compress_static_command():
+    """Write .gz (and .br when brotli is installed) variants of compressible static files."""
+    written = 0
+    for directory, _, filenames in os.walk(app.static_folder):
+        for name in filenames:
+            if name.endswith(('.gz', '.br')):
+                continue
+            if mimetypes.guess_type(name)[0] not in COMPRESSIBLE_MIMETYPES:
+                continue
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            written += 1
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(data, quality=11))
+                written += 1
+    print(f"Wrote {written} precompressed static files.")
+
 # --- Database Connection ---
 def get_db():
     if 'db' not in g:
         try:
-            g.db = psycopg2.connect(os.environ.get('DATABASE_URL'), cursor_factory=RealDictCursor)
+            with phase_timer('db'):
+                g.db = psycopg2.connect(os.environ.get('DATABASE_URL'), cursor_factory=TimedCursor)
             app.logger.debug("Database connection established")
         except psycopg2.OperationalError as e:
             app.logger.error("Database connection failed: %s", e, exc_info=True)
@@ -326,53 +608,229 @@ def log_event(cursor, asset_type, asset_id, event_type, details):
         (asset_type, asset_id, event_type, session.get('user_id'), details)
     )
 
+# --- Columnar JSON Responses ---
+# Table-shaped endpoints accept ?format=columnar. Instead of repeating every key
+# on every row, the payload lists the column names once and carries the values
+# as one array per column. Low-cardinality text columns (sectors, statuses,
+# carriers...) are dictionary-encoded: the column holds indexes into
+# "dictionaries"[column] and null stays null.
+def wants_columnar():
+    return request.args.get('format') == 'columnar'
+
+def to_columnar(rows, columns, dictionary_columns=()):
+    """Converts a list of row dicts into the columnar payload described above."""
+    values = []
+    dictionaries = {}
+    for column in columns:
+        column_values = [row[column] for row in rows]
+        if column in dictionary_columns:
+            codes = {}
+            column_values = [
+                None if value is None else codes.setdefault(value, len(codes))
+                for value in column_values
+            ]
+            dictionaries[column] = list(codes)
+        values.append(column_values)
+    return {
+        "format": "columnar",
+        "columns": columns,
+        "row_count": len(rows),
+        "values": values,
+        "dictionaries": dictionaries,
+    }
+
+def cursor_columns(cursor):
+    """Column names of the last query, available even when it returned no rows."""
+    return [column.name for column in cursor.description]
+
+# --- Sparse Fieldsets ---
+# Wide endpoints accept ?fields=a,b,c. Each endpoint describes its output fields
+# as {name: (sql_expression, (join aliases...))} and its joins as an ordered list
+# of (alias, join_sql, (dependencies...), params). Only the joins needed by the
+# selected fields (plus any the query itself requires) end up in the SQL, so
+# expensive aggregations are skipped entirely when their fields are not asked for.
+def requested_fields(field_specs):
+    """Returns the fields listed in ?fields=, or every field when the parameter is absent."""
+    raw = request.args.get('fields')
+    if not raw:
+        return list(field_specs)
+    fields = list(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in field_specs]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+def build_sparse_select(field_specs, join_specs, fields, required_joins=()):
+    """Returns (select_sql, joins_sql, params) for the given fields."""
+    needed = set(required_joins)
+    for field in fields:
+        needed.update(field_specs[field][1])
+    # Dependencies always appear earlier in join_specs, so one reverse pass closes the set
+    for alias, _, depends_on, _ in reversed(join_specs):
+        if alias in needed:
+            needed.update(depends_on)
+
+    select_sql = ",\n            ".join(f"{field_specs[field][0]} AS {field}" for field in fields)
+    joins = []
+    params = []
+    for alias, join_sql, _, join_params in join_specs:
+        if alias in needed:
+            joins.append(join_sql)
+            params.extend(join_params)
+    return select_sql, "\n        ".join(joins), params
+
+# --- Keyset Pagination ---
+# Lists that grow without bound accept ?limit= and ?cursor=. The cursor is an
+# opaque base64url token holding the sort key of the last row already sent; the
+# next page is read with a row comparison such as (t.created_at, t.id) < (%s, %s),
+# which stays an index range scan however deep the history goes. Paged responses
+# are wrapped as {"items": [...], "next_cursor": ...}; without limit/cursor the
+# endpoints keep returning the plain list.
+PAGE_DEFAULT_LIMIT = 50
+PAGE_MAX_LIMIT = 500
+
+def wants_page():
+    return 'limit' in request.args or 'cursor' in request.args
+
+def page_limit(default=PAGE_DEFAULT_LIMIT, maximum=PAGE_MAX_LIMIT):
+    """Returns ?limit= clamped to maximum; raises ValueError when it is not a positive integer."""
+    raw = request.args.get('limit')
+    if raw is None:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, maximum)
+
+def encode_cursor(values):
+    """Packs a row's sort key into an opaque cursor token."""
+    payload = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values],
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def request_cursor(size):
+    """Decodes ?cursor= into a list of `size` values, or None on the first page."""
+    token = request.args.get('cursor')
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+def cursor_value(value, kind='text'):
+    """
+    Checks one decoded cursor value against the type of the column it is compared
+    with ('int', 'date', 'timestamp' or 'text') and returns it ready to bind.
+    Raises ValueError when a tampered token holds something else.
+    """
+    from datetime import date, datetime
+    if kind == 'int':
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    elif kind in ('date', 'timestamp') and isinstance(value, str):
+        try:
+            return date.fromisoformat(value) if kind == 'date' else datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    elif kind == 'text' and isinstance(value, str):
+        return value
+    raise ValueError("Invalid cursor")
+
+def paginate(rows, limit, key):
+    """Trims the look-ahead row fetched with LIMIT limit + 1; returns (rows, next_cursor)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+def page_number_args(default_per_page=25, max_per_page=250):
+    """
+    Returns (page, per_page) from ?page= and ?per_page= for screens that show page
+    numbers and a total, where an OFFSET page is what the user asks for.
+    """
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', default_per_page))
+    except ValueError:
+        raise ValueError("page and per_page must be integers")
+    if page < 1 or per_page < 1:
+        raise ValueError("page and per_page must be positive integers")
+    return page, min(per_page, max_per_page)
+
+def request_list_arg(name, allowed=None):
+    """Splits a comma separated query parameter, validating each value against `allowed`."""
+    raw = request.args.get(name)
+    if not raw:
+        return []
+    values = [v.strip() for v in raw.split(',') if v.strip()]
+    if allowed is not None:
+        invalid = [v for v in values if v not in allowed]
+        if invalid:
+            raise ValueError(f"Invalid {name}: {', '.join(invalid)}")
+    return values
+
 # --- Authentication & Authorization Decorators ---
+def _check_login_session():
+    """Returns an error or redirect response when the session is missing or expired, otherwise None."""
+    # Debug logging for session state
+    app.logger.debug("login_required check for %s - user_id in session: %s, path: %s", 
+                    request.endpoint, 'user_id' in session, request.path)
+    
+    if 'user_id' not in session:
+        app.logger.warning("Authentication required - no user_id in session for %s", request.path)
+        # Return JSON error for API endpoints
+        if request.path.startswith('/api/'):
+            return jsonify({'error': 'Authentication required'}), 401
+        return redirect(url_for('login', next=request.url))
+    
+    # Check if session has expired
+    from datetime import datetime, timedelta
+    if 'last_activity' in session:
+        try:
+            last_activity = datetime.fromisoformat(session['last_activity'])
+            session_timeout = app.config['PERMANENT_SESSION_LIFETIME']
+            
+            # Check if remember_me extends the session
+            if session.get('remember_me'):
+                remember_me_days = app.config.get('REMEMBER_ME_DAYS', 30)
+                session_timeout = 60 * 60 * 24 * remember_me_days  # Configurable remember me duration
+            
+            if datetime.now() - last_activity > timedelta(seconds=session_timeout):
+                app.logger.info("Session expired for user %s (last activity: %s)", 
+                               session.get('username', 'Unknown'), session['last_activity'])
+                session.clear()
+                if request.path.startswith('/api/'):
+                    return jsonify({'error': 'Session expired'}), 401
+                return redirect(url_for('login', next=request.url))
+        except (ValueError, TypeError) as e:
+            # If there's an issue with the datetime format, reset the timestamp
+            app.logger.debug("Invalid last_activity timestamp for user %s: %s", 
+                           session.get('username', 'Unknown'), e)
+            session['last_activity'] = datetime.now().isoformat()
+    else:
+        # First time accessing after login - set initial timestamp
+        session['last_activity'] = datetime.now().isoformat()
+    
+    # Update last activity timestamp for session renewal
+    session['last_activity'] = datetime.now().isoformat()
+    session.permanent = True
+    
+    return None
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Debug logging for session state
-        app.logger.debug("login_required check for %s - user_id in session: %s, path: %s", 
-                        request.endpoint, 'user_id' in session, request.path)
-        
-        if 'user_id' not in session:
-            app.logger.warning("Authentication required - no user_id in session for %s", request.path)
-            # Return JSON error for API endpoints
-            if request.path.startswith('/api/'):
-                return jsonify({'error': 'Authentication required'}), 401
-            return redirect(url_for('login', next=request.url))
-        
-        # Check if session has expired
-        from datetime import datetime, timedelta
-        if 'last_activity' in session:
-            try:
-                last_activity = datetime.fromisoformat(session['last_activity'])
-                session_timeout = app.config['PERMANENT_SESSION_LIFETIME']
-                
-                # Check if remember_me extends the session
-                if session.get('remember_me'):
-                    remember_me_days = app.config.get('REMEMBER_ME_DAYS', 30)
-                    session_timeout = 60 * 60 * 24 * remember_me_days  # Configurable remember me duration
-                
-                if datetime.now() - last_activity > timedelta(seconds=session_timeout):
-                    app.logger.info("Session expired for user %s (last activity: %s)", 
-                                   session.get('username', 'Unknown'), session['last_activity'])
-                    session.clear()
-                    if request.path.startswith('/api/'):
-                        return jsonify({'error': 'Session expired'}), 401
-                    return redirect(url_for('login', next=request.url))
-            except (ValueError, TypeError) as e:
-                # If there's an issue with the datetime format, reset the timestamp
-                app.logger.debug("Invalid last_activity timestamp for user %s: %s", 
-                               session.get('username', 'Unknown'), e)
-                session['last_activity'] = datetime.now().isoformat()
-        else:
-            # First time accessing after login - set initial timestamp
-            session['last_activity'] = datetime.now().isoformat()
-        
-        # Update last activity timestamp for session renewal
-        session['last_activity'] = datetime.now().isoformat()
-        session.permanent = True
-        
+        with phase_timer('auth'):
+            denied = _check_login_session()
+        if denied is not None:
+            return denied
         return f(*args, **kwargs)
     return decorated_function
 
@@ -380,7 +838,9 @@ def role_required(required_role):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if 'role' not in session or session['role'] != required_role:
+            with phase_timer('auth'):
+                allowed = session.get('role') == required_role
+            if not allowed:
                 return jsonify({"error": "Forbidden"}), 403
             return f(*args, **kwargs)
         return decorated_function
@@ -1120,6 +1580,375 @@ def provision_finalize():
         return jsonify({"error": "An error occurred during finalization.", "details": str(e)}), 500
 
 # --- CSV Import API Endpoint ---
+# The file is streamed into a temporary staging table with COPY FROM STDIN and
+# merged into the target with a single INSERT ... SELECT ... ON CONFLICT, so a
+# 100k-row inventory costs a handful of round trips instead of one per row.
+
+# Target table -> natural key used for ON CONFLICT
+BULK_IMPORT_KEYS = {
+    'phones': 'asset_tag',
+    'sim_cards': 'iccid',
+    'workers': 'worker_id',
+}
+# Columns managed by the database that a CSV may not set
+BULK_IMPORT_PROTECTED_COLUMNS = ('id', 'created_at', 'updated_at')
+BULK_COPY_BATCH_ROWS = 10000
+# Foreign keys an import may give by name: (table, column) -> (referenced table,
+# natural key). A value matching the natural key wins; plain digits are ids.
+IMPORT_REFERENCE_LOOKUPS = {
+    ('workers', 'secteur_id'): ('secteurs', 'secteur_name'),
+    ('phones', 'worker_id'): ('workers', 'worker_id'),
+    ('phones', 'sim_card_id'): ('sim_cards', 'iccid'),
+    ('phone_numbers', 'sim_card_id'): ('sim_cards', 'iccid'),
+    ('secteurs', 'manager_id'): ('users', 'username'),
+    ('users', 'role_id'): ('roles', 'role_name'),
+}
+# Format rules checked by dry runs, by column name
+IMPORT_FORMAT_RULES = {
+    'imei': r'^[0-9]{15}$',
+    'iccid': r'^[0-9]{18,22}$',
+}
+IMPORT_DRY_RUN_MAX_ROWS = 500
+
+def is_truthy(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+def table_column_types(cursor, table_name):
+    """Returns {column: SQL type} for the user-settable columns of a table."""
+    cursor.execute("""
+        SELECT attname, format_type(atttypid, atttypmod) AS column_type
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """, (table_name,))
+    return {
+        row['attname']: row['column_type'] for row in cursor.fetchall()
+        if row['attname'] not in BULK_IMPORT_PROTECTED_COLUMNS
+    }
+
+def import_column_rules(cursor, table_name):
+    """
+    Reads what a dry run validates from the catalog: type, varchar length,
+    NOT NULL without default, single-column uniqueness and the allowed values of
+    single-column CHECK (col IN (...)) constraints.
+    """
+    cursor.execute("""
+        SELECT a.attname,
+               format_type(a.atttypid, a.atttypmod) AS column_type,
+               a.atttypid IN ('text'::regtype, 'varchar'::regtype, 'bpchar'::regtype) AS is_text,
+               CASE WHEN a.atttypid = 'varchar'::regtype AND a.atttypmod > 0 THEN a.atttypmod - 4 END AS max_length,
+               a.attnotnull AND NOT a.atthasdef AS required,
+               EXISTS (
+                   SELECT 1 FROM pg_index i
+                   WHERE i.indrelid = a.attrelid AND i.indisunique AND i.indnatts = 1 AND i.indkey[0] = a.attnum
+               ) AS is_unique,
+               (SELECT pg_get_constraintdef(c.oid) FROM pg_constraint c
+                WHERE c.conrelid = a.attrelid AND c.contype = 'c' AND c.conkey = ARRAY[a.attnum]
+                LIMIT 1) AS check_def
+        FROM pg_attribute a
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+    """, (table_name,))
+    rules = {}
+    for row in cursor.fetchall():
+        if row['attname'] in BULK_IMPORT_PROTECTED_COLUMNS:
+            continue
+        allowed = None
+        if row['check_def'] and re.search(r"ANY \(+ARRAY\[", row['check_def']):
+            allowed = [v.replace("''", "'") for v in re.findall(r"'((?:[^']|'')*)'::", row['check_def'])]
+        rules[row['attname']] = {
+            'type': row['column_type'],
+            'is_text': row['is_text'],
+            'max_length': row['max_length'],
+            'required': row['required'],
+            'unique': row['is_unique'],
+            'allowed': allowed,
+        }
+    return rules
+
+def import_column_expr(target_table, column, column_type, text_sql):
+    """SQL converting a text value to the column's type, resolving lookups by name."""
+    lookup = IMPORT_REFERENCE_LOOKUPS.get((target_table, column))
+    if lookup:
+        ref_table, ref_key = lookup
+        return (
+            f"COALESCE((SELECT r.id FROM {ref_table} r WHERE r.{ref_key} = {text_sql}),"
+            f" CASE WHEN {text_sql} ~ '^[0-9]{{1,9}}$' THEN ({text_sql})::integer END)"
+        )
+    return f"({text_sql})::{column_type}"
+
+def create_import_staging(cursor, columns, staging_table='import_staging'):
+    """Creates a text staging table (dropped at commit) for the given columns."""
+    cursor.execute(f"""
+        CREATE TEMP TABLE {staging_table} (
+            line_no BIGINT NOT NULL,
+            {', '.join(f'{c} TEXT' for c in columns)}
+        ) ON COMMIT DROP
+    """)
+
+def copy_rows_to_staging(cursor, staging_table, columns, rows, first_row=1, batch_rows=BULK_COPY_BATCH_ROWS):
+    """
+    Streams an iterable of CSV rows into a staging table with COPY FROM STDIN,
+    one COPY per batch, numbering them in line_no from first_row. Blank lines
+    are dropped (but still numbered) and short or long rows are padded/truncated
+    to the header width. Returns the number of rows copied.
+    """
+    width = len(columns)
+    copy_sql = f"COPY {staging_table} (line_no, {', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    copied = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    pending = 0
+    for line_no, row in enumerate(rows, first_row):
+        if not any(field and field.strip() for field in row):
+            continue
+        if len(row) != width:
+            row = (list(row) + [''] * width)[:width]
+        writer.writerow([line_no, *row])
+        pending += 1
+        if pending >= batch_rows:
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+            copied += pending
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+        copied += pending
+    return copied
+
+def bulk_upsert_from_staging(cursor, target_table, key_column, column_types, staging_table):
+    """
+    Merges a text staging table into target_table in one statement, so one bad
+    value fails it all: callers filter it through reject_invalid_staging_rows
+    first. Blank cells never overwrite existing values, rows without a key are
+    rejected and, when a key appears several times in the file, the rows are
+    folded in file order (the last non-blank value of each column wins), as
+    sequential upserts would.
+    Existing rows the file would not change are skipped rather than rewritten.
+    Returns (inserted, updated, unchanged, rejected).
+    """
+    columns = list(column_types)
+    key_expr = f"NULLIF(btrim(s.{key_column}), '')"
+    casts = ', '.join(
+        import_column_expr(target_table, col, column_types[col], key_expr if col == key_column else
+            f"(array_agg(NULLIF(btrim(s.{col}), '') ORDER BY s.line_no DESC)"
+            f" FILTER (WHERE NULLIF(btrim(s.{col}), '') IS NOT NULL))[1]")
+        for col in columns
+    )
+    update_columns = [col for col in columns if col != key_column]
+    if update_columns:
+        merged_values = [f"COALESCE(EXCLUDED.{col}, {target_table}.{col})" for col in update_columns]
+        conflict = (
+            "DO UPDATE SET " + ', '.join(f"{col} = {value}" for col, value in zip(update_columns, merged_values))
+            # Only rows whose values actually change are updated
+            + f" WHERE ROW({', '.join(f'{target_table}.{col}' for col in update_columns)})"
+            f" IS DISTINCT FROM ROW({', '.join(merged_values)})"
+        )
+    else:
+        conflict = "DO NOTHING"
+    cursor.execute(f"""
+        WITH merged AS (
+            INSERT INTO {target_table} ({', '.join(columns)})
+            SELECT {casts}
+            FROM {staging_table} s
+            WHERE {key_expr} IS NOT NULL
+            GROUP BY {key_expr}
+            ON CONFLICT ({key_column}) {conflict}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT
+            (SELECT COUNT(*) FILTER (WHERE inserted) FROM merged) AS inserted,
+            (SELECT COUNT(*) FILTER (WHERE NOT inserted) FROM merged) AS updated,
+            (SELECT COUNT(DISTINCT {key_expr}) FROM {staging_table} s) AS keys,
+            (SELECT COUNT(*) FROM {staging_table} s WHERE {key_expr} IS NULL) AS rejected
+    """)
+    counts = cursor.fetchone()
+    unchanged = counts['keys'] - counts['inserted'] - counts['updated']
+    return counts['inserted'], counts['updated'], unchanged, counts['rejected']
+
+def import_issue_checks(target_table, columns, rules, key_column, keep_blank):
+    """
+    Builds the set-based validation of a staging table named import_staging:
+    returns (sql, params) for a query listing (line_no, column_name, code, value)
+    per issue found. Every code but 'duplicate_key' is an error the merge would
+    fail on.
+    """
+    def value(col, alias='s'):
+        return f"NULLIF(btrim({alias}.{col}), '')"
+
+    if key_column:
+        key = value(key_column)
+        key_type = rules[key_column]['type']
+        is_new = f"NOT EXISTS (SELECT 1 FROM {target_table} t WHERE t.{key_column} = ({key})::{key_type})"
+    else:
+        key = None
+        is_new = "TRUE"
+
+    checks = []
+    params = []
+
+    def check(col, code, condition, *condition_params, source="import_staging s"):
+        checks.append(
+            f"SELECT s.line_no, '{col}' AS column_name, '{code}' AS code, {value(col)} AS value"
+            f" FROM {source} WHERE {condition}"
+        )
+        params.extend(condition_params)
+
+    if key_column:
+        check(key_column, 'missing_key', f"{key} IS NULL")
+        checks.append(f"""
+            SELECT line_no, '{key_column}', 'duplicate_key', k FROM (
+                SELECT s.line_no, {key} AS k,
+                       row_number() OVER (PARTITION BY {key} ORDER BY s.line_no) AS occurrence
+                FROM import_staging s
+            ) d WHERE k IS NOT NULL AND occurrence > 1
+        """)
+
+    for col in columns:
+        rule = rules[col]
+        v = value(col)
+        lookup = IMPORT_REFERENCE_LOOKUPS.get((target_table, col))
+        if lookup:
+            ref_table, ref_key = lookup
+            check(col, 'unresolved_reference', f"""{v} IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM {ref_table} r WHERE r.{ref_key} = {v})
+                AND NOT ({v} ~ '^[0-9]{{1,9}}$' AND EXISTS (SELECT 1 FROM {ref_table} r WHERE r.id = ({v})::integer))""")
+        elif not rule['is_text']:
+            check(col, 'invalid_value', f"{v} IS NOT NULL AND NOT import_value_is_valid({v}, %s)", rule['type'])
+        if rule['max_length']:
+            check(col, 'too_long', f"char_length({v}) > %s", rule['max_length'])
+        if rule['allowed']:
+            check(col, 'not_allowed', f"{v} <> ALL(%s)", rule['allowed'])
+        if col in IMPORT_FORMAT_RULES:
+            check(col, 'bad_format', f"{v} !~ %s", IMPORT_FORMAT_RULES[col])
+        if rule['required'] and col != key_column:
+            if keep_blank and key:
+                # Blank cells are folded per key: only new keys with no value anywhere fail
+                check(col, 'required', f"""{v} IS NULL AND ({is_new}) AND NOT EXISTS (
+                    SELECT 1 FROM import_staging o WHERE {value(key_column, 'o')} = {key} AND {value(col, 'o')} IS NOT NULL)""")
+            else:
+                check(col, 'required', f"{v} IS NULL")
+        if rule['unique'] and col != key_column:
+            # Same value under another key in the file: every occurrence after the first
+            other_key = f"COALESCE({key}, s.line_no::text)" if key else "s.line_no::text"
+            check(col, 'duplicate_in_file', "s.line_no > d.first_line", source=f"""import_staging s JOIN (
+                    SELECT {v} AS v, MIN(s.line_no) AS first_line
+                    FROM import_staging s WHERE {v} IS NOT NULL
+                    GROUP BY {v} HAVING COUNT(DISTINCT {other_key}) > 1
+                ) d ON d.v = {v}""")
+            # Value already used by a different row in the database
+            match = f"t.{col} = {v}" if rule['is_text'] else f"t.{col}::text = {v}"
+            other_row = f" AND t.{key_column} IS DISTINCT FROM ({key})::{key_type}" if key else ""
+            check(col, 'conflicts_with_existing',
+                  f"{v} IS NOT NULL AND EXISTS (SELECT 1 FROM {target_table} t WHERE {match}{other_row})")
+
+    if not checks:
+        checks.append("SELECT NULL::bigint AS line_no, NULL::text AS column_name, NULL::text AS code, NULL::text AS value WHERE FALSE")
+    return ' UNION ALL '.join(checks), params
+
+def reject_invalid_staging_rows(cursor, target_table, columns, key_column):
+    """
+    Deletes the import_staging rows a dry run would report errors for, so a
+    set-based merge of the rest cannot fail on one bad value. Blank cells keep
+    existing values. Returns the rejected rows as {"row", "reason"}, in file order.
+    """
+    rules = import_column_rules(cursor, target_table)
+    issues, params = import_issue_checks(target_table, columns, rules, key_column, keep_blank=True)
+    rejections = []
+    # Removing a row can leave another row of its key without a required value
+    while True:
+        cursor.execute(f"""
+            WITH issues AS (
+                {issues}
+            ), errors AS (
+                SELECT line_no,
+                       string_agg(column_name || ': ' || code || COALESCE(' (' || value || ')', ''), ', '
+                                  ORDER BY column_name, code) AS reason
+                FROM issues
+                WHERE code <> 'duplicate_key'
+                GROUP BY line_no
+            )
+            DELETE FROM import_staging s USING errors e
+            WHERE s.line_no = e.line_no
+            RETURNING s.line_no, e.reason
+        """, params)
+        removed = cursor.fetchall()
+        if not removed:
+            break
+        rejections.extend({"row": r['line_no'], "reason": r['reason']} for r in removed)
+    return sorted(rejections, key=lambda r: r['row'])
+
+def dry_run_import(cursor, target_table, columns, rows, key_column, keep_blank):
+    """
+    Loads rows for the given target columns into a staging table and validates
+    them with set-based queries, without touching the target. key_column is the
+    merge key (None for plain inserts); keep_blank says whether blank cells keep
+    the existing value (bulk loader) or overwrite it (wizard). The caller rolls
+    back afterwards. Returns a report with the issues grouped per data row.
+    """
+    rules = import_column_rules(cursor, target_table)
+    create_import_staging(cursor, columns)
+    row_count = copy_rows_to_staging(cursor, 'import_staging', columns, rows)
+    cursor.execute("ANALYZE import_staging")
+
+    if key_column:
+        key = f"NULLIF(btrim(s.{key_column}), '')"
+        is_new = f"NOT EXISTS (SELECT 1 FROM {target_table} t WHERE t.{key_column} = ({key})::{rules[key_column]['type']})"
+    else:
+        key = None
+        is_new = "TRUE"
+    issues, params = import_issue_checks(target_table, columns, rules, key_column, keep_blank)
+    cursor.execute(f"""
+        WITH issues AS (
+            {issues}
+        ), per_row AS (
+            SELECT line_no,
+                   json_agg(json_build_object('column', column_name, 'code', code, 'value', value)
+                            ORDER BY column_name, code) AS issues,
+                   bool_or(code <> 'duplicate_key') AS has_error
+            FROM issues
+            GROUP BY line_no
+        )
+        SELECT line_no, issues, has_error,
+               COUNT(*) OVER () AS rows_with_issues,
+               COUNT(*) FILTER (WHERE has_error) OVER () AS rows_with_errors
+        FROM per_row
+        ORDER BY line_no
+        LIMIT %s
+    """, params + [IMPORT_DRY_RUN_MAX_ROWS])
+    issue_rows = cursor.fetchall()
+    rows_with_errors = issue_rows[0]['rows_with_errors'] if issue_rows else 0
+
+    if key_column:
+        cursor.execute(f"""
+            SELECT COUNT(DISTINCT {key}) FILTER (WHERE {is_new}) AS would_insert,
+                   COUNT(DISTINCT {key}) FILTER (WHERE NOT ({is_new})) AS would_update
+            FROM import_staging s WHERE {key} IS NOT NULL
+        """)
+        counts = cursor.fetchone()
+        would_insert, would_update = counts['would_insert'], counts['would_update']
+    else:
+        would_insert, would_update = row_count, 0
+
+    missing_columns = [
+        col for col, rule in rules.items() if rule['required'] and col not in columns
+    ] if would_insert else []
+
+    return {
+        "dry_run": True,
+        "target_table": target_table,
+        "rows": row_count,
+        "valid_rows": row_count - rows_with_errors,
+        "rows_with_errors": rows_with_errors,
+        "would_insert": would_insert,
+        "would_update": would_update,
+        "missing_required_columns": missing_columns,
+        "issues": [{"row": r['line_no'], "issues": r['issues']} for r in issue_rows],
+        "truncated": bool(issue_rows) and issue_rows[0]['rows_with_issues'] > len(issue_rows),
+    }
 
 @app.route('/api/admin/import_csv', methods=['POST'])
 @login_required
@@ -1143,103 +1972,76 @@ def import_csv():
     target_table = request.form.get('target_table')
     
     # Whitelist of allowed target tables
-    allowed_tables = ['phones', 'sim_cards', 'workers']
-    if target_table not in allowed_tables:
+    if target_table not in BULK_IMPORT_KEYS:
         app.logger.warning("CSV import attempt with invalid table '%s' by user %s", target_table, session.get('username'))
         return jsonify({"error": "Invalid target table"}), 400
+    key_column = BULK_IMPORT_KEYS[target_table]
     
-    app.logger.info("Starting CSV import for table '%s' from file '%s' by user %s", 
+    app.logger.info("Queueing CSV import for table '%s' from file '%s' by user %s", 
                    target_table, file.filename, session.get('username'))
     
+    # Spool the file to the upload staging store; the import runs as a background job
     try:
-        # Read file content as string
-        file_content = file.stream.read().decode("utf-8")
-        
-        # Parse CSV using DictReader
-        csv_reader = csv.DictReader(io.StringIO(file_content))
-        
-        # Connect to database
+        upload = stage_upload(file, session['user_id'])
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    try:
+        with open_upload(upload) as stream:
+            headers = [h.strip() for h in next(csv.reader(stream), [])]
+        cursor = get_db().cursor()
+        column_types = table_column_types(cursor, target_table)
+        cursor.close()
+    except (UnicodeDecodeError, csv.Error) as e:
+        delete_upload(upload['upload_id'])
+        return jsonify({"error": "The CSV file contains invalid data.", "details": str(e)}), 400
+    
+    unknown = [h for h in headers if h not in column_types]
+    if unknown:
+        error = f"Unknown columns for {target_table}: {', '.join(unknown)}"
+    elif key_column not in headers:
+        error = f"The '{key_column}' column is required for {target_table}."
+    elif len(set(headers)) != len(headers):
+        error = "Duplicate column names in CSV header."
+    else:
+        error = None
+    if error:
+        delete_upload(upload['upload_id'])
+        return jsonify({"error": error}), 400
+    
+    if is_truthy(request.form.get('dry_run')):
+        # Validate in a staging table and report, without touching the target
         db = get_db()
         cursor = db.cursor()
-        
-        # Begin transaction
-        row_count = 0
-        
-        # Process each row
-        for row in csv_reader:
-            # Filter out empty values and prepare data
-            clean_row = {k: v for k, v in row.items() if v is not None and v.strip() != ''}
-            
-            if not clean_row:
-                continue
-                
-            # Build upsert query based on target table
-            if target_table == 'phones':
-                # Primary unique key: asset_tag
-                columns = list(clean_row.keys())
-                placeholders = ', '.join(['%s'] * len(columns))
-                column_names = ', '.join(columns)
-                
-                # Build SET clause for ON CONFLICT DO UPDATE
-                set_clause = ', '.join([f"{col} = EXCLUDED.{col}" for col in columns if col != 'asset_tag'])
-                
-                upsert_query = f"""
-                    INSERT INTO phones ({column_names})
-                    VALUES ({placeholders})
-                    ON CONFLICT (asset_tag) DO UPDATE SET {set_clause}
-                """
-                
-            elif target_table == 'sim_cards':
-                # Primary unique key: iccid
-                columns = list(clean_row.keys())
-                placeholders = ', '.join(['%s'] * len(columns))
-                column_names = ', '.join(columns)
-                
-                # Build SET clause for ON CONFLICT DO UPDATE
-                set_clause = ', '.join([f"{col} = EXCLUDED.{col}" for col in columns if col != 'iccid'])
-                
-                upsert_query = f"""
-                    INSERT INTO sim_cards ({column_names})
-                    VALUES ({placeholders})
-                    ON CONFLICT (iccid) DO UPDATE SET {set_clause}
-                """
-                
-            elif target_table == 'workers':
-                # Primary unique key: worker_id
-                columns = list(clean_row.keys())
-                placeholders = ', '.join(['%s'] * len(columns))
-                column_names = ', '.join(columns)
-                
-                # Build SET clause for ON CONFLICT DO UPDATE
-                set_clause = ', '.join([f"{col} = EXCLUDED.{col}" for col in columns if col != 'worker_id'])
-                
-                upsert_query = f"""
-                    INSERT INTO workers ({column_names})
-                    VALUES ({placeholders})
-                    ON CONFLICT (worker_id) DO UPDATE SET {set_clause}
-                """
-            
-            # Execute upsert statement
-            cursor.execute(upsert_query, list(clean_row.values()))
-            row_count += 1
-        
-        # Commit transaction
-        db.commit()
-        cursor.close()
-        
-        app.logger.info("CSV import completed successfully: %d rows processed for table '%s' by user %s", 
-                       row_count, target_table, session.get('username'))
-        return jsonify({"message": f"Successfully processed {row_count} rows."}), 200
-        
-    except Exception as e:
-        # Rollback transaction on error
-        if 'db' in locals():
+        try:
+            with open_upload(upload) as stream:
+                reader = csv.reader(stream)
+                next(reader, None)
+                report = dry_run_import(cursor, target_table, headers, reader, key_column, keep_blank=True)
+        finally:
             db.rollback()
-        if 'cursor' in locals():
             cursor.close()
-        app.logger.error("CSV import failed for table '%s' by user %s: %s", 
-                        target_table, session.get('username'), e, exc_info=True)
-        return jsonify({"error": "An error occurred during CSV processing.", "details": str(e)}), 500
+            delete_upload(upload['upload_id'])
+        return jsonify(report)
+    
+    job = create_import_job('bulk', upload, target_table)
+    return jsonify(import_job_summary(job)), 202
+
+def bulk_import_chunk(cursor, target_table, headers, rows, first_row=1):
+    """
+    Loads one chunk of CSV rows through a fresh staging table (dropped at commit),
+    numbered from first_row, sets aside the rows that would fail and merges the
+    rest into target_table. Returns (inserted, updated, unchanged, rejections),
+    rejections being the {"row", "reason"} of the rows set aside.
+    """
+    column_types = table_column_types(cursor, target_table)
+    key_column = BULK_IMPORT_KEYS[target_table]
+    create_import_staging(cursor, headers)
+    copy_rows_to_staging(cursor, 'import_staging', headers, rows, first_row)
+    rejections = reject_invalid_staging_rows(cursor, target_table, headers, key_column)
+    inserted, updated, unchanged, _ = bulk_upsert_from_staging(
+        cursor, target_table, key_column, {h: column_types[h] for h in headers}, 'import_staging'
+    )
+    return inserted, updated, unchanged, rejections
 
 @app.route('/manager/dashboard')
 @login_required
@@ -1351,142 +2153,122 @@ def get_manager_team_status():
     
     return jsonify(team_status_list)
 
+# Output fields of /api/manager/team_by_sector and the joins each one needs
+TEAM_BY_SECTOR_FIELDS = {
+    'worker_db_id': ("w.id", ()),
+    'worker_id': ("w.worker_id", ()),
+    'full_name': ("w.full_name", ()),
+    'status': ("w.status", ()),
+    'secteur_id': ("w.secteur_id", ()),
+    'id_philia': ("rh.id_philia", ('rh',)),
+    'mdp_philia': ("rh.mdp_philia", ('rh',)),
+    'contract_type': ("rh.contract_type", ('rh',)),
+    'contract_end_date': ("rh.contract_end_date", ('rh',)),
+    'model': ("p.model", ('p',)),
+    'asset_tag': ("p.asset_tag", ('p',)),
+    'manufacturer': ("p.manufacturer", ('p',)),
+    'phone_number': ("pn.phone_number", ('pn',)),
+    'puk': ("sc.puk", ('sc',)),
+    'assignment_date': ("a.assignment_date", ('a',)),
+}
+
+TEAM_BY_SECTOR_JOINS = [
+    ('rh', "LEFT JOIN rh_data rh ON w.id = rh.worker_id", (), ()),
+    ('a', "LEFT JOIN assignments a ON w.id = a.worker_id AND a.return_date IS NULL", (), ()),
+    ('p', "LEFT JOIN phones p ON a.phone_id = p.id", ('a',), ()),
+    ('sc', "LEFT JOIN sim_cards sc ON a.sim_card_id = sc.id", ('a',), ()),
+    ('pn', "LEFT JOIN phone_numbers pn ON sc.id = pn.sim_card_id", ('sc',), ()),
+]
+
 @app.route('/api/manager/team_by_sector', methods=['GET'])
 @login_required
 @role_required('Manager')
 def get_team_by_sector():
     """
     Gets all workers and their asset details for a manager, structured by sector.
+    Supports ?fields= to return only some columns of each worker.
     """
+    try:
+        fields = requested_fields(TEAM_BY_SECTOR_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     manager_id = session.get('user_id')
     db = get_db()
-    cursor = db.cursor(cursor_factory=RealDictCursor)
+    cursor = db.cursor()
 
     # First, get the sectors managed by this manager
     cursor.execute("SELECT id, secteur_name FROM secteurs WHERE manager_id = %s ORDER BY secteur_name", (manager_id,))
     sectors = cursor.fetchall()
     
-    # Then, get all workers with their detailed info for those sectors
-    query = """
+    # Then, get all workers with the requested info for those sectors.
+    # secteur_id is always fetched for grouping and dropped afterwards if not requested.
+    select_fields = fields if 'secteur_id' in fields else fields + ['secteur_id']
+    select_sql, joins_sql, params = build_sparse_select(TEAM_BY_SECTOR_FIELDS, TEAM_BY_SECTOR_JOINS, select_fields)
+    query = f"""
         SELECT 
-            w.id as worker_db_id, w.worker_id, w.full_name, w.status, w.secteur_id,
-            rh.id_philia, rh.mdp_philia, rh.contract_type, rh.contract_end_date,
-            p.model, p.asset_tag, p.manufacturer,
-            pn.phone_number,
-            sc.puk,
-            a.assignment_date
+            {select_sql}
         FROM workers w
-        LEFT JOIN rh_data rh ON w.id = rh.worker_id
-        LEFT JOIN assignments a ON w.id = a.worker_id AND a.return_date IS NULL
-        LEFT JOIN phones p ON a.phone_id = p.id
-        LEFT JOIN sim_cards sc ON a.sim_card_id = sc.id
-        LEFT JOIN phone_numbers pn ON sc.id = pn.sim_card_id
+        {joins_sql}
         WHERE w.secteur_id IN (SELECT id FROM secteurs WHERE manager_id = %s)
         ORDER BY w.full_name;
     """
-    cursor.execute(query, (manager_id,))
+    cursor.execute(query, params + [manager_id])
     workers = cursor.fetchall()
     cursor.close()
 
-    # Process the data in Python to group workers by sector
-    sectors_list = []
-    for sector in sectors:
-        sector_dict = {
-            'id': sector['id'],
-            'secteur_name': sector['secteur_name']
-        }
-        sectors_list.append(sector_dict)
-    
-    workers_list = []
+    # Group workers by sector in Python
+    data_by_sector = {sector['secteur_name']: [] for sector in sectors}
+    sector_names = {sector['id']: sector['secteur_name'] for sector in sectors}
     for worker in workers:
-        worker_dict = {
-            'worker_db_id': worker['worker_db_id'],
-            'worker_id': worker['worker_id'],
-            'full_name': worker['full_name'],
-            'status': worker['status'],
-            'secteur_id': worker['secteur_id'],
-            'id_philia': worker['id_philia'],
-            'mdp_philia': worker['mdp_philia'],
-            'contract_type': worker['contract_type'],
-            'contract_end_date': worker['contract_end_date'],
-            'model': worker['model'],
-            'asset_tag': worker['asset_tag'],
-            'manufacturer': worker['manufacturer'],
-            'phone_number': worker['phone_number'],
-            'puk': worker['puk'],
-            'assignment_date': worker['assignment_date']
-        }
-        # Format dates for JSON
-        if worker_dict.get('contract_end_date'):
-            worker_dict['contract_end_date'] = worker_dict['contract_end_date'].isoformat()
-        if worker_dict.get('assignment_date'):
-            worker_dict['assignment_date'] = worker_dict['assignment_date'].isoformat()
-        workers_list.append(worker_dict)
-    
-    data_by_sector = {sector['secteur_name']: [] for sector in sectors_list}
-    for worker in workers_list:
-        for sector in sectors_list:
-            if worker['secteur_id'] == sector['id']:
-                data_by_sector[sector['secteur_name']].append(worker)
-                break
+        secteur_id = worker['secteur_id'] if 'secteur_id' in fields else worker.pop('secteur_id')
+        data_by_sector[sector_names[secteur_id]].append(worker)
                 
     return jsonify(data_by_sector)
 
-@app.route('/api/admin/all_workers_status', methods=['GET'])
-@login_required
-@role_required('Administrator')
-def get_admin_all_workers_status():
-    """
-    API endpoint to get the status of ALL workers and their assigned assets
-    for administrators (no sector limitation).
-    """
-    db = get_db()
-    cursor = db.cursor()
-    
-    # This query fetches ALL workers regardless of sector.
-    # It also gets details of their currently assigned phone, a count of any open tickets,
-    # and information about pending phone swaps, plus id_philia, mdp_philia, total tickets and total phones.
-    query = """
-        SELECT
-            w.id AS worker_db_id,
-            w.worker_id,
-            w.full_name AS worker_name,
-            w.status,
-            COALESCE(rh.contract_type, 'CDI') AS contract_type,
-            rh.contract_end_date,
-            rh.id_philia,
-            rh.mdp_philia,
-            s.secteur_name,
-            s.id AS secteur_id,
-            p.id AS phone_id,
-            p.asset_tag,
-            p.manufacturer,
-            p.model,
-            p.status AS phone_status,
-            pn.phone_number,
-            sc.carrier,
-            COALESCE(open_tickets.ticket_count, 0) AS open_ticket_count,
-            COALESCE(swap_info.pending_swaps, 0) AS pending_swaps,
-            swap_info.latest_swap_initiated,
-            swap_info.swap_ticket_id,
-            COALESCE(total_tickets.total_tickets, 0) AS total_tickets,
-            COALESCE(phone_history.total_phones, 0) AS total_phones
-        FROM workers w
-        LEFT JOIN assignments a ON w.id = a.worker_id AND a.return_date IS NULL
-        LEFT JOIN phones p ON a.phone_id = p.id
-        LEFT JOIN sim_cards sc ON a.sim_card_id = sc.id
-        LEFT JOIN phone_numbers pn ON sc.id = pn.sim_card_id
-        LEFT JOIN secteurs s ON w.secteur_id = s.id
-        LEFT JOIN rh_data rh ON w.id = rh.worker_id
-        LEFT JOIN (
+# Output fields of /api/admin/all_workers_status and the joins each one needs
+ADMIN_WORKER_STATUS_FIELDS = {
+    'worker_db_id': ("w.id", ()),
+    'worker_id': ("w.worker_id", ()),
+    'worker_name': ("w.full_name", ()),
+    'status': ("w.status", ()),
+    'contract_type': ("COALESCE(rh.contract_type, 'CDI')", ('rh',)),
+    'contract_end_date': ("rh.contract_end_date", ('rh',)),
+    'id_philia': ("rh.id_philia", ('rh',)),
+    'mdp_philia': ("rh.mdp_philia", ('rh',)),
+    'secteur_name': ("s.secteur_name", ('s',)),
+    'secteur_id': ("s.id", ('s',)),
+    'phone_id': ("p.id", ('p',)),
+    'asset_tag': ("p.asset_tag", ('p',)),
+    'manufacturer': ("p.manufacturer", ('p',)),
+    'model': ("p.model", ('p',)),
+    'phone_status': ("p.status", ('p',)),
+    'phone_number': ("pn.phone_number", ('pn',)),
+    'carrier': ("sc.carrier", ('sc',)),
+    'open_ticket_count': ("COALESCE(open_tickets.ticket_count, 0)", ('open_tickets',)),
+    'pending_swaps': ("COALESCE(swap_info.pending_swaps, 0)", ('swap_info',)),
+    'latest_swap_initiated': ("swap_info.latest_swap_initiated", ('swap_info',)),
+    'swap_ticket_id': ("swap_info.swap_ticket_id", ('swap_info',)),
+    'total_tickets': ("COALESCE(total_tickets.total_tickets, 0)", ('total_tickets',)),
+    'total_phones': ("COALESCE(phone_history.total_phones, 0)", ('phone_history',)),
+}
+
+ADMIN_WORKER_STATUS_JOINS = [
+    ('a', "LEFT JOIN assignments a ON w.id = a.worker_id AND a.return_date IS NULL", (), ()),
+    ('p', "LEFT JOIN phones p ON a.phone_id = p.id", ('a',), ()),
+    ('sc', "LEFT JOIN sim_cards sc ON a.sim_card_id = sc.id", ('a',), ()),
+    ('pn', "LEFT JOIN phone_numbers pn ON sc.id = pn.sim_card_id", ('sc',), ()),
+    ('s', "LEFT JOIN secteurs s ON w.secteur_id = s.id", (), ()),
+    ('rh', "LEFT JOIN rh_data rh ON w.id = rh.worker_id", (), ()),
+    ('open_tickets', """LEFT JOIN (
             SELECT 
                 t.phone_id,
                 COUNT(*) AS ticket_count
             FROM tickets t
             WHERE t.status NOT IN ('Solved', 'Closed')
             GROUP BY t.phone_id
-        ) open_tickets ON p.id = open_tickets.phone_id
-        LEFT JOIN (
+        ) open_tickets ON p.id = open_tickets.phone_id""", ('p',), ()),
+    ('swap_info', """LEFT JOIN (
             SELECT 
                 t.phone_id,
                 COUNT(*) AS pending_swaps,
@@ -1497,34 +2279,259 @@ def get_admin_all_workers_status():
             WHERE tu.update_text LIKE %s
             AND t.status NOT IN ('Solved', 'Closed')
             GROUP BY t.phone_id
-        ) swap_info ON p.id = swap_info.phone_id
-        LEFT JOIN (
+        ) swap_info ON p.id = swap_info.phone_id""", ('p',), ('%PHONE SWAP INITIATED%',)),
+    ('total_tickets', """LEFT JOIN (
             SELECT 
-                p2.id as phone_id,
-                COUNT(DISTINCT t2.id) AS total_tickets
-            FROM phones p2
-            LEFT JOIN tickets t2 ON p2.id = t2.phone_id
-            GROUP BY p2.id
-        ) total_tickets ON p.id = total_tickets.phone_id
-        LEFT JOIN (
+                t2.phone_id,
+                COUNT(*) AS total_tickets
+            FROM tickets t2
+            GROUP BY t2.phone_id
+        ) total_tickets ON p.id = total_tickets.phone_id""", ('p',), ()),
+    ('phone_history', """LEFT JOIN (
             SELECT 
                 a2.worker_id,
                 COUNT(*) AS total_phones
             FROM assignments a2
             GROUP BY a2.worker_id
-        ) phone_history ON w.id = phone_history.worker_id
-        ORDER BY s.secteur_name, w.full_name;
+        ) phone_history ON w.id = phone_history.worker_id""", (), ()),
+]
+
+WORKER_STATUSES = ('Active', 'Inactive', 'Arrêt', 'Congés')
+CONTRACT_TYPES = ('CDI', 'CDD', 'INTERIM')
+
+# Sort keys of the admin overview; a leading '-' sorts descending and w.id always breaks ties.
+# name, worker_id and status match an index on workers, so a page is read in index
+# order instead of sorting every filtered worker. sector (the default, by sector name)
+# and contract_end sort on joined tables, which no index backs: the filtered rows are sorted.
+ADMIN_WORKER_STATUS_SORTS = {
+    'sector': ("s.secteur_name", "w.full_name"),
+    'name': ("w.full_name",),
+    'worker_id': ("w.worker_id",),
+    'status': ("w.status", "w.full_name"),
+    'contract_end': ("rh.contract_end_date", "w.full_name"),
+}
+# Sort columns that can be NULL; descending sorts keep their NULLs last
+ADMIN_WORKER_NULLABLE_SORTS = {"rh.contract_end_date"}
+# Days ahead counted by the expiring CDD facet when ?expiring= is not set
+ADMIN_WORKER_EXPIRING_DAYS = 30
+
+def admin_worker_filters():
+    """
+    Returns {filter: (condition, params)} for the admin overview filters that are set:
+    ?sector= (secteur ids), ?status=, ?contract_type=, ?expiring=<days> (CDD ending
+    within that many days, already expired included) and ?q= (name or worker id).
+    Raises ValueError on invalid values.
+    """
+    filters = {}
+
+    sectors = request_list_arg('sector')
+    if sectors:
+        try:
+            sectors = [int(sector) for sector in sectors]
+        except ValueError:
+            raise ValueError("sector must be a list of sector ids")
+        filters['sector'] = ("w.secteur_id = ANY(%s)", [sectors])
+
+    statuses = request_list_arg('status', WORKER_STATUSES)
+    if statuses:
+        filters['status'] = ("w.status = ANY(%s)", [statuses])
+
+    contract_types = request_list_arg('contract_type', CONTRACT_TYPES)
+    if contract_types:
+        # Workers without HR data (or without a contract type) count as CDI; testing
+        # the column itself rather than a COALESCE lets idx_rh_data_contract serve it
+        if 'CDI' in contract_types:
+            filters['contract_type'] = ("(rh.contract_type = ANY(%s) OR rh.contract_type IS NULL)", [contract_types])
+        else:
+            filters['contract_type'] = ("rh.contract_type = ANY(%s)", [contract_types])
+
+    expiring = request.args.get('expiring')
+    if expiring:
+        filters['expiring'] = (EXPIRING_CDD_CONDITION, [admin_worker_expiring_days()])
+
+    search = request.args.get('q', '').strip()
+    if search:
+        # Served by the pg_trgm indexes on full_name and worker_id
+        pattern = f"%{search}%"
+        filters['q'] = ("(w.full_name ILIKE %s OR w.worker_id ILIKE %s)", [pattern, pattern])
+
+    return filters
+
+EXPIRING_CDD_CONDITION = "(rh.contract_type = 'CDD' AND rh.contract_end_date <= CURRENT_DATE + %s)"
+
+def admin_worker_expiring_days():
+    """?expiring= as a number of days, ADMIN_WORKER_EXPIRING_DAYS when absent."""
+    expiring = request.args.get('expiring')
+    if not expiring:
+        return ADMIN_WORKER_EXPIRING_DAYS
+    try:
+        return int(expiring)
+    except ValueError:
+        raise ValueError("expiring must be a number of days")
+
+def admin_worker_where(filters, exclude=None):
+    """Combines the filters, leaving out `exclude`, into (where_sql, params)."""
+    conditions = []
+    params = []
+    for name, (condition, condition_params) in filters.items():
+        if name != exclude:
+            conditions.append(condition)
+            params.extend(condition_params)
+    return ("WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+def admin_worker_order():
+    """ORDER BY clause for ?sort=; defaults to sector then name."""
+    sort = request.args.get('sort', 'sector')
+    descending = sort.startswith('-')
+    columns = ADMIN_WORKER_STATUS_SORTS.get(sort.lstrip('-'))
+    if columns is None:
+        raise ValueError(f"Invalid sort: {sort}. Use one of: {', '.join(ADMIN_WORKER_STATUS_SORTS)}")
+    if not descending:
+        return ", ".join(columns) + ", w.id"
+    # A plain DESC on NOT NULL columns is a backward scan of the ascending index
+    return ", ".join(
+        f"{column} DESC NULLS LAST" if column in ADMIN_WORKER_NULLABLE_SORTS else f"{column} DESC"
+        for column in columns
+    ) + ", w.id DESC"
+
+@app.route('/api/admin/all_workers_status', methods=['GET'])
+@login_required
+@role_required('Administrator')
+def get_admin_all_workers_status():
+    """
+    API endpoint to get the status of ALL workers and their assigned assets
+    for administrators (no sector limitation).
+    Supports ?fields= to return only some columns; joins and aggregations
+    that none of the requested fields need are left out of the query.
+    Filters and ?sort= are applied in SQL. With ?page= or ?per_page= only that
+    page is returned, as {items, total, page, per_page, facets}.
     """
+    try:
+        fields = requested_fields(ADMIN_WORKER_STATUS_FIELDS)
+        filters = admin_worker_filters()
+        expiring_days = admin_worker_expiring_days()
+        order_sql = admin_worker_order()
+        paged = 'page' in request.args or 'per_page' in request.args
+        if paged:
+            page, per_page = page_number_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db()
+    cursor = db.cursor()
+    where_sql, filter_params = admin_worker_where(filters)
+    
+    # This query fetches ALL workers regardless of sector.
+    # Depending on the requested fields it also gets details of their currently assigned
+    # phone, a count of any open tickets, information about pending phone swaps,
+    # plus id_philia, mdp_philia, total tickets and total phones.
+    # Sectors and HR data are always joined since filters and sort keys use them.
+    select_sql, joins_sql, params = build_sparse_select(
+        ADMIN_WORKER_STATUS_FIELDS, ADMIN_WORKER_STATUS_JOINS, fields, required_joins=('s', 'rh')
+    )
+    if paged:
+        # The visible page of worker ids is picked first, on workers, sectors and
+        # rh_data only; the asset and ticket details are then joined for those rows.
+        query = f"""
+            WITH page AS (
+                SELECT w.id
+                FROM workers w
+                LEFT JOIN secteurs s ON w.secteur_id = s.id
+                LEFT JOIN rh_data rh ON w.id = rh.worker_id
+                {where_sql}
+                ORDER BY {order_sql}
+                LIMIT %s OFFSET %s
+            )
+            SELECT
+                {select_sql}
+            FROM page
+            JOIN workers w ON w.id = page.id
+            {joins_sql}
+            ORDER BY {order_sql};
+        """
+        params = filter_params + [per_page, (page - 1) * per_page] + params
+    else:
+        query = f"""
+            SELECT
+                {select_sql}
+            FROM workers w
+            {joins_sql}
+            {where_sql}
+            ORDER BY {order_sql};
+        """
+        params = params + filter_params
     
-    cursor.execute(query, ('%PHONE SWAP INITIATED%',))
+    cursor.execute(query, params)
     all_workers_status = cursor.fetchall()
+    columns = cursor_columns(cursor)
+
+    if wants_columnar():
+        payload = to_columnar(all_workers_status, columns, dictionary_columns=(
+            'status', 'contract_type', 'secteur_name', 'manufacturer', 'model', 'phone_status', 'carrier'
+        ))
+    else:
+        payload = all_workers_status
+
+    if not paged:
+        cursor.close()
+        return jsonify(payload)
+
+    # Facet counts. Each facet leaves its own filter out, so picking a sector still
+    # shows how many workers the other sectors would give; the total and the
+    # expiring CDD count come from one pass that leaves out the expiring filter.
+    facet_from_sql = """
+        FROM workers w
+        LEFT JOIN secteurs s ON w.secteur_id = s.id
+        LEFT JOIN rh_data rh ON w.id = rh.worker_id
+    """
+    facets = {"sector": [], "status": {}, "contract_type": {}, "expiring_cdd": 0}
+    facet_where, facet_params = admin_worker_where(filters, exclude='sector')
+    cursor.execute(f"""
+        SELECT s.id AS secteur_id, s.secteur_name, COUNT(*) AS count
+        {facet_from_sql} {facet_where}
+        GROUP BY s.id, s.secteur_name
+        ORDER BY s.secteur_name;
+    """, facet_params)
+    facets["sector"] = [
+        {"id": row['secteur_id'], "name": row['secteur_name'], "count": row['count']}
+        for row in cursor.fetchall()
+    ]
+    facet_where, facet_params = admin_worker_where(filters, exclude='status')
+    cursor.execute(f"""
+        SELECT w.status, COUNT(*) AS count
+        {facet_from_sql} {facet_where}
+        GROUP BY w.status;
+    """, facet_params)
+    facets["status"] = {row['status']: row['count'] for row in cursor.fetchall()}
+    facet_where, facet_params = admin_worker_where(filters, exclude='contract_type')
+    cursor.execute(f"""
+        SELECT COALESCE(rh.contract_type, 'CDI') AS contract_type, COUNT(*) AS count
+        {facet_from_sql} {facet_where}
+        GROUP BY 1;
+    """, facet_params)
+    facets["contract_type"] = {row['contract_type']: row['count'] for row in cursor.fetchall()}
+    facet_where, facet_params = admin_worker_where(filters, exclude='expiring')
+    cursor.execute(f"""
+        SELECT COUNT(*) AS count,
+               COUNT(*) FILTER (WHERE {EXPIRING_CDD_CONDITION}) AS expiring_cdd
+        {facet_from_sql} {facet_where};
+    """, [expiring_days] + facet_params)
+    row = cursor.fetchone()
+    facets["expiring_cdd"] = row['expiring_cdd']
+    total = row['expiring_cdd'] if 'expiring' in filters else row['count']
     cursor.close()
-    
-    return jsonify(all_workers_status)
+
+    return jsonify({
+        "items": payload,
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "facets": facets,
+    })
 
 @app.route('/api/sectors', methods=['GET'])
 @login_required
-@role_required('Admin')
+@role_required('Administrator')
 def get_all_sectors():
     """
     Retourne une liste de tous les secteurs pour peupler les listes déroulantes.
@@ -1540,7 +2547,7 @@ def get_all_sectors():
 
 @app.route('/api/admin/worker/<int:worker_db_id>', methods=['PUT'])
 @login_required
-@role_required('Admin')
+@role_required('Administrator')
 def update_worker_details(worker_db_id):
     """
     Met à jour les informations complètes d'un travailleur.
@@ -1667,15 +2674,100 @@ def get_manager_selectable_phones():
     
     return jsonify(selectable_phones)
 
+# --- Ticket History Lists ---
+# Shared by the manager and support ticket history endpoints: status, priority,
+# assignee and search filters are applied in SQL, and pages are keyed on (created_at, id).
+TICKET_STATUSES = ('New', 'Open', 'Pending', 'On-Hold', 'Solved', 'Closed')
+TICKET_PRIORITIES = ('Low', 'Medium', 'High', 'Urgent')
+
+# Ticket history list; {where_sql} takes ticket_list_filters() conditions
+TICKET_HISTORY_QUERY = """
+        SELECT 
+            t.id AS ticket_id, t.title, t.status, t.priority, t.created_at, t.resolved_at,
+            p.asset_tag AS phone_asset_tag, reporter.full_name AS reported_by,
+            assignee.full_name AS assigned_to
+        FROM tickets t
+        JOIN phones p ON t.phone_id = p.id
+        JOIN users reporter ON t.reported_by_manager_id = reporter.id
+        LEFT JOIN users assignee ON t.assigned_to_support_id = assignee.id
+        {where_sql}
+        ORDER BY t.created_at DESC, t.id DESC
+        {limit_sql}
+"""
+
+def ticket_list_filters():
+    """
+    Returns (conditions, params) for ?status=, ?priority=, ?assignee=, ?q= and ?cursor=.
+    assignee is a support user id, 'me' or 'none' for unassigned tickets; q matches
+    the ticket number, title, status, priority or the reporter's or assignee's name.
+    Raises ValueError on invalid values.
+    """
+    conditions = []
+    params = []
+
+    statuses = request_list_arg('status', TICKET_STATUSES)
+    if statuses:
+        conditions.append("t.status = ANY(%s)")
+        params.append(statuses)
+
+    priorities = request_list_arg('priority', TICKET_PRIORITIES)
+    if priorities:
+        conditions.append("t.priority = ANY(%s)")
+        params.append(priorities)
+
+    assignee = request.args.get('assignee')
+    if assignee == 'none':
+        conditions.append("t.assigned_to_support_id IS NULL")
+    elif assignee:
+        if assignee == 'me':
+            assignee_id = session['user_id']
+        else:
+            try:
+                assignee_id = int(assignee)
+            except ValueError:
+                raise ValueError("assignee must be a user id, 'me' or 'none'")
+        conditions.append("t.assigned_to_support_id = %s")
+        params.append(assignee_id)
+
+    search = request.args.get('q', '').strip()
+    if search:
+        # Names are looked up by id so every ticket list can use it, whatever it joins
+        pattern = f"%{search}%"
+        conditions.append("""(t.id::text = %s OR t.title ILIKE %s OR t.status ILIKE %s OR t.priority ILIKE %s
+            OR EXISTS (SELECT 1 FROM users u
+                       WHERE u.id IN (t.reported_by_manager_id, t.assigned_to_support_id)
+                         AND u.full_name ILIKE %s))""")
+        params.extend([search.lstrip('#'), pattern, pattern, pattern, pattern])
+
+    cursor_values = request_cursor(2)
+    if cursor_values:
+        created_at, ticket_id = cursor_values
+        conditions.append("(t.created_at, t.id) < (%s, %s)")
+        params.extend([cursor_value(created_at, 'timestamp'), cursor_value(ticket_id, 'int')])
+
+    return conditions, params
+
 @app.route('/api/manager/tickets', methods=['GET'])
 @login_required
 @role_required('Manager')
 def get_manager_tickets():
-    """API endpoint to get all tickets submitted by the current manager."""
+    """
+    API endpoint to get all tickets submitted by the current manager.
+    With ?limit= or ?cursor= the tickets are returned one page at a time, along
+    with the per-status counts on the first page.
+    """
+    try:
+        conditions, params = ticket_list_filters()
+        limit = page_limit() if wants_page() else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     manager_id = session.get('user_id')
     db = get_db()
     cursor = db.cursor()
-    query = """
+    where_sql = " AND ".join(["t.reported_by_manager_id = %s"] + conditions)
+    limit_sql = "LIMIT %s" if limit else ""
+    query = f"""
         SELECT 
             t.id,
             t.title,
@@ -1690,22 +2782,30 @@ def get_manager_tickets():
         JOIN phones p ON t.phone_id = p.id
         LEFT JOIN assignments a ON p.id = a.phone_id AND a.return_date IS NULL
         LEFT JOIN workers w ON a.worker_id = w.id
-        WHERE t.reported_by_manager_id = %s
-        ORDER BY t.created_at DESC;
+        WHERE {where_sql}
+        ORDER BY t.created_at DESC, t.id DESC
+        {limit_sql};
     """
-    cursor.execute(query, (manager_id,))
+    cursor.execute(query, [manager_id] + params + ([limit + 1] if limit else []))
     tickets = cursor.fetchall()
+
+    if limit is None:
+        cursor.close()
+        return jsonify(tickets)
+
+    tickets, next_cursor = paginate(tickets, limit, lambda t: (t['created_at'], t['id']))
+    response = {"items": tickets, "next_cursor": next_cursor}
+    if 'cursor' not in request.args:
+        cursor.execute("""
+            SELECT status, COUNT(*) AS count
+            FROM tickets
+            WHERE reported_by_manager_id = %s
+            GROUP BY status;
+        """, (manager_id,))
+        response["status_counts"] = {row['status']: row['count'] for row in cursor.fetchall()}
     cursor.close()
     
-    # Convert to list of dicts and format dates
-    tickets_list = []
-    for ticket in tickets:
-        ticket_dict = dict(ticket)
-        if ticket_dict.get('created_at'):
-            ticket_dict['created_at'] = ticket_dict['created_at'].isoformat()
-        tickets_list.append(ticket_dict)
-            
-    return jsonify(tickets_list)
+    return jsonify(response)
 
 @app.route('/api/manager/ticket/<int:ticket_id>', methods=['GET'])
 @login_required
@@ -1739,7 +2839,7 @@ def get_manager_ticket_details(ticket_id):
         WHERE t.id = %s;
     """
     cursor.execute(ticket_query, (ticket_id,))
-    ticket_details = dict(cursor.fetchone())
+    ticket_details = cursor.fetchone()
 
     # Fetch ONLY public updates
     updates_query = """
@@ -1753,14 +2853,7 @@ def get_manager_ticket_details(ticket_id):
     ticket_updates = cursor.fetchall()
     cursor.close()
 
-    # Combine and format for JSON
-    ticket_details['updates'] = [dict(update) for update in ticket_updates]
-    for key, value in ticket_details.items():
-        if hasattr(value, 'isoformat'): 
-            ticket_details[key] = value.isoformat()
-    for update in ticket_details['updates']:
-        if hasattr(update['created_at'], 'isoformat'):
-            update['created_at'] = update['created_at'].isoformat()
+    ticket_details['updates'] = ticket_updates
             
     return jsonify(ticket_details)
 
@@ -1803,6 +2896,7 @@ def add_manager_comment(ticket_id):
         
         # Update the ticket's updated_at timestamp
         cursor.execute("UPDATE tickets SET updated_at = NOW() WHERE id = %s", (ticket_id,))
+        notify_ticket_event(cursor, 'update_added', ticket_id)
         
         db.commit()
         cursor.close()
@@ -1812,7 +2906,7 @@ def add_manager_comment(ticket_id):
         return jsonify({
             "message": "Comment added successfully.",
             "update_id": new_update['id'],
-            "created_at": new_update['created_at'].isoformat()
+            "created_at": new_update['created_at']
         }), 201
         
     except Exception as e:
@@ -1862,6 +2956,7 @@ def resolve_manager_ticket(ticket_id):
             INSERT INTO ticket_updates (ticket_id, update_author_id, update_text, is_internal_note)
             VALUES (%s, %s, %s, FALSE)
         """, (ticket_id, manager_id, resolution_text))
+        notify_ticket_event(cursor, 'ticket_updated', ticket_id)
         
         db.commit()
         cursor.close()
@@ -1876,6 +2971,463 @@ def resolve_manager_ticket(ticket_id):
         app.logger.error("Error resolving ticket %s by manager: %s", ticket_id, e, exc_info=True)
         return jsonify({"error": "An error occurred while resolving the ticket."}), 500
 
+# --- Inventory Lists ---
+# GET /api/phones, /api/sims, /api/phone-numbers and /api/workers share one list
+# implementation driven by a spec dict: ?sort= (a key of 'sorts', '-' prefix for
+# descending), ?q= (ILIKE over 'search' columns) and ?status=. With ?limit= or
+# ?cursor= they return {items, next_cursor, total, total_is_estimate}, paging on
+# (sort value, id). Totals come from the planner's row estimate for the filtered
+# query; an exact COUNT(*) is only run when that estimate is small or when the
+# client asks for ?count=exact.
+LIST_EXACT_COUNT_THRESHOLD = 10000
+
+def list_sort(spec):
+    """Returns (sort_name, sql_expression, descending) for ?sort=."""
+    sort = request.args.get('sort', spec['default_sort'])
+    name = sort.lstrip('-')
+    if name not in spec['sorts']:
+        raise ValueError(f"Invalid sort: {sort}. Use one of: {', '.join(spec['sorts'])}")
+    return name, spec['sorts'][name], sort.startswith('-')
+
+def list_filters(spec):
+    """Returns (conditions, params) for the spec's base conditions, ?status= and ?q=."""
+    conditions = list(spec.get('where', ()))
+    params = []
+    statuses = request_list_arg('status', spec.get('statuses'))
+    if statuses:
+        conditions.append(f"{spec['status_column']} = ANY(%s)")
+        params.append(statuses)
+    search = request.args.get('q', '').strip()
+    if search:
+        conditions.append("(" + " OR ".join(f"{column} ILIKE %s" for column in spec['search']) + ")")
+        params.extend([f"%{search}%"] * len(spec['search']))
+    return conditions, params
+
+def estimate_row_count(cursor, from_sql, where_sql, params):
+    """The planner's estimate of how many rows a filtered query returns, without running it."""
+    cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {from_sql} {where_sql}", params)
+    plan = cursor.fetchone()['QUERY PLAN']
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def list_response(spec):
+    """Runs the list query described by `spec` and returns the JSON response."""
+    try:
+        sort_name, sort_sql, descending = list_sort(spec)
+        conditions, params = list_filters(spec)
+        paged = wants_page()
+        if paged:
+            limit = page_limit()
+            cursor_values = request_cursor(3)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    id_sql = spec['id']
+    direction = " DESC" if descending else ""
+    filter_conditions, filter_params = list(conditions), list(params)
+    if paged and cursor_values:
+        try:
+            if cursor_values[0] != sort_name:
+                raise ValueError("Invalid cursor")
+            after = [cursor_value(cursor_values[1], spec.get('sort_types', {}).get(sort_name, 'text')),
+                     cursor_value(cursor_values[2], 'int')]
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        conditions.append(f"({sort_sql}, {id_sql}) {'<' if descending else '>'} (%s, %s)")
+        params.extend(after)
+
+    where_sql = "WHERE " + " AND ".join(conditions) if conditions else ""
+    query = f"""
+        SELECT {spec['select']}, {sort_sql} AS _sort_key
+        FROM {spec['from']}
+        {where_sql}
+        ORDER BY {sort_sql}{direction}, {id_sql}{direction}
+        {"LIMIT %s" if paged else ""}
+    """
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute(query, params + ([limit + 1] if paged else []))
+    except psycopg2.DataError:
+        # A tampered cursor whose sort value does not fit the sort column's type
+        db.rollback()
+        cursor.close()
+        return jsonify({"error": "Invalid cursor"}), 400
+    rows = cursor.fetchall()
+    columns = [column for column in cursor_columns(cursor) if column != '_sort_key']
+
+    next_cursor = None
+    if paged:
+        rows, next_cursor = paginate(rows, limit, lambda row: (sort_name, row['_sort_key'], row['id']))
+    for row in rows:
+        del row['_sort_key']
+
+    if wants_columnar():
+        payload = to_columnar(rows, columns, dictionary_columns=spec.get('dictionary_columns', ()))
+    else:
+        payload = rows
+    if not paged:
+        cursor.close()
+        return jsonify(payload)
+
+    # Totals cover the filtered list, not what is left after the cursor
+    filter_where_sql = "WHERE " + " AND ".join(filter_conditions) if filter_conditions else ""
+    total = estimate_row_count(cursor, spec['from'], filter_where_sql, filter_params)
+    total_is_estimate = True
+    if request.args.get('count') == 'exact' or total < LIST_EXACT_COUNT_THRESHOLD:
+        cursor.execute(f"SELECT COUNT(*) AS total FROM {spec['from']} {filter_where_sql}", filter_params)
+        total = cursor.fetchone()['total']
+        total_is_estimate = False
+    cursor.close()
+
+    return jsonify({
+        "items": payload,
+        "next_cursor": next_cursor,
+        "total": total,
+        "total_is_estimate": total_is_estimate,
+    })
+
+PHONE_LIST = {
+    'select': "p.*",
+    'from': "phones p",
+    'where': ("p.status != 'Retired'",),
+    'id': "p.id",
+    'sorts': {
+        'id': "p.id",
+        'asset_tag': "p.asset_tag",
+        'imei': "p.imei",
+        'serial_number': "p.serial_number",
+        'manufacturer': "COALESCE(p.manufacturer, '')",
+        'model': "COALESCE(p.model, '')",
+        'status': "p.status",
+        'warranty_end_date': "COALESCE(p.warranty_end_date, DATE '9999-12-31')",
+    },
+    # Sorts that are not on text columns, for checking cursor values
+    'sort_types': {'id': 'int', 'warranty_end_date': 'date'},
+    'default_sort': 'id',
+    'search': ("p.asset_tag", "p.imei", "p.serial_number", "p.manufacturer", "p.model"),
+    'status_column': "p.status",
+    'statuses': ('In Stock', 'In Use', 'In Repair', 'Disponible pour enlèvement', 'Préparation SI terminée'),
+}
+
+SIM_LIST = {
+    'select': "s.*, pn.phone_number",
+    'from': "sim_cards s LEFT JOIN phone_numbers pn ON s.id = pn.sim_card_id",
+    'where': ("s.status != 'Deactivated'",),
+    'id': "s.id",
+    'sorts': {
+        'id': "s.id",
+        'iccid': "s.iccid",
+        'carrier': "COALESCE(s.carrier, '')",
+        'status': "s.status",
+        'phone_number': "COALESCE(pn.phone_number, '')",
+    },
+    'sort_types': {'id': 'int'},
+    'default_sort': 'id',
+    'search': ("s.iccid", "s.carrier", "pn.phone_number"),
+    'status_column': "s.status",
+    'statuses': ('In Stock', 'In Use'),
+}
+
+PHONE_NUMBER_LIST = {
+    'select': """
+            pn.id,
+            pn.phone_number,
+            pn.status,
+            s.id as sim_id,
+            s.iccid,
+            s.carrier,
+            CASE 
+                WHEN a.id IS NOT NULL THEN 'Assigned'
+                WHEN s.status = 'In Stock' THEN 'Available'
+                ELSE 'Unassigned'
+            END as assignment_status,
+            w.full_name as assigned_to_worker""",
+    'from': """phone_numbers pn
+        LEFT JOIN sim_cards s ON pn.sim_card_id = s.id
+        LEFT JOIN assignments a ON s.id = a.sim_card_id AND a.return_date IS NULL
+        LEFT JOIN workers w ON a.worker_id = w.id""",
+    'id': "pn.id",
+    'sorts': {
+        'phone_number': "pn.phone_number",
+        'status': "pn.status",
+        'carrier': "COALESCE(s.carrier, '')",
+        'iccid': "COALESCE(s.iccid, '')",
+    },
+    'default_sort': 'phone_number',
+    'search': ("pn.phone_number", "s.iccid", "s.carrier", "w.full_name"),
+    'status_column': "pn.status",
+    'statuses': ('Active', 'Inactive', 'Porting'),
+    'dictionary_columns': ('status', 'carrier', 'assignment_status'),
+}
+
+WORKER_LIST = {
+    'select': "w.id, w.worker_id, w.full_name, w.status, s.secteur_name",
+    'from': "workers w JOIN secteurs s ON w.secteur_id = s.id",
+    'id': "w.id",
+    'sorts': {
+        'full_name': "w.full_name",
+        'worker_id': "w.worker_id",
+        'secteur_name': "s.secteur_name",
+    },
+    'default_sort': 'full_name',
+    'search': ("w.full_name", "w.worker_id", "s.secteur_name"),
+    'status_column': "w.status",
+    'statuses': WORKER_STATUSES,
+}
+
+# --- Delta Sync ---
+# Triggers on workers, phones, assignments and tickets append every change to
+# change_log, stamped with the writing transaction id (xid8). A sync token is the
+# xmin of the snapshot the changes were read in: every transaction below it had
+# finished, so the next call asks for txid >= token and misses nothing still in
+# flight. Rows may occasionally be sent twice; clients apply them as upserts.
+app.config['SYNC_RETENTION_HOURS'] = int(os.environ.get('SYNC_RETENTION_HOURS', 72))
+app.config['SYNC_MAX_CHANGES'] = 5000
+SYNC_TABLES = ('workers', 'phones', 'assignments', 'tickets')
+SYNC_ROLE_TABLES = {
+    'Administrator': SYNC_TABLES,
+    'Support': SYNC_TABLES,
+    'Manager': SYNC_TABLES,
+    'Integration Manager': ('phones',),
+}
+SYNC_PRUNE_INTERVAL = 600
+_last_change_log_prune = 0
+
+def prune_change_log(cursor):
+    """Deletes change_log rows past retention and moves the token horizon forward."""
+    cursor.execute("""
+        WITH pruned AS (
+            DELETE FROM change_log
+            WHERE changed_at < now() - make_interval(hours => %s)
+            RETURNING txid
+        )
+        INSERT INTO change_log_horizon (max_pruned_txid)
+        SELECT MAX(txid) FROM pruned HAVING COUNT(*) > 0
+        ON CONFLICT (id) DO UPDATE
+            SET max_pruned_txid = GREATEST(change_log_horizon.max_pruned_txid, EXCLUDED.max_pruned_txid);
+    """, (app.config['SYNC_RETENTION_HOURS'],))
+
+def maybe_prune_change_log(db):
+    """Prunes the change log at most once per SYNC_PRUNE_INTERVAL in each worker process."""
+    global _last_change_log_prune
+    if time.time() - _last_change_log_prune < SYNC_PRUNE_INTERVAL:
+        return
+    _last_change_log_prune = time.time()
+    cursor = db.cursor()
+    try:
+        prune_change_log(cursor)
+        db.commit()
+    except psycopg2.Error as e:
+        db.rollback()
+        app.logger.warning("Change log pruning failed: %s", e)
+    finally:
+        cursor.close()
+
+def manager_sync_scope(manager_id):
+    """SQL condition and params restricting change_log rows to what a manager can see."""
+    sectors_sql = "SELECT id FROM secteurs WHERE manager_id = %s"
+    condition = f"""(
+        (cl.table_name = 'tickets' AND (cl.row_data->>'reported_by_manager_id')::int = %s)
+        OR (cl.table_name = 'workers' AND (
+            (cl.row_data->>'secteur_id')::int IN ({sectors_sql})
+            OR (cl.old_data->>'secteur_id')::int IN ({sectors_sql})))
+        OR (cl.table_name = 'assignments' AND (cl.row_data->>'worker_id')::int IN (
+            SELECT id FROM workers WHERE secteur_id IN ({sectors_sql})))
+        OR (cl.table_name = 'phones' AND cl.row_id IN (
+            SELECT a.phone_id FROM assignments a
+            JOIN workers w ON a.worker_id = w.id
+            WHERE a.return_date IS NULL AND w.secteur_id IN ({sectors_sql})))
+    )"""
+    return condition, [manager_id] * 5
+
+@app.route('/api/sync/changes', methods=['GET'])
+@login_required
+def get_sync_changes():
+    """
+    Change feed for dashboards. Without ?since= only a token is returned: fetch it
+    before the initial full load, then poll with ?since=<token> (and optionally
+    ?tables=) to receive rows inserted or updated and ids deleted since then, one
+    entry per row with its latest state. Answers 410 when the token is older than
+    the retention window or too much changed; the client should then reload fully.
+    """
+    role = session.get('role')
+    allowed_tables = SYNC_ROLE_TABLES.get(role, ())
+    try:
+        tables = request_list_arg('tables', allowed_tables) or list(allowed_tables)
+        since = request.args.get('since')
+        if since is not None and not since.isdigit():
+            raise ValueError("Invalid sync token")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db()
+    maybe_prune_change_log(db)
+    cursor = db.cursor()
+    cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS token")
+    next_token = cursor.fetchone()['token']
+    if since is None or not tables:
+        cursor.close()
+        return jsonify({"next_token": next_token, "changes": {}})
+
+    cursor.execute("SELECT max_pruned_txid::text AS horizon FROM change_log_horizon")
+    horizon = cursor.fetchone()
+    if horizon and int(since) <= int(horizon['horizon']):
+        cursor.close()
+        return jsonify({"error": "Sync token expired, reload the full data", "next_token": next_token}), 410
+
+    conditions = ["cl.txid >= %s::xid8", "cl.table_name = ANY(%s)"]
+    params = [since, list(tables)]
+    if role == 'Manager':
+        scope_sql, scope_params = manager_sync_scope(session['user_id'])
+        conditions.append(scope_sql)
+        params.extend(scope_params)
+    max_changes = app.config['SYNC_MAX_CHANGES']
+    cursor.execute(f"""
+        SELECT DISTINCT ON (cl.table_name, cl.row_id)
+            cl.table_name, cl.row_id, cl.op, cl.row_data
+        FROM change_log cl
+        WHERE {" AND ".join(conditions)}
+        ORDER BY cl.table_name, cl.row_id, cl.id DESC
+        LIMIT %s;
+    """, params + [max_changes + 1])
+    rows = cursor.fetchall()
+    if len(rows) > max_changes:
+        cursor.close()
+        return jsonify({"error": "Too many changes, reload the full data", "next_token": next_token}), 410
+
+    # Workers moved to a sector the manager does not run are sent as deletions
+    manager_sectors = None
+    if role == 'Manager':
+        cursor.execute("SELECT id FROM secteurs WHERE manager_id = %s", (session['user_id'],))
+        manager_sectors = {sector['id'] for sector in cursor.fetchall()}
+    cursor.close()
+
+    changes = {table: {"upserted": [], "deleted": []} for table in tables}
+    for row in rows:
+        table_changes = changes[row['table_name']]
+        moved_out = (row['table_name'] == 'workers' and manager_sectors is not None
+                     and row['row_data'].get('secteur_id') not in manager_sectors)
+        if row['op'] == 'D' or moved_out:
+            table_changes["deleted"].append(row['row_id'])
+        else:
+            table_changes["upserted"].append(row['row_data'])
+
+    return jsonify({"next_token": next_token, "changes": changes})
+
+# --- Background Threads ---
+_background_threads = {}
+_background_threads_lock = threading.Lock()
+
+def ensure_background_thread(name, target):
+    """
+    Starts `target` in a daemon thread once per process. Gunicorn's --preload forks
+    the workers after the app is imported, so a thread started before the fork only
+    exists in the master; the pid check starts a fresh one in each worker.
+    """
+    with _background_threads_lock:
+        pid, thread = _background_threads.get(name, (None, None))
+        if pid == os.getpid() and thread.is_alive():
+            return thread
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        _background_threads[name] = (os.getpid(), thread)
+        return thread
+
+# --- Real-time Ticket Events ---
+# Ticket changes are pushed to browsers over Socket.IO. Views publish with
+# pg_notify() inside their transaction, so an event only goes out once the change
+# is committed. Every gunicorn worker runs a LISTEN thread that re-emits the
+# notifications to its own Socket.IO clients: support users are in the 'support'
+# room, managers in 'manager:<user id>' and only receive events on their tickets.
+# Clients connect with the websocket transport only, so a connection stays on one
+# worker without sticky sessions; they fall back to polling while disconnected.
+# With gthread workers each open websocket holds one of the worker's threads for
+# as long as the tab stays open. SOCKETIO_MAX_CONNECTIONS caps the websockets of
+# a worker and must stay below gunicorn's --threads (GUNICORN_THREADS in
+# docker-compose.yml), so the difference is always left for HTTP requests; tabs
+# refused above the cap keep polling.
+socketio = SocketIO(app, async_mode='threading', transports=['websocket'])
+SOCKETIO_MAX_CONNECTIONS = int(os.environ.get('SOCKETIO_MAX_CONNECTIONS', 150))
+_socket_connections = 0
+_socket_connections_lock = threading.Lock()
+TICKET_EVENTS_CHANNEL = 'ticket_events'
+
+def notify_ticket_event(cursor, event, ticket_id, internal=False):
+    """Queues a ticket event for delivery when the current transaction commits."""
+    cursor.execute("""
+        SELECT pg_notify(%s, json_build_object(
+            'event', %s,
+            'ticket_id', t.id,
+            'manager_id', t.reported_by_manager_id,
+            'status', t.status,
+            'priority', t.priority,
+            'internal', %s
+        )::text)
+        FROM tickets t
+        WHERE t.id = %s;
+    """, (TICKET_EVENTS_CHANNEL, event, internal, ticket_id))
+
+def broadcast_ticket_event(event):
+    socketio.emit('ticket_event', event, to='support')
+    # Internal notes are never shown to managers
+    if not event.get('internal'):
+        socketio.emit('ticket_event', event, to=f"manager:{event['manager_id']}")
+
+def listen_for_ticket_events():
+    """Relays NOTIFY payloads to this process's Socket.IO clients, reconnecting after errors."""
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+            conn.autocommit = True
+            listen_cursor = conn.cursor()
+            listen_cursor.execute(f"LISTEN {TICKET_EVENTS_CHANNEL};")
+            listen_cursor.close()
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    broadcast_ticket_event(json.loads(conn.notifies.pop(0).payload))
+        except (psycopg2.Error, OSError, ValueError) as e:
+            app.logger.warning("Ticket event listener stopped (%s), reconnecting in 5s", e)
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                conn.close()
+
+@socketio.on('connect')
+def handle_socket_connect(auth=None):
+    """Accepts Support and Manager sessions and subscribes them to their room."""
+    # Same missing/expired session check as login_required, so an expired tab
+    # cannot keep receiving ticket events
+    global _socket_connections
+    if _check_login_session() is not None:
+        return False
+    user_id = session.get('user_id')
+    role = session.get('role')
+    if role not in ('Support', 'Manager') or not user_id:
+        return False
+    with _socket_connections_lock:
+        if _socket_connections >= SOCKETIO_MAX_CONNECTIONS:
+            app.logger.warning("Socket.IO connection refused: %s open on this worker", _socket_connections)
+            return False
+        _socket_connections += 1
+    if role == 'Support':
+        join_room('support')
+    else:
+        join_room(f"manager:{user_id}")
+    ensure_background_thread('ticket-events-listener', listen_for_ticket_events)
+
+@socketio.on('disconnect')
+def handle_socket_disconnect(*args):
+    """Frees the connection slot taken in handle_socket_connect."""
+    global _socket_connections
+    with _socket_connections_lock:
+        _socket_connections = max(_socket_connections - 1, 0)
+
 # --- API Endpoints ---
 
 # PHONES
@@ -1883,13 +3435,10 @@ def resolve_manager_ticket(ticket_id):
 @login_required
 @role_required('Administrator')
 def handle_phones():
+    if request.method == 'GET':
+        return list_response(PHONE_LIST)
     db = get_db()
     cursor = db.cursor()
-    if request.method == 'GET':
-        cursor.execute("SELECT * FROM phones WHERE status != 'Retired' ORDER BY id")
-        items = cursor.fetchall()
-        cursor.close()
-        return jsonify(items)
     if request.method == 'POST':
         data = request.get_json()
         try:
@@ -1940,13 +3489,10 @@ def handle_phone(item_id):
 @login_required
 @role_required('Administrator')
 def handle_sims():
+    if request.method == 'GET':
+        return list_response(SIM_LIST)
     db = get_db()
     cursor = db.cursor()
-    if request.method == 'GET':
-        cursor.execute("SELECT s.*, pn.phone_number FROM sim_cards s LEFT JOIN phone_numbers pn ON s.id = pn.sim_card_id WHERE s.status != 'Deactivated' ORDER BY s.id")
-        items = cursor.fetchall()
-        cursor.close()
-        return jsonify(items)
     if request.method == 'POST':
         data = request.get_json()
         try:
@@ -2008,29 +3554,8 @@ def handle_phone_numbers():
     cursor = db.cursor()
     
     if request.method == 'GET':
-        cursor.execute("""
-            SELECT 
-                pn.id,
-                pn.phone_number,
-                pn.status,
-                s.id as sim_id,
-                s.iccid,
-                s.carrier,
-                CASE 
-                    WHEN a.id IS NOT NULL THEN 'Assigned'
-                    WHEN s.status = 'In Stock' THEN 'Available'
-                    ELSE 'Unassigned'
-                END as assignment_status,
-                w.full_name as assigned_to_worker
-            FROM phone_numbers pn
-            LEFT JOIN sim_cards s ON pn.sim_card_id = s.id
-            LEFT JOIN assignments a ON s.id = a.sim_card_id AND a.return_date IS NULL
-            LEFT JOIN workers w ON a.worker_id = w.id
-            ORDER BY pn.phone_number
-        """)
-        phone_numbers = cursor.fetchall()
         cursor.close()
-        return jsonify(phone_numbers)
+        return list_response(PHONE_NUMBER_LIST)
     
     elif request.method == 'POST':
         data = request.get_json()
@@ -2168,19 +3693,12 @@ def get_secteurs():
 @login_required
 @role_required('Administrator')
 def get_workers():
-    """API endpoint to get a list of all active workers with their sector name."""
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("""
-        SELECT w.id, w.worker_id, w.full_name, w.status, s.secteur_name
-        FROM workers w
-        JOIN secteurs s ON w.secteur_id = s.id
-        WHERE w.status = 'Active'
-        ORDER BY w.full_name
-    """)
-    workers = cursor.fetchall()
-    cursor.close()
-    return jsonify(workers)
+    """
+    API endpoint to get a list of workers with their sector name.
+    Only active workers are listed unless ?status= asks for others.
+    """
+    spec = WORKER_LIST if 'status' in request.args else dict(WORKER_LIST, where=("w.status = 'Active'",))
+    return list_response(spec)
 
 @app.route('/api/workers', methods=['POST'])
 @login_required
@@ -2292,10 +3810,6 @@ def get_all_active_tickets():
     cursor.execute(query)
     tickets = cursor.fetchall()
     cursor.close()
-    
-    # Convert datetime objects to string format for JSON serialization
-    for ticket in tickets:
-        ticket['created_at'] = ticket['created_at'].isoformat()
         
     return jsonify(tickets)
 
@@ -2365,6 +3879,7 @@ def create_ticket():
         ))
         
         ticket_id = cursor.fetchone()['id']
+        notify_ticket_event(cursor, 'ticket_created', ticket_id)
         db.commit()
         cursor.close()
         
@@ -2409,6 +3924,42 @@ def admin_reports():
 
 # --- New API Endpoints for a Single Ticket ---
 
+# Output fields of /api/support/ticket/<id> and the joins each one needs.
+# 'updates' is not a column: it is loaded by a second query only when requested.
+SUPPORT_TICKET_FIELDS = {
+    'id': ("t.id", ()),
+    'title': ("t.title", ()),
+    'description': ("t.description", ()),
+    'phone_id': ("t.phone_id", ()),
+    'reported_by_manager_id': ("t.reported_by_manager_id", ()),
+    'assigned_to_support_id': ("t.assigned_to_support_id", ()),
+    'status': ("t.status", ()),
+    'priority': ("t.priority", ()),
+    'created_at': ("t.created_at", ()),
+    'updated_at': ("t.updated_at", ()),
+    'resolved_at': ("t.resolved_at", ()),
+    'asset_tag': ("p.asset_tag", ('p',)),
+    'manufacturer': ("p.manufacturer", ('p',)),
+    'model': ("p.model", ('p',)),
+    'serial_number': ("p.serial_number", ('p',)),
+    'worker_id': ("w.id", ('w',)),
+    'worker_name': ("w.full_name", ('w',)),
+    'reported_by': ("reporter.full_name", ('reporter',)),
+    'reporter_email': ("reporter.email", ('reporter',)),
+    'assigned_to': ("assignee.full_name", ('assignee',)),
+    'updates': (None, ()),
+}
+
+# phones and reporter are inner joins on NOT NULL foreign keys, so leaving them out
+# never changes which ticket is found.
+SUPPORT_TICKET_JOINS = [
+    ('p', "JOIN phones p ON t.phone_id = p.id", (), ()),
+    ('reporter', "JOIN users reporter ON t.reported_by_manager_id = reporter.id", (), ()),
+    ('assignee', "LEFT JOIN users assignee ON t.assigned_to_support_id = assignee.id", (), ()),
+    ('a', "LEFT JOIN assignments a ON t.phone_id = a.phone_id AND a.return_date IS NULL", (), ()),
+    ('w', "LEFT JOIN workers w ON a.worker_id = w.id", ('a',), ()),
+]
+
 @app.route('/api/support/ticket/<int:ticket_id>', methods=['GET'])
 @login_required
 @role_required('Support')
@@ -2417,60 +3968,54 @@ def get_ticket_details(ticket_id):
     """
     API endpoint to get all details for a single ticket, including phone,
     worker, and all historical updates.
+    Supports ?fields= to return only some of them.
     """
+    try:
+        fields = requested_fields(SUPPORT_TICKET_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     db = get_db()
     cursor = db.cursor()
     
-    # Main ticket details query
-    ticket_query = """
+    # Main ticket details query; t.id is always selected so a missing ticket is detected
+    column_fields = [f for f in fields if f != 'updates'] or ['id']
+    select_sql, joins_sql, params = build_sparse_select(SUPPORT_TICKET_FIELDS, SUPPORT_TICKET_JOINS, column_fields)
+    ticket_query = f"""
         SELECT 
-            t.*,
-            p.asset_tag, p.manufacturer, p.model, p.serial_number,
-            w.id AS worker_id,
-            w.full_name AS worker_name,
-            reporter.full_name AS reported_by,
-            reporter.email AS reporter_email,
-            assignee.full_name AS assigned_to
+            {select_sql}
         FROM tickets t
-        JOIN phones p ON t.phone_id = p.id
-        JOIN users reporter ON t.reported_by_manager_id = reporter.id
-        LEFT JOIN users assignee ON t.assigned_to_support_id = assignee.id
-        LEFT JOIN assignments a ON t.phone_id = a.phone_id AND a.return_date IS NULL
-        LEFT JOIN workers w ON a.worker_id = w.id
+        {joins_sql}
         WHERE t.id = %s;
     """
-    cursor.execute(ticket_query, (ticket_id,))
+    cursor.execute(ticket_query, params + [ticket_id])
     ticket_details = cursor.fetchone()
 
     if not ticket_details:
         cursor.close()
         return jsonify({"error": "Ticket not found"}), 404
 
-    # Updates query
-    updates_query = """
-        SELECT
-            tu.id,
-            tu.update_text,
-            tu.created_at,
-            tu.is_internal_note,
-            u.full_name AS author_name
-        FROM ticket_updates tu
-        JOIN users u ON tu.update_author_id = u.id
-        WHERE tu.ticket_id = %s
-        ORDER BY tu.created_at ASC;
-    """
-    cursor.execute(updates_query, (ticket_id,))
-    ticket_updates = cursor.fetchall()
+    if 'id' not in fields:
+        ticket_details.pop('id', None)
+
+    if 'updates' in fields:
+        # Updates query
+        updates_query = """
+            SELECT
+                tu.id,
+                tu.update_text,
+                tu.created_at,
+                tu.is_internal_note,
+                u.full_name AS author_name
+            FROM ticket_updates tu
+            JOIN users u ON tu.update_author_id = u.id
+            WHERE tu.ticket_id = %s
+            ORDER BY tu.created_at ASC;
+        """
+        cursor.execute(updates_query, (ticket_id,))
+        ticket_details['updates'] = cursor.fetchall()
     
     cursor.close()
-
-    # Combine results and format dates for JSON
-    ticket_details['updates'] = [dict(update) for update in ticket_updates]
-    for key, value in ticket_details.items():
-        if hasattr(value, 'isoformat'):
-            ticket_details[key] = value.isoformat()
-    for update in ticket_details['updates']:
-        update['created_at'] = update['created_at'].isoformat()
             
     return jsonify(ticket_details)
 
@@ -2507,9 +4052,13 @@ def update_ticket_properties(ticket_id):
 
     # Build the SET part of the SQL query dynamically
     set_clause = ", ".join([f"{key} = %s" for key in update_data.keys()])
+    values = list(update_data.values())
+    # Stamp the resolution time on the first move to Solved/Closed, clear it on reopening
+    if 'status' in update_data:
+        set_clause += ", resolved_at = CASE WHEN %s IN ('Solved', 'Closed') THEN COALESCE(resolved_at, NOW()) END"
+        values.append(update_data['status'])
     # Always update the updated_at timestamp
     set_clause += ", updated_at = NOW()"
-    values = list(update_data.values())
     values.append(ticket_id)
 
     db = get_db()
@@ -2527,6 +4076,7 @@ def update_ticket_properties(ticket_id):
         # Log this action
         log_details = f"Ticket properties updated: {', '.join(update_data.keys())}"
         log_event(cursor, 'Ticket', ticket_id, 'Properties Updated', log_details)
+        notify_ticket_event(cursor, 'ticket_updated', ticket_id)
         
         db.commit()
         cursor.close()
@@ -2563,6 +4113,7 @@ def add_ticket_update(ticket_id):
             "INSERT INTO ticket_updates (ticket_id, update_author_id, update_text, is_internal_note) VALUES (%s, %s, %s, %s) RETURNING id;",
             (ticket_id, user_id, update_text, is_internal)
         )
+        notify_ticket_event(cursor, 'update_added', ticket_id, internal=bool(is_internal))
         db.commit()
         cursor.close()
         return jsonify({"message": "Update added successfully."}), 201
@@ -2595,17 +4146,7 @@ def get_support_users():
 
 # --- API Endpoint for Admin Reports ---
 
-@app.route('/api/reports/assignment_overview', methods=['GET'])
-@login_required
-@role_required('Administrator')
-def get_assignment_overview():
-    """
-    Provides a comprehensive overview of all current assignments, joining
-    workers, phones, SIMs, and phone numbers.
-    """
-    db = get_db()
-    cursor = db.cursor()
-    query = """
+ASSIGNMENT_OVERVIEW_QUERY = """
         SELECT 
             a.id AS assignment_id,
             w.full_name AS worker_name,
@@ -2624,63 +4165,51 @@ def get_assignment_overview():
         JOIN sim_cards sc ON a.sim_card_id = sc.id
         LEFT JOIN phone_numbers pn ON sc.id = pn.sim_card_id
         WHERE a.return_date IS NULL
-        ORDER BY s.secteur_name, w.full_name;
+        ORDER BY s.secteur_name, w.full_name
+"""
+
+@app.route('/api/reports/assignment_overview', methods=['GET'])
+@login_required
+@role_required('Administrator')
+def get_assignment_overview():
     """
-    cursor.execute(query)
+    Provides a comprehensive overview of all current assignments, joining
+    workers, phones, SIMs, and phone numbers.
+    """
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute(ASSIGNMENT_OVERVIEW_QUERY)
     report_data = cursor.fetchall()
+    columns = cursor_columns(cursor)
     cursor.close()
-    
-    # Format dates for JSON
-    for row in report_data:
-        if row.get('assignment_date'):
-            row['assignment_date'] = row['assignment_date'].isoformat()
             
+    if wants_columnar():
+        return jsonify(to_columnar(report_data, columns, dictionary_columns=(
+            'secteur_name', 'manufacturer', 'model'
+        )))
     return jsonify(report_data)
 
 # --- Enhanced Reports for Data Integrity ---
 
-@app.route('/api/reports/missing_data', methods=['GET'])
-@login_required
-@role_required('Administrator')
-def get_missing_data_report():
-    """
-    Comprehensive report to identify missing or incomplete data across the system.
-    """
-    db = get_db()
-    cursor = db.cursor()
-    
-    report = {
-        "sim_cards_without_phone_numbers": [],
-        "phone_numbers_without_sim_cards": [],
-        "sim_cards_without_assignments": [],
-        "phones_without_assignments": [],
-        "workers_without_assignments": [],
-        "incomplete_phone_records": [],
-        "incomplete_sim_records": [],
-        "incomplete_worker_records": []
-    }
-    
+# Missing-data report category -> query listing its records
+MISSING_DATA_QUERIES = {
     # SIM cards without phone numbers
-    cursor.execute("""
+    "sim_cards_without_phone_numbers": """
         SELECT s.id, s.iccid, s.carrier, s.status
         FROM sim_cards s
         LEFT JOIN phone_numbers pn ON s.id = pn.sim_card_id
         WHERE pn.id IS NULL AND s.status != 'Deactivated'
         ORDER BY s.iccid
-    """)
-    report["sim_cards_without_phone_numbers"] = cursor.fetchall()
-    
+    """,
     # Phone numbers without SIM cards
-    cursor.execute("""
+    "phone_numbers_without_sim_cards": """
         SELECT pn.id, pn.phone_number, pn.status
         FROM phone_numbers pn
         WHERE pn.sim_card_id IS NULL AND pn.status = 'Active'
         ORDER BY pn.phone_number
-    """)
-    report["phone_numbers_without_sim_cards"] = cursor.fetchall()
-    
+    """,
     # SIM cards without current assignments (available for deployment)
-    cursor.execute("""
+    "sim_cards_without_assignments": """
         SELECT s.id, s.iccid, s.carrier, pn.phone_number
         FROM sim_cards s
         LEFT JOIN phone_numbers pn ON s.id = pn.sim_card_id
@@ -2689,11 +4218,9 @@ def get_missing_data_report():
             SELECT sim_card_id FROM assignments WHERE return_date IS NULL
         )
         ORDER BY s.carrier, pn.phone_number
-    """)
-    report["sim_cards_without_assignments"] = cursor.fetchall()
-    
+    """,
     # Phones without current assignments (available for deployment)
-    cursor.execute("""
+    "phones_without_assignments": """
         SELECT p.id, p.asset_tag, p.manufacturer, p.model, p.status
         FROM phones p
         WHERE p.status = 'In Stock'
@@ -2701,11 +4228,9 @@ def get_missing_data_report():
             SELECT phone_id FROM assignments WHERE return_date IS NULL
         )
         ORDER BY p.asset_tag
-    """)
-    report["phones_without_assignments"] = cursor.fetchall()
-    
+    """,
     # Workers without current assignments (available for new assignments)
-    cursor.execute("""
+    "workers_without_assignments": """
         SELECT w.id, w.worker_id, w.full_name, s.secteur_name
         FROM workers w
         JOIN secteurs s ON w.secteur_id = s.id
@@ -2714,11 +4239,9 @@ def get_missing_data_report():
             SELECT worker_id FROM assignments WHERE return_date IS NULL
         )
         ORDER BY w.full_name
-    """)
-    report["workers_without_assignments"] = cursor.fetchall()
-    
+    """,
     # Incomplete phone records (missing key information)
-    cursor.execute("""
+    "incomplete_phone_records": """
         SELECT id, asset_tag, manufacturer, model, imei, serial_number, purchase_date, warranty_end_date
         FROM phones
         WHERE status != 'Retired' AND (
@@ -2730,11 +4253,9 @@ def get_missing_data_report():
             warranty_end_date IS NULL
         )
         ORDER BY asset_tag
-    """)
-    report["incomplete_phone_records"] = cursor.fetchall()
-    
+    """,
     # Incomplete SIM records (missing key information)
-    cursor.execute("""
+    "incomplete_sim_records": """
         SELECT s.id, s.iccid, s.carrier, s.plan_details, pn.phone_number
         FROM sim_cards s
         LEFT JOIN phone_numbers pn ON s.id = pn.sim_card_id
@@ -2743,11 +4264,9 @@ def get_missing_data_report():
             s.plan_details IS NULL OR s.plan_details = ''
         )
         ORDER BY s.iccid
-    """)
-    report["incomplete_sim_records"] = cursor.fetchall()
-    
+    """,
     # Incomplete worker records (missing key information)
-    cursor.execute("""
+    "incomplete_worker_records": """
         SELECT w.id, w.worker_id, w.full_name, s.secteur_name
         FROM workers w
         JOIN secteurs s ON w.secteur_id = s.id
@@ -2756,34 +4275,34 @@ def get_missing_data_report():
             w.secteur_id IS NULL
         )
         ORDER BY w.worker_id
-    """)
-    report["incomplete_worker_records"] = cursor.fetchall()
-    
-    cursor.close()
-    
-    # Format dates for JSON
-    for category in report.values():
-        for item in category:
-            for key, value in item.items():
-                if hasattr(value, 'isoformat'):
-                    item[key] = value.isoformat()
-    
-    return jsonify(report)
+    """,
+}
 
-@app.route('/api/reports/inventory_summary', methods=['GET'])
+@app.route('/api/reports/missing_data', methods=['GET'])
 @login_required
 @role_required('Administrator')
-def get_inventory_summary():
+def get_missing_data_report():
     """
-    Provides a comprehensive inventory summary with counts and availability.
+    Comprehensive report to identify missing or incomplete data across the system.
     """
     db = get_db()
     cursor = db.cursor()
+    report = build_missing_data_report(cursor)
+    cursor.close()
     
-    summary = {}
-    
+    return jsonify(report)
+
+def build_missing_data_report(cursor):
+    report = {}
+    for category, query in MISSING_DATA_QUERIES.items():
+        cursor.execute(query)
+        report[category] = cursor.fetchall()
+    return report
+
+# Inventory summary section -> aggregate query
+INVENTORY_SUMMARY_QUERIES = {
     # Phone inventory summary
-    cursor.execute("""
+    "phones_by_status": """
         SELECT 
             status,
             COUNT(*) as count,
@@ -2795,11 +4314,9 @@ def get_inventory_summary():
         WHERE status != 'Retired'
         GROUP BY status
         ORDER BY status
-    """)
-    summary["phones_by_status"] = cursor.fetchall()
-    
+    """,
     # SIM card inventory summary
-    cursor.execute("""
+    "sim_cards_by_status": """
         SELECT 
             s.status,
             COUNT(*) as count,
@@ -2811,11 +4328,9 @@ def get_inventory_summary():
         WHERE s.status != 'Deactivated'
         GROUP BY s.status
         ORDER BY s.status
-    """)
-    summary["sim_cards_by_status"] = cursor.fetchall()
-    
+    """,
     # Worker summary
-    cursor.execute("""
+    "workers_by_status": """
         SELECT 
             w.status,
             COUNT(*) as count,
@@ -2825,11 +4340,9 @@ def get_inventory_summary():
         LEFT JOIN assignments a ON w.id = a.worker_id AND a.return_date IS NULL
         GROUP BY w.status
         ORDER BY w.status
-    """)
-    summary["workers_by_status"] = cursor.fetchall()
-    
+    """,
     # Phone numbers summary
-    cursor.execute("""
+    "phone_numbers_by_status": """
         SELECT 
             pn.status,
             COUNT(*) as count,
@@ -2839,12 +4352,29 @@ def get_inventory_summary():
         LEFT JOIN sim_cards s ON pn.sim_card_id = s.id
         GROUP BY pn.status
         ORDER BY pn.status
-    """)
-    summary["phone_numbers_by_status"] = cursor.fetchall()
-    
+    """,
+}
+
+@app.route('/api/reports/inventory_summary', methods=['GET'])
+@login_required
+@role_required('Administrator')
+def get_inventory_summary():
+    """
+    Provides a comprehensive inventory summary with counts and availability.
+    """
+    db = get_db()
+    cursor = db.cursor()
+    summary = build_inventory_summary(cursor)
     cursor.close()
     return jsonify(summary)
 
+def build_inventory_summary(cursor):
+    summary = {}
+    for section, query in INVENTORY_SUMMARY_QUERIES.items():
+        cursor.execute(query)
+        summary[section] = cursor.fetchall()
+    return summary
+
 # --- API Endpoints for Admin Dashboard Widgets ---
 
 @app.route('/api/reports/summary_stats', methods=['GET'])
@@ -2877,7 +4407,11 @@ def get_dashboard_charts():
     """Provides chart data for interactive dashboard visualizations."""
     db = get_db()
     cursor = db.cursor()
-    
+    chart_data = build_dashboard_charts(cursor)
+    cursor.close()
+    return jsonify(chart_data)
+
+def build_dashboard_charts(cursor):
     chart_data = {}
     
     # Chart 1: Phones by Status
@@ -2945,14 +4479,15 @@ def get_dashboard_charts():
         "backgroundColors": ['#6366F1', '#8B5CF6', '#EC4899', '#F59E0B', '#10B981', '#06B6D4']
     }
     
-    # Chart 5: Assignment Trends (Last 6 months)
+    # Chart 5: Assignment Trends (Last 6 months), from the daily rollups
     cursor.execute("""
         SELECT 
-            DATE_TRUNC('month', assignment_date) as month,
-            COUNT(*) as assignments
-        FROM assignments
-        WHERE assignment_date >= CURRENT_DATE - INTERVAL '6 months'
-        GROUP BY DATE_TRUNC('month', assignment_date)
+            DATE_TRUNC('month', day) as month,
+            SUM(assignments_created)::int as assignments
+        FROM daily_sector_rollups
+        WHERE day >= CURRENT_DATE - INTERVAL '6 months'
+        GROUP BY DATE_TRUNC('month', day)
+        HAVING SUM(assignments_created) > 0
         ORDER BY month
     """)
     assignment_trend_data = cursor.fetchall()
@@ -2963,13 +4498,13 @@ def get_dashboard_charts():
         "backgroundColor": 'rgba(59, 130, 246, 0.1)'
     }
     
-    # Chart 6: Ticket Resolution Time (Average days by priority)
+    # Chart 6: Ticket Resolution Time (Average days by priority), from ticket_metrics
     cursor.execute("""
         SELECT 
             priority,
-            AVG(EXTRACT(epoch FROM (resolved_at - created_at))/86400) as avg_days
-        FROM tickets
-        WHERE resolved_at IS NOT NULL
+            AVG(resolution_seconds)/86400 as avg_days
+        FROM ticket_metrics
+        WHERE resolution_seconds IS NOT NULL
         GROUP BY priority
         ORDER BY CASE priority
             WHEN 'Urgent' THEN 1
@@ -2985,8 +4520,7 @@ def get_dashboard_charts():
         "backgroundColors": ['#DC2626', '#EA580C', '#D97706', '#65A30D']
     }
     
-    cursor.close()
-    return jsonify(chart_data)
+    return chart_data
 
 @app.route('/api/reports/worker_assignments', methods=['GET'])
 @login_required
@@ -3035,251 +4569,1126 @@ def get_worker_assignments():
         
     return jsonify(result)
 
-@app.route('/api/reports/asset_lifecycle/<identifier>', methods=['GET'])
+# --- CSV Report Exports ---
+# Report downloads stream straight out of Postgres: COPY (query) TO STDOUT runs
+# on a dedicated connection in a background thread and hands ~64 KB chunks to
+# the response through a bounded queue, so a full-fleet export uses constant
+# memory and the database only runs ahead of the client by a few chunks.
+CSV_EXPORT_CHUNK_BYTES = 64 * 1024
+CSV_EXPORT_QUEUE_CHUNKS = 16
+# How long the first chunk may take before the export gives up with a 504
+CSV_EXPORT_FIRST_CHUNK_SECONDS = int(os.environ.get('CSV_EXPORT_FIRST_CHUNK_SECONDS', 60))
+
+WORKER_ASSIGNMENTS_EXPORT_QUERY = """
+        SELECT w.worker_id, w.full_name, s.secteur_name,
+               p.asset_tag AS phone_asset_tag, p.model AS phone_model,
+               sc.iccid AS sim_iccid, pn.phone_number
+        FROM workers w
+        JOIN secteurs s ON w.secteur_id = s.id
+        LEFT JOIN assignments a ON a.worker_id = w.id AND a.return_date IS NULL
+        LEFT JOIN phones p ON a.phone_id = p.id
+        LEFT JOIN sim_cards sc ON a.sim_card_id = sc.id
+        LEFT JOIN phone_numbers pn ON sc.id = pn.sim_card_id
+        WHERE w.status = 'Active'
+        ORDER BY w.full_name
+"""
+
+# Report -> query, or {section: query} for reports exported one section at a time
+CSV_EXPORT_REPORTS = {
+    'assignment_overview': ASSIGNMENT_OVERVIEW_QUERY,
+    'worker_assignments': WORKER_ASSIGNMENTS_EXPORT_QUERY,
+    'ticket_history': TICKET_HISTORY_QUERY,
+    'missing_data': MISSING_DATA_QUERIES,
+    'inventory_summary': INVENTORY_SUMMARY_QUERIES,
+}
+
+class CopyChunkWriter:
+    """File-like target for copy_expert that batches COPY rows into queue chunks."""
+
+    def __init__(self, chunks, stopped):
+        self.chunks = chunks
+        self.stopped = stopped
+        self.buffer = []
+        self.size = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= CSV_EXPORT_CHUNK_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.put(b''.join(self.buffer))
+            self.buffer = []
+            self.size = 0
+
+    def put(self, item):
+        # Blocks while the client is slow; gives up once it has gone away
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+        raise ConnectionAbortedError("CSV export client disconnected")
+
+def copy_csv_response(query, params, filename):
+    """
+    Streams COPY (query) TO STDOUT as a CSV download. SQL errors surface as a
+    JSON 500 since the first chunk is awaited before the response starts, and a
+    first chunk slower than CSV_EXPORT_FIRST_CHUNK_SECONDS as a 504. The producer
+    stops when the response is closed, whether or not it was ever iterated.
+    """
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    chunks = queue.Queue(maxsize=CSV_EXPORT_QUEUE_CHUNKS)
+    stopped = threading.Event()
+    writer = CopyChunkWriter(chunks, stopped)
+
+    def produce():
+        try:
+            with conn.cursor() as cursor:
+                copy_sql = cursor.mogrify(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", params)
+                cursor.copy_expert(copy_sql, writer)
+            writer.flush()
+            writer.put(None)
+        except ConnectionAbortedError:
+            pass
+        except Exception as e:
+            if not stopped.is_set():
+                app.logger.error("CSV export %s failed: %s", filename, e)
+                try:
+                    writer.put(e)
+                except ConnectionAbortedError:
+                    pass
+        finally:
+            conn.close()
+
+    threading.Thread(target=produce, name=f'csv-export-{filename}', daemon=True).start()
+    try:
+        first = chunks.get(timeout=CSV_EXPORT_FIRST_CHUNK_SECONDS)
+    except queue.Empty:
+        stopped.set()
+        # Interrupts the COPY so the producer releases its connection
+        try:
+            conn.cancel()
+        except psycopg2.Error:
+            pass
+        app.logger.warning("CSV export %s timed out before its first chunk", filename)
+        return jsonify({"error": "Export timed out."}), 504
+    if isinstance(first, Exception):
+        return jsonify({"error": "Export failed.", "details": str(first)}), 500
+
+    def generate():
+        # BOM so spreadsheet apps read the export as UTF-8
+        yield codecs.BOM_UTF8
+        item = first
+        while item is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            item = chunks.get()
+
+    response = app.response_class(generate(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store',
+    })
+    # Also runs when the client leaves before the body is iterated
+    response.call_on_close(stopped.set)
+    return response
+
+@app.route('/api/reports/export/<report>.csv', methods=['GET'])
+@app.route('/api/reports/export/<report>/<section>.csv', methods=['GET'])
 @login_required
 @role_required('Administrator')
-def get_asset_lifecycle(identifier):
+def export_report_csv(report, section=None):
     """
-    Get complete lifecycle history for a phone by asset tag or serial number.
-    This provides a chronological timeline of all events for auditing and tracking.
+    CSV download of a report. missing_data and inventory_summary are exported
+    per category/section; ticket_history accepts the ticket list filters.
     """
-    db = get_db()
-    cursor = db.cursor()
-    
-    # First, find the phone by asset tag or serial number
-    try:
-        cursor.execute("""
-            SELECT id, asset_tag, serial_number, imei, manufacturer, model, status, 
-                   purchase_date, warranty_end_date, notes, created_at, updated_at
-            FROM phones 
-            WHERE asset_tag = %s OR serial_number = %s OR imei = %s
-        """, (identifier, identifier, identifier))
-    except psycopg2.ProgrammingError:
-        # Fallback if created_at/updated_at columns don't exist yet
-        cursor.execute("""
-            SELECT id, asset_tag, serial_number, imei, manufacturer, model, status, 
-                   purchase_date, warranty_end_date, notes
-            FROM phones 
-            WHERE asset_tag = %s OR serial_number = %s OR imei = %s
-        """, (identifier, identifier, identifier))
-    
-    phone = cursor.fetchone()
-    if not phone:
+    query = CSV_EXPORT_REPORTS.get(report)
+    if isinstance(query, dict):
+        query = query.get(section)
+    elif section is not None:
+        query = None
+    if query is None:
+        return jsonify({"error": "Unknown report."}), 404
+
+    params = []
+    if report == 'ticket_history':
+        try:
+            conditions, params = ticket_list_filters()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        where_sql = "WHERE " + " AND ".join(conditions) if conditions else ""
+        query = query.format(where_sql=where_sql, limit_sql="")
+
+    from datetime import date
+    filename = f"{section or report}_{date.today().isoformat()}.csv"
+    app.logger.info("CSV export of %s requested by user %s", section or report, session.get('username'))
+    return copy_csv_response(query, params, filename)
+
+# --- Report Snapshots ---
+# The inventory summary, missing-data report and dashboard charts are captured
+# on a schedule and stored as gzip-compressed JSON in report_snapshots, so
+# month-end reviews read a stored document instead of rerunning the reports
+# against production. Every worker runs the scheduler thread; a session advisory
+# lock makes sure only one of them takes a given round of snapshots. Stored
+# payloads are sent as-is to clients that accept gzip.
+REPORT_SNAPSHOT_BUILDERS = {
+    'inventory_summary': build_inventory_summary,
+    'missing_data': build_missing_data_report,
+    'dashboard_charts': build_dashboard_charts,
+}
+# 0 disables scheduled snapshots; manual snapshots still work
+REPORT_SNAPSHOT_INTERVAL_HOURS = int(os.environ.get('REPORT_SNAPSHOT_INTERVAL_HOURS', 24))
+# Every snapshot is kept this long; older ones only survive as the last of their month
+REPORT_SNAPSHOT_RETENTION_DAYS = int(os.environ.get('REPORT_SNAPSHOT_RETENTION_DAYS', 90))
+REPORT_SNAPSHOT_MONTHLY_RETENTION_MONTHS = int(os.environ.get('REPORT_SNAPSHOT_MONTHLY_RETENTION_MONTHS', 36))
+REPORT_SNAPSHOT_CHECK_SECONDS = 300
+REPORT_SNAPSHOT_LOCK_KEY = 4700
+REPORT_SNAPSHOT_LIST_LIMIT = 500
+# Columns a report's row lists are grouped by, naming each row when diffing
+# snapshots; lists of records with an id are compared by id instead
+REPORT_SNAPSHOT_ROW_KEYS = {
+    'inventory_summary': ('status',),
+}
+REPORT_SNAPSHOT_COLUMNS = "id, report, taken_at, trigger, created_by, raw_bytes, compressed_bytes"
+
+def take_report_snapshot(cursor, report, trigger, user_id=None):
+    """Runs a report and stores its compressed JSON; returns the snapshot's metadata."""
+    raw = orjson.dumps(REPORT_SNAPSHOT_BUILDERS[report](cursor), default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    payload = gzip.compress(raw, compresslevel=9, mtime=0)
+    cursor.execute(f"""
+        INSERT INTO report_snapshots (report, trigger, created_by, payload, raw_bytes, compressed_bytes)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        RETURNING {REPORT_SNAPSHOT_COLUMNS};
+    """, (report, trigger, user_id, psycopg2.Binary(payload), len(raw), len(payload)))
+    return cursor.fetchone()
+
+def prune_report_snapshots(cursor):
+    """
+    Deletes snapshots past REPORT_SNAPSHOT_RETENTION_DAYS, except the last one of
+    each month per report until REPORT_SNAPSHOT_MONTHLY_RETENTION_MONTHS.
+    Returns the number of snapshots deleted.
+    """
+    cursor.execute("""
+        DELETE FROM report_snapshots
+        WHERE taken_at < now() - make_interval(days => %s)
+          AND (taken_at < now() - make_interval(months => %s)
+               OR id NOT IN (
+                   SELECT DISTINCT ON (report, date_trunc('month', taken_at)) id
+                   FROM report_snapshots
+                   ORDER BY report, date_trunc('month', taken_at), taken_at DESC
+               ));
+    """, (REPORT_SNAPSHOT_RETENTION_DAYS, REPORT_SNAPSHOT_MONTHLY_RETENTION_MONTHS))
+    return cursor.rowcount
+
+def run_scheduled_report_snapshots():
+    """Takes the scheduled snapshots that are due and prunes old ones."""
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'), cursor_factory=RealDictCursor)
+    try:
+        # The lock is taken before the snapshot transaction starts, so that
+        # transaction sees whatever the previous holder committed
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s) AS locked;", (REPORT_SNAPSHOT_LOCK_KEY,))
+            if not cursor.fetchone()['locked']:
+                return []
+        # All reports of a round are read from the same database snapshot
+        conn.autocommit = False
+        conn.set_session(isolation_level='REPEATABLE READ')
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT report FROM report_snapshots
+                WHERE trigger = 'scheduled'
+                GROUP BY report
+                HAVING MAX(taken_at) > now() - make_interval(hours => %s);
+            """, (REPORT_SNAPSHOT_INTERVAL_HOURS,))
+            fresh = {row['report'] for row in cursor.fetchall()}
+            taken = [
+                take_report_snapshot(cursor, report, 'scheduled')
+                for report in REPORT_SNAPSHOT_BUILDERS if report not in fresh
+            ]
+            pruned = prune_report_snapshots(cursor)
+        conn.commit()
+        if taken or pruned:
+            app.logger.info("Report snapshots: %d taken, %d pruned", len(taken), pruned)
+        return taken
+    finally:
+        conn.close()
+
+def report_snapshot_loop():
+    while True:
+        try:
+            run_scheduled_report_snapshots()
+        except Exception as e:
+            app.logger.error("Scheduled report snapshots failed: %s", e, exc_info=True)
+        time.sleep(REPORT_SNAPSHOT_CHECK_SECONDS)
+
+@app.before_request
+def start_report_snapshot_scheduler():
+    if REPORT_SNAPSHOT_INTERVAL_HOURS > 0:
+        ensure_background_thread('report-snapshots', report_snapshot_loop)
+
+def snapshot_time_bound(value):
+    """
+    Parses a ?before= style value into (sql operator, bound). A plain date
+    includes snapshots taken during that day. Raises ValueError.
+    """
+    from datetime import date, datetime, timedelta
+    if len(value) == 10:
+        return '<', date.fromisoformat(value) + timedelta(days=1)
+    return '<=', datetime.fromisoformat(value)
+
+def find_report_snapshot(cursor, ref, report=None, columns=REPORT_SNAPSHOT_COLUMNS):
+    """
+    Resolves a snapshot id, or with a report name a date/timestamp meaning the
+    latest snapshot of that report taken at or before it (no ref: the latest).
+    Raises ValueError.
+    """
+    if ref is not None and ref.isdigit():
+        cursor.execute(f"SELECT {columns} FROM report_snapshots WHERE id = %s;", (int(ref),))
+        return cursor.fetchone()
+    if report is None:
+        raise ValueError("A report is required to look up snapshots by date.")
+    condition, params = "", [report]
+    if ref is not None:
+        operator, bound = snapshot_time_bound(ref)
+        condition = f"AND taken_at {operator} %s"
+        params.append(bound)
+    cursor.execute(f"""
+        SELECT {columns} FROM report_snapshots
+        WHERE report = %s {condition}
+        ORDER BY taken_at DESC
+        LIMIT 1;
+    """, params)
+    return cursor.fetchone()
+
+def report_snapshot_response(snapshot):
+    """Serves a stored payload, still compressed when the client accepts gzip."""
+    payload = bytes(snapshot['payload'])
+    gzipped = bool(request.accept_encodings['gzip'])
+    response = app.response_class(payload if gzipped else gzip.decompress(payload), mimetype='application/json')
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # Snapshots never change once taken
+    response.set_etag(f"report-snapshot-{snapshot['id']}{'-gz' if gzipped else ''}")
+    response.last_modified = snapshot['taken_at']
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    response.headers['X-Report-Snapshot-Id'] = str(snapshot['id'])
+    return response.make_conditional(request)
+
+def report_snapshot_metrics(report, document):
+    """
+    Flattens a report into comparable values: {path: number} for counts and
+    chart series, plus {path: set of ids} for record lists. Rows without an id
+    are keyed by the report's REPORT_SNAPSHOT_ROW_KEYS columns (a NULL group is
+    "null"); lists without either only contribute their count.
+    """
+    key_columns = REPORT_SNAPSHOT_ROW_KEYS.get(report, ())
+    metrics = {}
+    records = {}
+
+    def walk(value, path):
+        if isinstance(value, bool):
+            return
+        if isinstance(value, (int, float)):
+            metrics[path] = value
+        elif isinstance(value, dict):
+            if isinstance(value.get('labels'), list) and isinstance(value.get('data'), list):
+                for label, number in zip(value['labels'], value['data']):
+                    walk(number, f"{path}[{'null' if label is None else label}]")
+                return
+            for key, item in value.items():
+                walk(item, f"{path}.{key}" if path else key)
+        elif isinstance(value, list) and all(isinstance(row, dict) for row in value):
+            if any('id' in row for row in value):
+                metrics[f"{path}.count"] = len(value)
+                records[path] = {row.get('id') for row in value}
+                return
+            if not key_columns or not all(column in row for row in value for column in key_columns):
+                metrics[f"{path}.count"] = len(value)
+                return
+            for row in value:
+                label = ', '.join('null' if row[column] is None else str(row[column]) for column in key_columns)
+                for key, item in row.items():
+                    if key not in key_columns:
+                        walk(item, f"{path}[{label}].{key}")
+
+    walk(document, '')
+    return metrics, records
+
+@app.route('/api/reports/snapshots', methods=['GET'])
+@login_required
+@role_required('Administrator')
+def list_report_snapshots():
+    """Snapshot metadata, newest first. Filters: report, before (date or timestamp), limit."""
+    conditions, params = [], []
+    report = request.args.get('report')
+    if report:
+        if report not in REPORT_SNAPSHOT_BUILDERS:
+            return jsonify({"error": "Unknown report."}), 404
+        conditions.append("report = %s")
+        params.append(report)
+    before = request.args.get('before')
+    if before:
+        try:
+            operator, bound = snapshot_time_bound(before)
+        except ValueError:
+            return jsonify({"error": "Invalid 'before' date."}), 400
+        conditions.append(f"taken_at {operator} %s")
+        params.append(bound)
+    limit = request.args.get('limit', 100, type=int)
+    params.append(max(1, min(limit, REPORT_SNAPSHOT_LIST_LIMIT)))
+
+    where_sql = "WHERE " + " AND ".join(conditions) if conditions else ""
+    cursor = get_db().cursor()
+    cursor.execute(f"""
+        SELECT {REPORT_SNAPSHOT_COLUMNS} FROM report_snapshots
+        {where_sql}
+        ORDER BY taken_at DESC, id DESC
+        LIMIT %s;
+    """, params)
+    snapshots = cursor.fetchall()
+    cursor.close()
+    return jsonify({"reports": list(REPORT_SNAPSHOT_BUILDERS), "snapshots": snapshots})
+
+@app.route('/api/reports/snapshots', methods=['POST'])
+@login_required
+@role_required('Administrator')
+def create_report_snapshots():
+    """Takes snapshots now, of the posted 'reports' or of every report."""
+    data = request.get_json(silent=True) or {}
+    reports = data.get('reports') or list(REPORT_SNAPSHOT_BUILDERS)
+    unknown = [report for report in reports if report not in REPORT_SNAPSHOT_BUILDERS]
+    if unknown:
+        return jsonify({"error": f"Unknown report(s): {', '.join(map(str, unknown))}"}), 400
+
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        snapshots = [take_report_snapshot(cursor, report, 'manual', session.get('user_id')) for report in reports]
+        db.commit()
+    except psycopg2.Error as e:
+        db.rollback()
+        app.logger.error("Manual report snapshot failed: %s", e)
+        return jsonify({"error": "Snapshot failed.", "details": str(e)}), 500
+    finally:
         cursor.close()
-        return jsonify({"error": "Phone not found with the provided identifier"}), 404
-    
-    phone_id = phone['id']
-    
-    # Build comprehensive timeline of events
-    timeline_events = []
-    
-    # 1. Phone creation/purchase event (use purchase_date if available, otherwise created_at)
+    app.logger.info("Report snapshots %s taken by user %s", ', '.join(reports), session.get('username'))
+    return jsonify({"snapshots": snapshots}), 201
+
+@app.route('/api/reports/snapshots/<int:snapshot_id>', methods=['GET'])
+@login_required
+@role_required('Administrator')
+def get_report_snapshot(snapshot_id):
+    """The stored report document, exactly as the live report endpoint returned it."""
+    cursor = get_db().cursor()
+    snapshot = find_report_snapshot(cursor, str(snapshot_id), columns="id, taken_at, payload")
+    cursor.close()
+    if snapshot is None:
+        return jsonify({"error": "Snapshot not found."}), 404
+    return report_snapshot_response(snapshot)
+
+@app.route('/api/reports/snapshots/<report>/latest', methods=['GET'])
+@login_required
+@role_required('Administrator')
+def get_latest_report_snapshot(report):
+    """Latest snapshot of a report, or the latest taken at or before ?before=."""
+    if report not in REPORT_SNAPSHOT_BUILDERS:
+        return jsonify({"error": "Unknown report."}), 404
+    cursor = get_db().cursor()
     try:
-        creation_date = phone['purchase_date'] or phone['created_at']
-        if creation_date:
-            timeline_events.append({
-                "event_type": "Phone Created" if phone['created_at'] else "Phone Purchased",
-                "event_date": creation_date.isoformat() if hasattr(creation_date, 'isoformat') else str(creation_date),
-                "description": f"Phone {phone['asset_tag']} ({phone['manufacturer']} {phone['model']}) added to inventory",
-                "details": {
-                    "asset_tag": phone['asset_tag'],
-                    "serial_number": phone['serial_number'],
-                    "imei": phone['imei'],
-                    "manufacturer": phone['manufacturer'],
-                    "model": phone['model']
-                },
-                "category": "inventory"
-            })
-    except (KeyError, TypeError):
-        # If created_at column doesn't exist, use purchase_date or skip creation event
+        snapshot = find_report_snapshot(cursor, request.args.get('before'), report, columns="id, taken_at, payload")
+    except ValueError:
+        return jsonify({"error": "Invalid 'before' date."}), 400
+    finally:
+        cursor.close()
+    if snapshot is None:
+        return jsonify({"error": "No snapshot found."}), 404
+    return report_snapshot_response(snapshot)
+
+@app.route('/api/reports/snapshots/compare', methods=['GET'])
+@login_required
+@role_required('Administrator')
+def compare_report_snapshots():
+    """
+    Differences between two snapshots of the same report. 'from' and 'to' are
+    snapshot ids, or dates/timestamps together with ?report=. Returns changed
+    values with their delta, and the ids added to or removed from record lists.
+    """
+    refs = (request.args.get('from'), request.args.get('to'))
+    if not all(refs):
+        return jsonify({"error": "'from' and 'to' are required."}), 400
+    report = request.args.get('report')
+    if report is not None and report not in REPORT_SNAPSHOT_BUILDERS:
+        return jsonify({"error": "Unknown report."}), 404
+
+    cursor = get_db().cursor()
+    try:
+        snapshots = [find_report_snapshot(cursor, ref, report, f"{REPORT_SNAPSHOT_COLUMNS}, payload") for ref in refs]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        cursor.close()
+    if None in snapshots:
+        return jsonify({"error": "Snapshot not found."}), 404
+    old, new = snapshots
+    if old['report'] != new['report']:
+        return jsonify({"error": "Snapshots belong to different reports."}), 400
+
+    old_metrics, old_records = report_snapshot_metrics(
+        old['report'], orjson.loads(gzip.decompress(bytes(old.pop('payload')))))
+    new_metrics, new_records = report_snapshot_metrics(
+        new['report'], orjson.loads(gzip.decompress(bytes(new.pop('payload')))))
+    changes = []
+    for path in sorted(old_metrics.keys() | new_metrics.keys()):
+        before, after = old_metrics.get(path, 0), new_metrics.get(path, 0)
+        if before != after:
+            changes.append({"path": path, "from": before, "to": after, "delta": round(after - before, 6)})
+    records = {}
+    for path in sorted(old_records.keys() | new_records.keys()):
+        before, after = old_records.get(path, set()), new_records.get(path, set())
+        if before != after:
+            records[path] = {
+                "added": sorted(after - before, key=str),
+                "removed": sorted(before - after, key=str),
+            }
+    return jsonify({"report": old['report'], "from": old, "to": new, "changes": changes, "records": records})
+
+@app.route('/api/reports/snapshots/prune', methods=['POST'])
+@login_required
+@role_required('Administrator')
+def prune_report_snapshots_now():
+    """Applies the retention policy immediately instead of waiting for the scheduler."""
+    db = get_db()
+    cursor = db.cursor()
+    deleted = prune_report_snapshots(cursor)
+    db.commit()
+    cursor.close()
+    return jsonify({"deleted": deleted})
+
+# --- Daily Rollups ---
+# Trend charts read per-day, per-sector counts from daily_sector_rollups and
+# daily_ticket_rollups instead of scanning assignments and tickets. A background
+# thread refreshes them every ROLLUP_REFRESH_MINUTES: the days from the
+# watermark on are recomputed from range reads on the event timestamps and
+# replaced, so a refresh is idempotent and only touches recent rows. The day
+# before the watermark is reopened as well, for transactions that committed
+# after the previous refresh. Days are counted in ROLLUP_TIMEZONE. Assignments
+# count toward the worker's sector; tickets and phone status changes toward the
+# sector of the worker who last received the phone before the event.
+# Retirements logged in asset_history_log count as well, so the days before
+# phone_status_changes existed are covered; an event the trigger also recorded
+# (same phone, same transaction time) is only counted once. Repairs were never
+# logged there, so phones_to_repair starts with phone_status_changes.
+# 0 disables the refresh thread; POST /api/reports/trends/refresh still works
+ROLLUP_REFRESH_MINUTES = int(os.environ.get('ROLLUP_REFRESH_MINUTES', 15))
+ROLLUP_TIMEZONE = os.environ.get('ROLLUP_TIMEZONE', 'Europe/Brussels')
+ROLLUP_REOPEN_DAYS = 1
+ROLLUP_LOCK_KEY = 4900
+TREND_GRANULARITIES = ('day', 'week', 'month')
+TREND_MAX_PERIODS = 1100
+TREND_SECTOR_METRICS = ('assignments_created', 'assignments_returned', 'phones_to_repair', 'phones_retired')
+TREND_TICKET_METRICS = ('tickets_opened', 'tickets_resolved')
+
+# Sector of the worker who last received phone {phone} at or before {at}
+ROLLUP_PHONE_SECTOR_JOIN = """
+        LEFT JOIN LATERAL (
+            SELECT w.secteur_id
+            FROM assignments a
+            JOIN workers w ON a.worker_id = w.id
+            WHERE a.phone_id = {phone} AND a.assignment_date <= {at}
+            ORDER BY a.assignment_date DESC
+            LIMIT 1
+        ) holder ON TRUE
+"""
+
+ROLLUP_SECTOR_QUERY = """
+    INSERT INTO daily_sector_rollups
+        (day, secteur_id, assignments_created, assignments_returned, phones_to_repair, phones_retired)
+    SELECT day, secteur_id,
+           COUNT(*) FILTER (WHERE kind = 'assigned'),
+           COUNT(*) FILTER (WHERE kind = 'returned'),
+           COUNT(*) FILTER (WHERE kind = 'In Repair'),
+           COUNT(*) FILTER (WHERE kind = 'Retired')
+    FROM (
+        SELECT (a.assignment_date AT TIME ZONE %(tz)s)::date AS day, w.secteur_id, 'assigned' AS kind
+        FROM assignments a
+        JOIN workers w ON a.worker_id = w.id
+        WHERE a.assignment_date >= %(start_day)s::timestamp AT TIME ZONE %(tz)s
+        UNION ALL
+        SELECT (a.return_date AT TIME ZONE %(tz)s)::date, w.secteur_id, 'returned'
+        FROM assignments a
+        JOIN workers w ON a.worker_id = w.id
+        WHERE a.return_date >= %(start_day)s::timestamp AT TIME ZONE %(tz)s
+        UNION ALL
+        SELECT (c.changed_at AT TIME ZONE %(tz)s)::date, holder.secteur_id, c.new_status
+        FROM phone_status_changes c
+        {holder_join}
+        WHERE c.changed_at >= %(start_day)s::timestamp AT TIME ZONE %(tz)s AND c.new_status IN ('In Repair', 'Retired')
+        UNION ALL
+        SELECT (h.event_timestamp AT TIME ZONE %(tz)s)::date, holder.secteur_id, 'Retired'
+        FROM asset_history_log h
+        {history_holder_join}
+        WHERE h.asset_type = 'Phone' AND h.event_type = 'Retired'
+          AND h.event_timestamp >= %(start_day)s::timestamp AT TIME ZONE %(tz)s
+          AND NOT EXISTS (
+              SELECT 1 FROM phone_status_changes c
+              WHERE c.phone_id = h.asset_id AND c.new_status = 'Retired' AND c.changed_at = h.event_timestamp
+          )
+    ) events
+    GROUP BY day, secteur_id;
+""".format(
+    holder_join=ROLLUP_PHONE_SECTOR_JOIN.format(phone='c.phone_id', at='c.changed_at'),
+    history_holder_join=ROLLUP_PHONE_SECTOR_JOIN.format(phone='h.asset_id', at='h.event_timestamp'),
+)
+
+# Opened and resolved tickets are both attributed to the sector the ticket was opened in
+ROLLUP_TICKET_QUERY = """
+    INSERT INTO daily_ticket_rollups (day, secteur_id, priority, tickets_opened, tickets_resolved)
+    SELECT day, secteur_id, priority,
+           COUNT(*) FILTER (WHERE kind = 'opened'),
+           COUNT(*) FILTER (WHERE kind = 'resolved')
+    FROM (
+        SELECT (t.created_at AT TIME ZONE %(tz)s)::date AS day, holder.secteur_id, t.priority, 'opened' AS kind
+        FROM tickets t
+        {holder_join}
+        WHERE t.created_at >= %(start_day)s::timestamp AT TIME ZONE %(tz)s
+        UNION ALL
+        SELECT (t.resolved_at AT TIME ZONE %(tz)s)::date, holder.secteur_id, t.priority, 'resolved'
+        FROM tickets t
+        {holder_join}
+        WHERE t.resolved_at >= %(start_day)s::timestamp AT TIME ZONE %(tz)s
+    ) events
+    GROUP BY day, secteur_id, priority;
+""".format(holder_join=ROLLUP_PHONE_SECTOR_JOIN.format(phone='t.phone_id', at='t.created_at'))
+
+def refresh_daily_rollups(cursor, rebuild=False):
+    """
+    Recomputes the rollup days from the watermark (all of them with rebuild)
+    and moves the watermark to today. Returns the first day recomputed, or None
+    when another refresh holds the lock. The caller commits.
+    """
+    from datetime import date, timedelta
+    cursor.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked;", (ROLLUP_LOCK_KEY,))
+    if not cursor.fetchone()['locked']:
+        return None
+    cursor.execute("SELECT rolled_up_through FROM daily_rollup_state;")
+    state = cursor.fetchone()
+    start_day = date.min
+    if state and not rebuild:
+        start_day = state['rolled_up_through'] - timedelta(days=ROLLUP_REOPEN_DAYS)
+
+    params = {'tz': ROLLUP_TIMEZONE, 'start_day': start_day}
+    cursor.execute("DELETE FROM daily_sector_rollups WHERE day >= %(start_day)s;", params)
+    cursor.execute("DELETE FROM daily_ticket_rollups WHERE day >= %(start_day)s;", params)
+    cursor.execute(ROLLUP_SECTOR_QUERY, params)
+    cursor.execute(ROLLUP_TICKET_QUERY, params)
+    cursor.execute("""
+        INSERT INTO daily_rollup_state (rolled_up_through)
+        VALUES ((now() AT TIME ZONE %(tz)s)::date)
+        ON CONFLICT (id) DO UPDATE
+            SET rolled_up_through = EXCLUDED.rolled_up_through, refreshed_at = now();
+    """, params)
+    return start_day
+
+def run_daily_rollup_refresh(rebuild=False):
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'), cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cursor:
+            start_day = refresh_daily_rollups(cursor, rebuild)
+        conn.commit()
+        return start_day
+    finally:
+        conn.close()
+
+def daily_rollup_loop():
+    while True:
         try:
-            purchase_date = phone['purchase_date']
-            if purchase_date:
-                timeline_events.append({
-                    "event_type": "Phone Purchased",
-                    "event_date": purchase_date.isoformat() if hasattr(purchase_date, 'isoformat') else str(purchase_date),
-                    "description": f"Phone {phone['asset_tag']} ({phone['manufacturer']} {phone['model']}) purchased",
-                    "details": {
-                        "asset_tag": phone['asset_tag'],
-                        "serial_number": phone['serial_number'],
-                        "imei": phone['imei'],
-                        "manufacturer": phone['manufacturer'],
-                        "model": phone['model']
-                    },
-                    "category": "inventory"
-                })
-        except (KeyError, TypeError):
-            # If no date information is available, add a generic entry
-            timeline_events.append({
-                "event_type": "Phone Added to Inventory",
-                "event_date": "2024-01-01T00:00:00Z",  # Default fallback date
-                "description": f"Phone {phone['asset_tag']} ({phone['manufacturer']} {phone['model']}) added to inventory",
-                "details": {
-                    "asset_tag": phone['asset_tag'],
-                    "serial_number": phone['serial_number'],
-                    "imei": phone['imei'],
-                    "manufacturer": phone['manufacturer'],
-                    "model": phone['model']
-                },
-                "category": "inventory"
-            })
-    
-    # 2. Get assignment history
+            run_daily_rollup_refresh()
+        except Exception as e:
+            app.logger.error("Daily rollup refresh failed: %s", e, exc_info=True)
+        time.sleep(ROLLUP_REFRESH_MINUTES * 60)
+
+@app.before_request
+def start_daily_rollup_scheduler():
+    if ROLLUP_REFRESH_MINUTES > 0:
+        ensure_background_thread('daily-rollups', daily_rollup_loop)
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute every daily rollup row, e.g. after changing ROLLUP_TIMEZONE."""
+    if run_daily_rollup_refresh(rebuild=True) is None:
+        print("A rollup refresh is already running; try again shortly.")
+    else:
+        print("Daily rollups rebuilt.")
+
+@app.route('/api/reports/trends/refresh', methods=['POST'])
+@login_required
+@role_required('Administrator')
+def refresh_trends():
+    """Brings the rollups up to date now instead of waiting for the next refresh."""
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        start_day = refresh_daily_rollups(cursor)
+        if start_day is None:
+            db.rollback()
+            return jsonify({"error": "A rollup refresh is already running."}), 409
+        cursor.execute("SELECT rolled_up_through, refreshed_at FROM daily_rollup_state;")
+        state = cursor.fetchone()
+        db.commit()
+    except psycopg2.Error as e:
+        db.rollback()
+        app.logger.error("Daily rollup refresh failed: %s", e)
+        return jsonify({"error": "Refresh failed.", "details": str(e)}), 500
+    finally:
+        cursor.close()
+    return jsonify(state)
+
+@app.route('/api/reports/trends', methods=['GET'])
+@login_required
+@role_required('Administrator')
+def get_fleet_trends():
+    """
+    Fleet trends from the daily rollups, one value per period for each metric.
+    Query parameters: from/to (dates, default the last 12 months), granularity
+    (day, week or month), secteur_id to restrict to one sector, and by=sector
+    to add a breakdown per sector.
+    """
+    from datetime import date, datetime, timedelta
+    from zoneinfo import ZoneInfo
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in TREND_GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of: {', '.join(TREND_GRANULARITIES)}"}), 400
+    try:
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else datetime.now(ZoneInfo(ROLLUP_TIMEZONE)).date()
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else end - timedelta(days=365)
+    except ValueError:
+        return jsonify({"error": "from and to must be dates (YYYY-MM-DD)"}), 400
+    if start > end:
+        return jsonify({"error": "from must not be after to"}), 400
+    secteur_id = request.args.get('secteur_id', type=int)
+    by_sector = request.args.get('by') == 'sector'
+
+    params = {'unit': granularity, 'start': start, 'end': end, 'secteur_id': secteur_id}
+    sector_filter = "AND r.secteur_id = %(secteur_id)s" if secteur_id is not None else ""
+    cursor = get_db().cursor()
     cursor.execute("""
-        SELECT a.assignment_date, a.return_date, 
-               w.full_name as worker_name, w.worker_id,
-               s.secteur_name,
-               sc.iccid, sc.carrier,
-               pn.phone_number,
-               u.full_name as assigned_by_user
+        SELECT period::date AS period
+        FROM generate_series(date_trunc(%(unit)s, %(start)s::timestamp), %(end)s::timestamp,
+                             ('1 ' || %(unit)s)::interval) period;
+    """, params)
+    periods = [row['period'] for row in cursor.fetchall()]
+    if len(periods) > TREND_MAX_PERIODS:
+        cursor.close()
+        return jsonify({"error": "Too many periods; use a coarser granularity or a shorter range."}), 400
+
+    cursor.execute(f"""
+        SELECT date_trunc(%(unit)s, r.day)::date AS period, r.secteur_id,
+               SUM(r.assignments_created)::int AS assignments_created,
+               SUM(r.assignments_returned)::int AS assignments_returned,
+               SUM(r.phones_to_repair)::int AS phones_to_repair,
+               SUM(r.phones_retired)::int AS phones_retired
+        FROM daily_sector_rollups r
+        WHERE r.day BETWEEN %(start)s AND %(end)s {sector_filter}
+        GROUP BY 1, 2;
+    """, params)
+    sector_rows = cursor.fetchall()
+    cursor.execute(f"""
+        SELECT date_trunc(%(unit)s, r.day)::date AS period, r.secteur_id, r.priority,
+               SUM(r.tickets_opened)::int AS tickets_opened,
+               SUM(r.tickets_resolved)::int AS tickets_resolved
+        FROM daily_ticket_rollups r
+        WHERE r.day BETWEEN %(start)s AND %(end)s {sector_filter}
+        GROUP BY 1, 2, 3;
+    """, params)
+    ticket_rows = cursor.fetchall()
+    cursor.execute("SELECT rolled_up_through, refreshed_at FROM daily_rollup_state;")
+    state = cursor.fetchone()
+    cursor.execute("SELECT id, secteur_name FROM secteurs;")
+    sector_names = {row['id']: row['secteur_name'] for row in cursor.fetchall()}
+    cursor.close()
+
+    position = {period: i for i, period in enumerate(periods)}
+
+    def empty_series():
+        return {metric: [0] * len(periods) for metric in TREND_SECTOR_METRICS + TREND_TICKET_METRICS}
+
+    series = empty_series()
+    by_priority = {priority: {metric: [0] * len(periods) for metric in TREND_TICKET_METRICS}
+                   for priority in TICKET_PRIORITIES}
+    sectors = defaultdict(empty_series)
+    for rows, metrics in ((sector_rows, TREND_SECTOR_METRICS), (ticket_rows, TREND_TICKET_METRICS)):
+        for row in rows:
+            i = position[row['period']]
+            for metric in metrics:
+                series[metric][i] += row[metric]
+                if by_sector:
+                    sectors[row['secteur_id']][metric][i] += row[metric]
+                if 'priority' in row:
+                    by_priority[row['priority']][metric][i] += row[metric]
+
+    response = {
+        "granularity": granularity,
+        "from": start,
+        "to": end,
+        "timezone": ROLLUP_TIMEZONE,
+        "rolled_up_through": state['rolled_up_through'] if state else None,
+        "refreshed_at": state['refreshed_at'] if state else None,
+        "periods": periods,
+        "series": series,
+        "tickets_by_priority": by_priority,
+    }
+    if by_sector:
+        response["sectors"] = [
+            {"secteur_id": sid, "secteur_name": sector_names.get(sid), "series": sector_series}
+            for sid, sector_series in sorted(sectors.items(), key=lambda item: sector_names.get(item[0]) or '')
+        ]
+    return jsonify(response)
+
+# --- Ticket SLA Analytics ---
+# ticket_metrics holds one row per ticket with its time to first response and to
+# resolution, kept current by triggers on tickets and ticket_updates, so SLA
+# reports aggregate a narrow table instead of rescanning tickets and their
+# updates. Percentiles are computed with percentile_cont, per group and overall
+# in one pass using GROUPING SETS. Months are counted in ROLLUP_TIMEZONE.
+TICKET_SLA_PERCENTILES = (0.5, 0.9, 0.99)
+# group_by dimension -> (output key, SQL expression)
+TICKET_SLA_DIMENSIONS = {
+    'priority': ('priority', "m.priority"),
+    'sector': ('secteur_name', "s.secteur_name"),
+    'assignee': ('assignee', "u.full_name"),
+    'month': ('month', "date_trunc('month', m.created_at AT TIME ZONE %(tz)s)::date"),
+}
+
+@app.cli.command('rebuild-ticket-metrics')
+def rebuild_ticket_metrics_command():
+    """Recompute ticket_metrics for every ticket, e.g. after restoring tickets in bulk."""
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(refresh_ticket_metrics(id)) FROM tickets;")
+            count = cursor.fetchone()[0]
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Recomputed metrics for {count} tickets.")
+
+def sla_hours(percentiles):
+    """Maps a percentile_cont array in seconds to {'p50': hours, ...}."""
+    values = percentiles or [None] * len(TICKET_SLA_PERCENTILES)
+    return {
+        f"p{round(p * 100)}": round(value / 3600, 2) if value is not None else None
+        for p, value in zip(TICKET_SLA_PERCENTILES, values)
+    }
+
+@app.route('/api/reports/ticket_sla', methods=['GET'])
+@login_required
+@role_required('Administrator')
+def get_ticket_sla():
+    """
+    Time to first response and time to resolution (p50/p90/p99, in hours) of
+    the tickets opened between from and to (dates, default the last 12 months).
+    group_by takes a comma separated list of priority, sector, assignee and
+    month; priority, secteur_id and assignee_id filter the tickets. Resolution
+    percentiles only cover resolved tickets, response ones answered tickets.
+    """
+    from datetime import date, datetime, timedelta
+    from zoneinfo import ZoneInfo
+    try:
+        group_by = request_list_arg('group_by', TICKET_SLA_DIMENSIONS)
+        priorities = request_list_arg('priority', TICKET_PRIORITIES)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else datetime.now(ZoneInfo(ROLLUP_TIMEZONE)).date()
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else end - timedelta(days=365)
+    except ValueError:
+        return jsonify({"error": "from and to must be dates (YYYY-MM-DD)"}), 400
+    if start > end:
+        return jsonify({"error": "from must not be after to"}), 400
+
+    params = {'tz': ROLLUP_TIMEZONE, 'start': start, 'end': end, 'percentiles': list(TICKET_SLA_PERCENTILES)}
+    conditions = [
+        "m.created_at >= %(start)s::timestamp AT TIME ZONE %(tz)s",
+        "m.created_at < (%(end)s::date + 1)::timestamp AT TIME ZONE %(tz)s",
+    ]
+    if priorities:
+        conditions.append("m.priority = ANY(%(priorities)s)")
+        params['priorities'] = priorities
+    for arg, column in (('secteur_id', 'm.secteur_id'), ('assignee_id', 'm.assignee_id')):
+        if request.args.get(arg):
+            value = request.args.get(arg, type=int)
+            if value is None:
+                return jsonify({"error": f"{arg} must be an integer"}), 400
+            conditions.append(f"{column} = %({arg})s")
+            params[arg] = value
+
+    dimensions = [TICKET_SLA_DIMENSIONS[name] for name in group_by]
+    keys = [key for key, _ in dimensions]
+    expressions = ", ".join(expression for _, expression in dimensions)
+    select_sql = "".join(f"{expression} AS {key}, " for key, expression in dimensions)
+    # The () grouping set adds the overall row, flagged by GROUPING()
+    grouping_sql = f"GROUP BY GROUPING SETS (({expressions}), ())" if dimensions else ""
+    is_total_sql = f"GROUPING({expressions}) <> 0" if dimensions else "TRUE"
+    order_sql = f"ORDER BY is_total, {', '.join(keys)}" if dimensions else ""
+
+    cursor = get_db().cursor()
+    cursor.execute(f"""
+        SELECT {select_sql}
+               {is_total_sql} AS is_total,
+               COUNT(*) AS tickets,
+               COUNT(m.first_response_at) AS responded,
+               COUNT(m.resolved_at) AS resolved,
+               percentile_cont(%(percentiles)s::double precision[])
+                   WITHIN GROUP (ORDER BY m.first_response_seconds) AS first_response,
+               percentile_cont(%(percentiles)s::double precision[])
+                   WITHIN GROUP (ORDER BY m.resolution_seconds) AS resolution
+        FROM ticket_metrics m
+        LEFT JOIN secteurs s ON m.secteur_id = s.id
+        LEFT JOIN users u ON m.assignee_id = u.id
+        WHERE {' AND '.join(conditions)}
+        {grouping_sql}
+        {order_sql};
+    """, params)
+    rows = cursor.fetchall()
+    cursor.close()
+
+    def summarize(row, keys=()):
+        summary = {key: row[key] for key in keys}
+        summary.update({
+            "tickets": row['tickets'],
+            "responded": row['responded'],
+            "resolved": row['resolved'],
+            "first_response_hours": sla_hours(row['first_response']),
+            "resolution_hours": sla_hours(row['resolution']),
+        })
+        return summary
+
+    # With no matching ticket the GROUPING SETS query returns no overall row
+    total = next((row for row in rows if row['is_total']),
+                 {'tickets': 0, 'responded': 0, 'resolved': 0, 'first_response': None, 'resolution': None})
+    return jsonify({
+        "from": start,
+        "to": end,
+        "timezone": ROLLUP_TIMEZONE,
+        "group_by": group_by,
+        "overall": summarize(total),
+        "groups": [summarize(row, keys) for row in rows if not row['is_total']],
+    })
+
+# --- Asset Lifecycle ---
+# The timeline is one UNION ALL over the phone itself, its assignments (given
+# and returned), its tickets (created and resolved) and its history log,
+# ordered and paged in SQL on (event_date, source, source_id). Each branch is
+# an indexed range read on the phone id, so a page costs the same however long
+# the phone's history is.
+ASSET_LIFECYCLE_SOURCES = {
+    'created': 1, 'assigned': 2, 'returned': 3,
+    'ticket_created': 4, 'ticket_resolved': 5, 'history': 6,
+}
+
+# asset_tag, serial_number and imei each have a unique index; one lookup per
+# column lets each use it, where an OR across the three cannot do better than a
+# bitmap scan. An asset tag match wins over the other two.
+ASSET_LIFECYCLE_PHONE_QUERY = """
+    SELECT p.id, p.asset_tag, p.serial_number, p.imei, p.manufacturer, p.model, p.status,
+           p.created_at,
+           a.total AS total_assignments, a.returned AS returned_assignments,
+           t.total AS total_tickets, t.resolved AS resolved_tickets,
+           h.total AS history_events,
+           cur.full_name AS current_full_name, cur.worker_id AS current_worker_id,
+           cur.secteur_name AS current_secteur_name, cur.phone_number AS current_phone_number
+    FROM phones p
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS total, COUNT(return_date) AS returned
+        FROM assignments WHERE phone_id = p.id
+    ) a
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS total, COUNT(resolved_at) AS resolved
+        FROM tickets WHERE phone_id = p.id
+    ) t
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS total FROM asset_history_log
+        WHERE asset_type = 'Phone' AND asset_id = p.id AND event_type <> 'Assigned'
+    ) h
+    LEFT JOIN LATERAL (
+        SELECT w.full_name, w.worker_id, s.secteur_name, pn.phone_number
+        FROM assignments ca
+        JOIN workers w ON ca.worker_id = w.id
+        JOIN secteurs s ON w.secteur_id = s.id
+        LEFT JOIN phone_numbers pn ON pn.sim_card_id = ca.sim_card_id
+        WHERE ca.phone_id = p.id AND ca.return_date IS NULL
+        LIMIT 1
+    ) cur ON TRUE
+    WHERE p.id = (
+        -- An asset tag match wins over a serial number, which wins over an IMEI
+        SELECT id FROM (
+            SELECT id, 1 AS priority FROM phones WHERE asset_tag = %(identifier)s
+            UNION ALL
+            SELECT id, 2 FROM phones WHERE serial_number = %(identifier)s
+            UNION ALL
+            SELECT id, 3 FROM phones WHERE imei = %(identifier)s
+        ) matches
+        ORDER BY priority
+        LIMIT 1
+    )
+"""
+
+# Assigned history entries are left out: the assignment rows describe them in more detail
+ASSET_LIFECYCLE_TIMELINE_QUERY = """
+    SELECT event_type, event_date, description, details, category, source, source_id
+    FROM (
+        SELECT 'Phone Created' AS event_type,
+               COALESCE(p.purchase_date::timestamptz, p.created_at) AS event_date,
+               concat('Phone ', p.asset_tag, ' (', p.manufacturer, ' ', p.model, ') added to inventory') AS description,
+               jsonb_build_object(
+                   'asset_tag', p.asset_tag, 'serial_number', p.serial_number, 'imei', p.imei,
+                   'manufacturer', p.manufacturer, 'model', p.model
+               ) AS details,
+               'inventory' AS category, %(created)s AS source, p.id AS source_id
+        FROM phones p
+        WHERE p.id = %(phone_id)s
+
+        UNION ALL
+        SELECT 'Device Assigned', a.assignment_date,
+               concat('Assigned to ', w.full_name, ' (', w.worker_id, ') in ', s.secteur_name),
+               jsonb_build_object(
+                   'worker_name', w.full_name, 'worker_id', w.worker_id, 'secteur', s.secteur_name,
+                   'sim_iccid', sc.iccid, 'sim_carrier', sc.carrier, 'phone_number', pn.phone_number,
+                   'assigned_by', assigner.full_name
+               ),
+               'assignment', %(assigned)s, a.id
         FROM assignments a
         JOIN workers w ON a.worker_id = w.id
         JOIN secteurs s ON w.secteur_id = s.id
         JOIN sim_cards sc ON a.sim_card_id = sc.id
-        LEFT JOIN phone_numbers pn ON sc.id = pn.sim_card_id
-        LEFT JOIN asset_history_log ahl ON ahl.asset_id = a.phone_id AND ahl.event_type = 'Assigned'
-        LEFT JOIN users u ON ahl.user_id = u.id
-        WHERE a.phone_id = %s
-        ORDER BY a.assignment_date
-    """, (phone_id,))
-    
-    assignments = cursor.fetchall()
-    for assignment in assignments:
-        # Assignment event
-        timeline_events.append({
-            "event_type": "Device Assigned",
-            "event_date": assignment['assignment_date'].isoformat(),
-            "description": f"Assigned to {assignment['worker_name']} ({assignment['worker_id']}) in {assignment['secteur_name']}",
-            "details": {
-                "worker_name": assignment['worker_name'],
-                "worker_id": assignment['worker_id'],
-                "secteur": assignment['secteur_name'],
-                "sim_iccid": assignment['iccid'],
-                "sim_carrier": assignment['carrier'],
-                "phone_number": assignment['phone_number'],
-                "assigned_by": assignment['assigned_by_user']
-            },
-            "category": "assignment"
-        })
-        
-        # Return event (if applicable)
-        if assignment['return_date']:
-            timeline_events.append({
-                "event_type": "Device Returned",
-                "event_date": assignment['return_date'].isoformat(),
-                "description": f"Returned from {assignment['worker_name']} ({assignment['worker_id']})",
-                "details": {
-                    "worker_name": assignment['worker_name'],
-                    "worker_id": assignment['worker_id'],
-                    "secteur": assignment['secteur_name']
-                },
-                "category": "assignment"
-            })
-    
-    # 3. Get support ticket history
-    cursor.execute("""
-        SELECT t.id, t.title, t.description, t.status, t.priority, 
-               t.created_at, t.updated_at, t.resolved_at,
-               reporter.full_name as reported_by,
-               assignee.full_name as assigned_to,
-               COUNT(tu.id) as update_count
+        LEFT JOIN LATERAL (
+            SELECT phone_number FROM phone_numbers WHERE sim_card_id = sc.id LIMIT 1
+        ) pn ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT u.full_name
+            FROM asset_history_log ahl
+            JOIN users u ON ahl.user_id = u.id
+            WHERE ahl.asset_type = 'Phone' AND ahl.asset_id = a.phone_id
+              AND ahl.event_type = 'Assigned' AND ahl.event_timestamp >= a.assignment_date
+            ORDER BY ahl.event_timestamp
+            LIMIT 1
+        ) assigner ON TRUE
+        WHERE a.phone_id = %(phone_id)s
+
+        UNION ALL
+        SELECT 'Device Returned', a.return_date,
+               concat('Returned from ', w.full_name, ' (', w.worker_id, ')'),
+               jsonb_build_object('worker_name', w.full_name, 'worker_id', w.worker_id, 'secteur', s.secteur_name),
+               'assignment', %(returned)s, a.id
+        FROM assignments a
+        JOIN workers w ON a.worker_id = w.id
+        JOIN secteurs s ON w.secteur_id = s.id
+        WHERE a.phone_id = %(phone_id)s AND a.return_date IS NOT NULL
+
+        UNION ALL
+        SELECT 'Support Ticket Created', t.created_at,
+               concat('Ticket #', t.id, ': ', t.title, ' (', t.priority, ' priority)'),
+               jsonb_build_object(
+                   'ticket_id', t.id, 'title', t.title, 'description', t.description,
+                   'status', t.status, 'priority', t.priority,
+                   'reported_by', reporter.full_name, 'assigned_to', assignee.full_name,
+                   'update_count', (SELECT COUNT(*) FROM ticket_updates tu WHERE tu.ticket_id = t.id)
+               ),
+               'support', %(ticket_created)s, t.id
         FROM tickets t
         JOIN users reporter ON t.reported_by_manager_id = reporter.id
         LEFT JOIN users assignee ON t.assigned_to_support_id = assignee.id
-        LEFT JOIN ticket_updates tu ON t.id = tu.ticket_id
-        WHERE t.phone_id = %s
-        GROUP BY t.id, reporter.id, assignee.id
-        ORDER BY t.created_at
-    """, (phone_id,))
-    
-    tickets = cursor.fetchall()
-    for ticket in tickets:
-        timeline_events.append({
-            "event_type": "Support Ticket Created",
-            "event_date": ticket['created_at'].isoformat(),
-            "description": f"Ticket #{ticket['id']}: {ticket['title']} ({ticket['priority']} priority)",
-            "details": {
-                "ticket_id": ticket['id'],
-                "title": ticket['title'],
-                "description": ticket['description'],
-                "status": ticket['status'],
-                "priority": ticket['priority'],
-                "reported_by": ticket['reported_by'],
-                "assigned_to": ticket['assigned_to'],
-                "update_count": ticket['update_count']
-            },
-            "category": "support"
-        })
-        
-        if ticket['resolved_at']:
-            timeline_events.append({
-                "event_type": "Support Ticket Resolved",
-                "event_date": ticket['resolved_at'].isoformat(),
-                "description": f"Ticket #{ticket['id']} resolved: {ticket['title']}",
-                "details": {
-                    "ticket_id": ticket['id'],
-                    "title": ticket['title'],
-                    "final_status": ticket['status'],
-                    "resolved_by": ticket['assigned_to']
-                },
-                "category": "support"
-            })
-    
-    # 4. Get asset history log events
-    cursor.execute("""
-        SELECT ahl.event_type, ahl.event_timestamp, ahl.details,
-               u.full_name as performed_by
+        WHERE t.phone_id = %(phone_id)s
+
+        UNION ALL
+        SELECT 'Support Ticket Resolved', t.resolved_at,
+               concat('Ticket #', t.id, ' resolved: ', t.title),
+               jsonb_build_object(
+                   'ticket_id', t.id, 'title', t.title, 'final_status', t.status,
+                   'resolved_by', assignee.full_name
+               ),
+               'support', %(ticket_resolved)s, t.id
+        FROM tickets t
+        LEFT JOIN users assignee ON t.assigned_to_support_id = assignee.id
+        WHERE t.phone_id = %(phone_id)s AND t.resolved_at IS NOT NULL
+
+        UNION ALL
+        SELECT 'System Event: ' || ahl.event_type, ahl.event_timestamp,
+               COALESCE(ahl.details, ahl.event_type || ' event recorded'),
+               jsonb_build_object('performed_by', u.full_name, 'system_details', ahl.details),
+               'system', %(history)s, ahl.id
         FROM asset_history_log ahl
         LEFT JOIN users u ON ahl.user_id = u.id
-        WHERE ahl.asset_type = 'Phone' AND ahl.asset_id = %s
-        ORDER BY ahl.event_timestamp
-    """, (phone_id,))
-    
-    history_logs = cursor.fetchall()
-    for log in history_logs:
-        # Skip assignment events as we handle them above with more detail
-        if log['event_type'] not in ['Assigned']:
-            timeline_events.append({
-                "event_type": f"System Event: {log['event_type']}",
-                "event_date": log['event_timestamp'].isoformat(),
-                "description": log['details'] or f"{log['event_type']} event recorded",
-                "details": {
-                    "performed_by": log['performed_by'],
-                    "system_details": log['details']
-                },
-                "category": "system"
-            })
-    
-    # Sort all events chronologically
-    timeline_events.sort(key=lambda x: x['event_date'])
-    
-    # Calculate summary statistics
-    total_assignments = len([e for e in timeline_events if e['event_type'] == 'Device Assigned'])
-    total_tickets = len([e for e in timeline_events if e['event_type'] == 'Support Ticket Created'])
-    current_status = phone['status']
-    
-    # Get current assignment if any
-    cursor.execute("""
-        SELECT w.full_name, w.worker_id, s.secteur_name, pn.phone_number
-        FROM assignments a
-        JOIN workers w ON a.worker_id = w.id
-        JOIN secteurs s ON w.secteur_id = s.id
-        JOIN sim_cards sc ON a.sim_card_id = sc.id
-        LEFT JOIN phone_numbers pn ON sc.id = pn.sim_card_id
-        WHERE a.phone_id = %s AND a.return_date IS NULL
-    """, (phone_id,))
-    
-    current_assignment = cursor.fetchone()
-    cursor.close()
-    
-    # Format created_at for response if it exists
-    created_at_formatted = None
+        WHERE ahl.asset_type = 'Phone' AND ahl.asset_id = %(phone_id)s AND ahl.event_type <> 'Assigned'
+    ) events
+    {where_sql}
+    ORDER BY event_date {direction}, source {direction}, source_id {direction}
+    {limit_sql}
+"""
+
+@app.route('/api/reports/asset_lifecycle/<identifier>', methods=['GET'])
+@login_required
+@role_required('Administrator')
+def get_asset_lifecycle(identifier):
+    """
+    Get complete lifecycle history for a phone by asset tag, serial number or IMEI.
+    This provides a chronological timeline of all events for auditing and tracking.
+    The timeline is paged with ?limit= and ?cursor=; ?order=desc lists newest first.
+    """
+    order = request.args.get('order', 'asc').lower()
+    if order not in ('asc', 'desc'):
+        return jsonify({"error": "order must be 'asc' or 'desc'"}), 400
+    paged = wants_page()
     try:
-        if 'created_at' in phone and phone['created_at']:
-            created_at_formatted = phone['created_at'].isoformat()
-    except (KeyError, AttributeError):
-        pass
-    
+        limit = page_limit() if paged else None
+        after = request_cursor(3)
+        if after:
+            after = [cursor_value(after[0], 'timestamp'), cursor_value(after[1], 'int'), cursor_value(after[2], 'int')]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute(ASSET_LIFECYCLE_PHONE_QUERY, {'identifier': identifier})
+    phone = cursor.fetchone()
+    if not phone:
+        cursor.close()
+        return jsonify({"error": "Phone not found with the provided identifier"}), 404
+
+    params = dict(ASSET_LIFECYCLE_SOURCES, phone_id=phone['id'])
+    where_sql = limit_sql = ""
+    if after:
+        comparison = '<' if order == 'desc' else '>'
+        where_sql = f"WHERE (event_date, source, source_id) {comparison} (%(after_date)s::timestamptz, %(after_source)s, %(after_id)s)"
+        params.update(after_date=after[0], after_source=after[1], after_id=after[2])
+    if paged:
+        limit_sql = "LIMIT %(limit)s"
+        params['limit'] = limit + 1
+    cursor.execute(ASSET_LIFECYCLE_TIMELINE_QUERY.format(
+        where_sql=where_sql, direction=order.upper(), limit_sql=limit_sql), params)
+    timeline_events = cursor.fetchall()
+    cursor.close()
+
+    next_cursor = None
+    if paged:
+        timeline_events, next_cursor = paginate(
+            timeline_events, limit, lambda e: (e['event_date'], e['source'], e['source_id']))
+
+    current_assignment = None
+    if phone['current_worker_id']:
+        current_assignment = {
+            "full_name": phone['current_full_name'],
+            "worker_id": phone['current_worker_id'],
+            "secteur_name": phone['current_secteur_name'],
+            "phone_number": phone['current_phone_number'],
+        }
+
     response = {
         "phone_info": {
             "asset_tag": phone['asset_tag'],
@@ -3287,16 +5696,19 @@ def get_asset_lifecycle(identifier):
             "imei": phone['imei'],
             "manufacturer": phone['manufacturer'],
             "model": phone['model'],
-            "current_status": current_status,
-            "created_at": created_at_formatted
+            "current_status": phone['status'],
+            "created_at": phone['created_at']
         },
-        "current_assignment": dict(current_assignment) if current_assignment else None,
+        "current_assignment": current_assignment,
         "summary_stats": {
-            "total_assignments": total_assignments,
-            "total_support_tickets": total_tickets,
-            "timeline_events_count": len(timeline_events)
+            "total_assignments": phone['total_assignments'],
+            "total_support_tickets": phone['total_tickets'],
+            # Creation event, assignments and returns, tickets and resolutions, history entries
+            "timeline_events_count": 1 + phone['total_assignments'] + phone['returned_assignments']
+                + phone['total_tickets'] + phone['resolved_tickets'] + phone['history_events']
         },
-        "timeline": timeline_events
+        "timeline": timeline_events,
+        "next_cursor": next_cursor
     }
     
     return jsonify(response)
@@ -3354,8 +5766,545 @@ def admin_import():
     """Serves the CSV import wizard page."""
     return render_template('import.html')
 
-# Global storage for temporary CSV files and parsed data
-temp_csv_storage = {}
+# --- Upload Staging Store ---
+# Wizard uploads are spooled to disk under their upload ID, next to a small JSON
+# metadata file, so every gunicorn worker on the node can serve the follow-up
+# parse/process calls and no worker keeps whole files in memory. Metadata is
+# replaced atomically; a background thread sweeps uploads unused for the TTL.
+UPLOAD_STAGING_DIR = os.environ.get('UPLOAD_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'mobilefleet_uploads'))
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_MB', 50)) * 1024 * 1024
+UPLOAD_TTL_SECONDS = int(os.environ.get('UPLOAD_TTL_SECONDS', 3600))
+UPLOAD_SWEEP_INTERVAL = 300
+# Bytes kept from the start of an upload to guess its encoding and CSV dialect
+UPLOAD_SNIFF_BYTES = 64 * 1024
+UPLOAD_SNIFF_SEPARATORS = ';,\t|'
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Rows the wizard tokenizes for a preview; the rest is only counted as lines
+IMPORT_PREVIEW_ROWS = 5
+IMPORT_PREVIEW_MAX_ROWS = 100
+
+class UploadTooLarge(Exception):
+    pass
+
+def upload_path(upload_id, suffix):
+    """Returns the staging path for an upload, rejecting anything but a UUID."""
+    try:
+        upload_id = str(uuid.UUID(str(upload_id)))
+    except ValueError:
+        raise LookupError("Invalid or expired upload session.")
+    return os.path.join(UPLOAD_STAGING_DIR, f"{upload_id}.{suffix}")
+
+def _write_upload_meta(upload_id, meta):
+    path = upload_path(upload_id, 'json')
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_STAGING_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, path)
+
+def guess_encoding(sample, utf8_valid, c1_bytes=None):
+    """
+    Picks the upload encoding. UTF-8 is validated incrementally over the whole
+    stream while it is spooled; otherwise the 0x80-0x9F bytes decide between
+    Windows-1252 (they are printable there) and ISO-8859-1, which decodes any
+    byte. c1_bytes are those seen in the whole stream, when it was read; without
+    them the sample's are used.
+    """
+    if utf8_valid:
+        return 'utf-8-sig' if sample.startswith(codecs.BOM_UTF8) else 'utf-8'
+    undefined_cp1252 = {0x81, 0x8D, 0x8F, 0x90, 0x9D}
+    if c1_bytes is None:
+        c1_bytes = {b for b in sample if 0x80 <= b <= 0x9F}
+    if c1_bytes and not c1_bytes & undefined_cp1252:
+        return 'windows-1252'
+    return 'iso-8859-1'
+
+def decode_upload_sample(sample, encoding, truncated):
+    """Decodes a prefix sample, dropping the line cut off by its end when truncated."""
+    text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(sample)
+    if truncated:
+        text = text[:text.rfind('\n') + 1]
+    return text
+
+def estimate_data_rows(line_count, start_line):
+    """Data rows implied by a newline count: lines from start_line on, less the header."""
+    return max(line_count - start_line, 0)
+
+def sniff_csv_options(text):
+    """
+    Suggests wizard parse options from a decoded prefix: separator and text
+    delimiter via csv.Sniffer, and the first line whose field count matches
+    the bulk of the sample as start line (skipping title rows above the header).
+    """
+    lines = text.splitlines()[:50]
+    sample = '\n'.join(lines)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=UPLOAD_SNIFF_SEPARATORS)
+        separator, text_delimiter = dialect.delimiter, dialect.quotechar or '"'
+    except csv.Error:
+        counts = {sep: sample.count(sep) for sep in UPLOAD_SNIFF_SEPARATORS}
+        separator, text_delimiter = max(counts, key=counts.get) if any(counts.values()) else ';', '"'
+    start_line = 1
+    widths = [len(row) for row in csv.reader(lines, delimiter=separator, quotechar=text_delimiter)]
+    if widths:
+        typical = max(set(widths), key=widths.count)
+        start_line = next((i for i, width in enumerate(widths, 1) if width == typical), 1)
+    try:
+        has_header = csv.Sniffer().has_header('\n'.join(lines[start_line - 1:]))
+    except csv.Error:
+        has_header = True
+    return {
+        'separators': [separator],
+        'text_delimiter': text_delimiter,
+        'start_line': start_line,
+        'merge_separators': False,
+        'has_header': has_header,
+    }
+
+def delimiter_parse_options(suggested, delimiter):
+    """
+    Returns (separators, start_line) for a separator chosen in the wizard. The
+    sniffed start line skips title rows found with the sniffed separator, so it
+    only applies when the chosen separator is the sniffed one; otherwise parsing
+    starts at line 1. Used by both the preview and the import, so they agree.
+    """
+    if delimiter and [delimiter] != suggested['separators']:
+        return [delimiter], 1
+    return suggested['separators'], suggested['start_line']
+
+def stage_upload(file, user_id):
+    """
+    Spools an uploaded file to the staging directory in chunks and records its
+    metadata, with the encoding and parse options sniffed on the way through.
+    Raises UploadTooLarge past UPLOAD_MAX_BYTES.
+    """
+    os.makedirs(UPLOAD_STAGING_DIR, exist_ok=True)
+    ensure_background_thread('upload-sweeper', upload_sweeper_loop)
+    upload_id = str(uuid.uuid4())
+    data_path = upload_path(upload_id, 'data')
+    size = 0
+    line_count = 0
+    last_byte = b''
+    sample = b''
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    utf8_valid = True
+    # 0x80-0x9F bytes of the whole file: one Windows-1252 leaves undefined would
+    # fail the decode of a later chunk mid-import
+    c1_bytes = set()
+    not_c1 = bytes(range(0x80)) + bytes(range(0xA0, 0x100))
+    try:
+        with open(data_path, 'wb') as out:
+            while True:
+                chunk = file.stream.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise UploadTooLarge(f"File exceeds the {UPLOAD_MAX_BYTES // (1024 * 1024)} MB upload limit.")
+                out.write(chunk)
+                line_count += chunk.count(b'\n')
+                last_byte = chunk[-1:]
+                if len(sample) < UPLOAD_SNIFF_BYTES:
+                    sample += chunk[:UPLOAD_SNIFF_BYTES - len(sample)]
+                c1_bytes.update(chunk.translate(None, not_c1))
+                if utf8_valid:
+                    try:
+                        utf8.decode(chunk)
+                    except UnicodeDecodeError:
+                        utf8_valid = False
+        if utf8_valid:
+            try:
+                utf8.decode(b'', final=True)
+            except UnicodeDecodeError:
+                utf8_valid = False
+    except BaseException:
+        if os.path.exists(data_path):
+            os.remove(data_path)
+        raise
+    encoding = guess_encoding(sample, utf8_valid, c1_bytes)
+    text = decode_upload_sample(sample, encoding, size > len(sample))
+    if last_byte not in (b'', b'\n'):
+        line_count += 1
+    meta = {
+        'upload_id': upload_id,
+        'filename': file.filename,
+        'encoding': encoding,
+        'size': size,
+        'line_count': line_count,
+        'uploaded_at': time.time(),
+        'user_id': user_id,
+        'suggested_options': sniff_csv_options(text),
+    }
+    _write_upload_meta(upload_id, meta)
+    return meta
+
+def load_upload(upload_id, user_id):
+    """
+    Returns an upload's metadata. Raises LookupError when it is unknown or
+    expired and PermissionError when it belongs to another user.
+    """
+    meta_path = upload_path(upload_id, 'json')
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        last_used = os.path.getmtime(meta_path)
+    except (FileNotFoundError, json.JSONDecodeError):
+        raise LookupError("Invalid or expired upload session.")
+    if time.time() - last_used > UPLOAD_TTL_SECONDS:
+        delete_upload(upload_id)
+        raise LookupError("Invalid or expired upload session.")
+    if meta['user_id'] != user_id:
+        raise PermissionError("Access denied.")
+    touch_upload(upload_id)
+    return meta
+
+def update_upload(meta, **fields):
+    """Stores extra metadata (e.g. parse options) alongside an upload."""
+    meta.update(fields)
+    _write_upload_meta(meta['upload_id'], meta)
+    touch_upload(meta['upload_id'])
+    return meta
+
+def open_upload(meta):
+    """Opens a staged upload as a text stream in its detected encoding."""
+    return open(upload_path(meta['upload_id'], 'data'), encoding=meta['encoding'], newline='')
+
+def touch_upload(upload_id):
+    """Marks an upload as in use so the sweeper leaves it alone."""
+    for suffix in ('json', 'data'):
+        try:
+            os.utime(upload_path(upload_id, suffix))
+        except FileNotFoundError:
+            pass
+
+def delete_upload(upload_id):
+    for suffix in ('json', 'data'):
+        try:
+            os.remove(upload_path(upload_id, suffix))
+        except FileNotFoundError:
+            pass
+
+def sweep_uploads():
+    """
+    Removes staged uploads unused for the TTL, and stray temp files older than it.
+    An upload expires as a whole on the mtime of its metadata file, the clock
+    load_upload() goes by; its data file alone counts only while it is still
+    being spooled, before the metadata exists.
+    """
+    cutoff = time.time() - UPLOAD_TTL_SECONDS
+    removed = 0
+    try:
+        entries = list(os.scandir(UPLOAD_STAGING_DIR))
+    except FileNotFoundError:
+        return 0
+    uploads = {}
+    for entry in entries:
+        upload_id, _, suffix = entry.name.rpartition('.')
+        try:
+            is_upload = suffix in ('json', 'data') and upload_path(upload_id, suffix) == entry.path
+        except LookupError:
+            is_upload = False
+        try:
+            mtime = entry.stat().st_mtime
+            if is_upload:
+                uploads.setdefault(upload_id, {})[suffix] = mtime
+            elif mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    for upload_id, mtimes in uploads.items():
+        if mtimes.get('json', mtimes.get('data')) < cutoff:
+            delete_upload(upload_id)
+            removed += len(mtimes)
+    return removed
+
+def upload_sweeper_loop():
+    while True:
+        try:
+            removed = sweep_uploads()
+            if removed:
+                app.logger.info("Upload sweeper removed %d expired files", removed)
+        except Exception as e:
+            app.logger.error("Upload sweeper failed: %s", e, exc_info=True)
+        time.sleep(UPLOAD_SWEEP_INTERVAL)
+
+# --- Background Import Jobs ---
+# Imports run in a thread of the worker that accepted them, on their own database
+# connection, reading the staged upload. Rows are processed and committed in
+# chunks; each commit also records the job's progress, so rows_processed is a
+# safe resume offset. Status, cancellation and resume go through the import_jobs
+# row and therefore work from any worker. A run holds a session advisory lock on
+# (IMPORT_JOB_LOCK_KEY, job id) for as long as it lasts, so a job is never run
+# twice at once, and a job whose lock is free is not running anywhere (the lock
+# goes away with the connection if the worker dies).
+IMPORT_WIZARD_TABLES = ['phones', 'sim_cards', 'workers', 'users', 'secteurs', 'phone_numbers']
+IMPORT_JOB_CHUNK_ROWS = int(os.environ.get('IMPORT_JOB_CHUNK_ROWS', 5000))
+# Rows per multi-row VALUES statement in wizard imports
+IMPORT_BATCH_ROWS = int(os.environ.get('IMPORT_BATCH_ROWS', 500))
+IMPORT_JOB_LOCK_KEY = 3900
+# Rejected lines kept in the job details, with their reason
+IMPORT_JOB_MAX_REJECTIONS = 100
+
+def _bulk_job_reader(stream, job):
+    reader = csv.reader(stream)
+    return [h.strip() for h in next(reader, [])], reader
+
+def _bulk_job_chunk(cursor, job, headers, chunk):
+    inserted, updated, unchanged, rejections = bulk_import_chunk(
+        cursor, job['target_table'], headers, chunk, job['rows_processed'] + 1
+    )
+    if rejections:
+        kept = job['details'].setdefault('rejections', [])
+        kept.extend(rejections[:IMPORT_JOB_MAX_REJECTIONS - len(kept)])
+        cursor.execute("UPDATE import_jobs SET details = %s WHERE id = %s", (json.dumps(job['details']), job['id']))
+    return inserted, updated, unchanged, len(rejections)
+
+def _mapped_job_reader(stream, job):
+    rows = iter_csv_with_options(stream, **job['options']['parse_options'])
+    return next(rows, []), rows
+
+def _mapped_job_chunk(cursor, job, headers, chunk):
+    options = job['options']
+    if '_upsert' not in job:
+        # Prepared once per run; PREPARE outlives the chunk commits on this connection
+        job['_upsert'] = prepare_mapped_upsert(
+            cursor, job['target_table'], mapped_columns(headers, options['column_mappings']),
+            options.get('merge_key_db')
+        )
+    inserted, updated, unchanged = upsert_mapped_rows(cursor, job['_upsert'], headers, chunk, options['column_mappings'])
+    return inserted, updated, unchanged, 0
+
+def _multi_table_job_reader(stream, job):
+    # Rows come numbered with their line in the file, for the rejection report
+    rows = iter_csv_with_options(stream, **job['options']['parse_options'], line_numbers=True)
+    header = next(rows, None)
+    return (header[1] if header else []), rows
+
+def _multi_table_job_chunk(cursor, job, headers, chunk):
+    return multi_table_import_chunk(cursor, job, headers, chunk)
+
+# Job kind -> (reader returning (headers, row iterator), chunk processor returning
+# (inserted, updated, unchanged, rejected))
+IMPORT_JOB_KINDS = {
+    'bulk': (_bulk_job_reader, _bulk_job_chunk),
+    'mapped': (_mapped_job_reader, _mapped_job_chunk),
+    'multi_table': (_multi_table_job_reader, _multi_table_job_chunk),
+}
+
+def create_import_job(kind, upload, target_table, options=None):
+    """Records a queued import job for a staged upload and starts it."""
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute("""
+        INSERT INTO import_jobs (user_id, kind, target_table, upload_id, options, bytes_total)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        RETURNING *
+    """, (upload['user_id'], kind, target_table, upload['upload_id'], json.dumps(options or {}), upload['size']))
+    job = cursor.fetchone()
+    db.commit()
+    cursor.close()
+    start_import_job(job['id'])
+    app.logger.info("Import job %s (%s into %s) queued by user %s", job['id'], kind, target_table, session.get('username'))
+    return job
+
+def start_import_job(job_id):
+    ensure_background_thread(f'import-job-{job_id}', lambda: run_import_job(job_id))
+
+def run_import_job(job_id):
+    """Runs (or resumes) an import job, committing progress after every chunk."""
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'), cursor_factory=RealDictCursor)
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_try_advisory_lock(%s, %s) AS locked;", (IMPORT_JOB_LOCK_KEY, job_id))
+    if not cursor.fetchone()['locked']:
+        # Another run of this job is in progress; closing the connection is all there is to do
+        app.logger.info("Import job %s is already running elsewhere", job_id)
+        cursor.close()
+        conn.close()
+        return
+    try:
+        cursor.execute("""
+            UPDATE import_jobs
+            SET status = 'running', started_at = now(), updated_at = now(),
+                run_start_rows = rows_processed, error = NULL
+            WHERE id = %s
+            RETURNING *
+        """, (job_id,))
+        job = cursor.fetchone()
+        conn.commit()
+        read_rows, process_chunk = IMPORT_JOB_KINDS[job['kind']]
+        upload = load_upload(job['upload_id'], job['user_id'])
+
+        with open_upload(upload) as stream:
+            headers, rows = read_rows(stream, job)
+            # Skip what earlier runs already committed
+            for _ in itertools.islice(rows, job['rows_processed']):
+                pass
+            while True:
+                chunk = list(itertools.islice(rows, IMPORT_JOB_CHUNK_ROWS))
+                if not chunk:
+                    break
+                cursor.execute("SELECT cancel_requested FROM import_jobs WHERE id = %s", (job_id,))
+                if cursor.fetchone()['cancel_requested']:
+                    cursor.execute("""
+                        UPDATE import_jobs SET status = 'cancelled', updated_at = now(), finished_at = now()
+                        WHERE id = %s
+                    """, (job_id,))
+                    conn.commit()
+                    app.logger.info("Import job %s cancelled after %d rows", job_id, job['rows_processed'])
+                    return
+                inserted, updated, unchanged, rejected = process_chunk(cursor, job, headers, chunk)
+                cursor.execute("""
+                    UPDATE import_jobs
+                    SET rows_processed = rows_processed + %s, inserted = inserted + %s,
+                        updated = updated + %s, unchanged = unchanged + %s, rejected = rejected + %s,
+                        bytes_processed = %s, updated_at = now()
+                    WHERE id = %s
+                    RETURNING rows_processed
+                """, (len(chunk), inserted, updated, unchanged, rejected,
+                      min(stream.buffer.tell(), job['bytes_total']), job_id))
+                job['rows_processed'] = cursor.fetchone()['rows_processed']
+                conn.commit()
+                touch_upload(job['upload_id'])
+
+        cursor.execute("""
+            UPDATE import_jobs
+            SET status = 'completed', bytes_processed = bytes_total, updated_at = now(), finished_at = now()
+            WHERE id = %s
+        """, (job_id,))
+        conn.commit()
+        delete_upload(job['upload_id'])
+        app.logger.info("Import job %s completed: %d rows", job_id, job['rows_processed'])
+    except Exception as e:
+        conn.rollback()
+        app.logger.error("Import job %s failed: %s", job_id, e, exc_info=True)
+        cursor.execute("""
+            UPDATE import_jobs SET status = 'failed', error = %s, updated_at = now(), finished_at = now()
+            WHERE id = %s
+        """, (str(e), job_id))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+def import_job_summary(job):
+    """Public view of an import_jobs row, with throughput and ETA for running jobs."""
+    elapsed = job.get('elapsed_seconds') or 0
+    run_rows = job['rows_processed'] - job['run_start_rows']
+    rows_per_second = round(run_rows / elapsed, 1) if elapsed > 0 else None
+    progress = job['bytes_processed'] / job['bytes_total'] if job['bytes_total'] else None
+    if job['status'] == 'completed':
+        progress = 1.0
+    estimated_total_rows = None
+    eta_seconds = None
+    if progress and job['rows_processed']:
+        estimated_total_rows = round(job['rows_processed'] / progress)
+        if job['status'] == 'running' and rows_per_second:
+            eta_seconds = round(max(estimated_total_rows - job['rows_processed'], 0) / rows_per_second)
+    return {
+        "job_id": job['id'],
+        "kind": job['kind'],
+        "target_table": job['target_table'],
+        "status": job['status'],
+        "rows_processed": job['rows_processed'],
+        "resume_offset": job['rows_processed'],
+        "inserted": job['inserted'],
+        "updated": job['updated'],
+        "unchanged": job['unchanged'],
+        "rejected": job['rejected'],
+        "progress": round(progress, 4) if progress is not None else None,
+        "rows_per_second": rows_per_second,
+        "estimated_total_rows": estimated_total_rows,
+        "eta_seconds": eta_seconds,
+        "cancel_requested": job['cancel_requested'],
+        "error": job['error'],
+        "details": job['details'],
+        "created_at": job['created_at'],
+        "started_at": job['started_at'],
+        "finished_at": job['finished_at'],
+        "status_url": url_for('get_import_job', job_id=job['id']),
+    }
+
+def fetch_import_job(cursor, job_id):
+    """Loads a job owned by the current user; returns None when missing or not theirs."""
+    cursor.execute("""
+        SELECT *, EXTRACT(EPOCH FROM (COALESCE(finished_at, now()) - started_at))::float AS elapsed_seconds
+        FROM import_jobs
+        WHERE id = %s AND user_id = %s
+    """, (job_id, session['user_id']))
+    return cursor.fetchone()
+
+@app.route('/api/import/jobs/<int:job_id>', methods=['GET'])
+@login_required
+@role_required('Administrator')
+def get_import_job(job_id):
+    """Reports the state and progress of an import job."""
+    cursor = get_db().cursor()
+    job = fetch_import_job(cursor, job_id)
+    cursor.close()
+    if not job:
+        return jsonify({"error": "Import job not found."}), 404
+    return jsonify(import_job_summary(job))
+
+@app.route('/api/import/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+@role_required('Administrator')
+def cancel_import_job(job_id):
+    """Asks a queued or running job to stop before its next chunk."""
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute("""
+        UPDATE import_jobs SET cancel_requested = TRUE
+        WHERE id = %s AND user_id = %s AND status IN ('queued', 'running')
+    """, (job_id, session['user_id']))
+    db.commit()
+    job = fetch_import_job(cursor, job_id)
+    cursor.close()
+    if not job:
+        return jsonify({"error": "Import job not found."}), 404
+    return jsonify(import_job_summary(job))
+
+@app.route('/api/import/jobs/<int:job_id>/resume', methods=['POST'])
+@login_required
+@role_required('Administrator')
+def resume_import_job(job_id):
+    """Restarts a failed, cancelled or interrupted job from its last committed chunk."""
+    db = get_db()
+    cursor = db.cursor()
+    # Only a job whose run lock is free can be requeued: a queued or running job in
+    # that state was interrupted (its worker died), and a failed or cancelled one
+    # has let go of its connection
+    cursor.execute("SELECT pg_try_advisory_lock(%s, %s) AS locked;", (IMPORT_JOB_LOCK_KEY, job_id))
+    idle = cursor.fetchone()['locked']
+    if idle:
+        cursor.execute("SELECT pg_advisory_unlock(%s, %s);", (IMPORT_JOB_LOCK_KEY, job_id))
+    cursor.execute("""
+        UPDATE import_jobs
+        SET status = 'queued', cancel_requested = FALSE, finished_at = NULL, updated_at = now()
+        WHERE id = %s AND user_id = %s
+          AND status IN ('failed', 'cancelled', 'queued', 'running') AND %s
+        RETURNING id
+    """, (job_id, session['user_id'], idle))
+    resumed = cursor.fetchone()
+    db.commit()
+    job = fetch_import_job(cursor, job_id)
+    cursor.close()
+    if not job:
+        return jsonify({"error": "Import job not found."}), 404
+    if not resumed:
+        return jsonify({"error": "Only failed, cancelled or interrupted jobs can be resumed."}), 409
+    try:
+        load_upload(job['upload_id'], session['user_id'])
+    except LookupError:
+        cursor = db.cursor()
+        cursor.execute("""
+            UPDATE import_jobs SET status = 'failed', error = 'The staged upload has expired.', finished_at = now()
+            WHERE id = %s
+        """, (job_id,))
+        db.commit()
+        cursor.close()
+        return jsonify({"error": "The staged upload has expired; upload the file again."}), 410
+    start_import_job(job_id)
+    return jsonify(import_job_summary(job)), 202
 
 @app.route('/api/import/upload', methods=['POST'])
 @login_required
@@ -3370,56 +6319,24 @@ def import_upload_file():
         return jsonify({"error": "No file selected."}), 400
 
     try:
-        # Generate unique session ID for this upload
-        upload_id = str(uuid.uuid4())
-        
-        # Read file content
-        file_content = file.stream.read()
-        
-        # Try different encodings
-        content_str = None
-        encoding_used = None
-        for encoding in ['utf-8', 'utf-8-sig', 'iso-8859-1', 'windows-1252']:
-            try:
-                content_str = file_content.decode(encoding)
-                encoding_used = encoding
-                break
-            except UnicodeDecodeError:
-                continue
-        
-        if content_str is None:
-            return jsonify({"error": "Could not decode file. Please check the encoding."}), 400
-        
-        # Store in temporary storage
-        temp_csv_storage[upload_id] = {
-            'content': content_str,
-            'filename': file.filename,
-            'encoding': encoding_used,
-            'uploaded_at': time.time(),
-            'user_id': session['user_id']
-        }
-        
-        # Clean up old uploads (older than 1 hour)
-        current_time = time.time()
-        to_remove = [
-            key for key, value in temp_csv_storage.items() 
-            if current_time - value['uploaded_at'] > 3600
-        ]
-        for key in to_remove:
-            del temp_csv_storage[key]
+        # Spool the upload to the shared staging directory
+        meta = stage_upload(file, session['user_id'])
         
         # Get available tables
         allowed_tables = ['phones', 'sim_cards', 'workers', 'users', 'secteurs', 'phone_numbers']
         
         return jsonify({
-            "upload_id": upload_id,
+            "upload_id": meta['upload_id'],
             "filename": file.filename,
-            "encoding": encoding_used,
-            "file_size": len(content_str),
+            "encoding": meta['encoding'],
+            "file_size": meta['size'],
+            "suggested_options": meta['suggested_options'],
             "tables": allowed_tables,
             "message": "File uploaded successfully. Configure parsing options."
         })
         
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
     except Exception as e:
         app.logger.error(f"CSV upload failed: {str(e)}")
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
@@ -3430,55 +6347,70 @@ def import_upload_file():
 def import_parse_with_options():
     """Parse uploaded CSV with specific options and return preview."""
     data = request.get_json()
-    upload_id = data.get('upload_id')
-    
-    if not upload_id or upload_id not in temp_csv_storage:
-        return jsonify({"error": "Invalid or expired upload session."}), 400
     
-    # Verify user owns this upload
-    if temp_csv_storage[upload_id]['user_id'] != session['user_id']:
-        return jsonify({"error": "Access denied."}), 403
+    # Load the staged upload and verify the user owns it
+    try:
+        upload = load_upload(data.get('upload_id'), session['user_id'])
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 400
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
     
     try:
-        content = temp_csv_storage[upload_id]['content']
-        
-        # Parse options
-        separators = data.get('separators', [';'])
-        text_delimiter = data.get('text_delimiter', '"')
-        start_line = data.get('start_line', 1)
-        merge_separators = data.get('merge_separators', False)
-        
-        # Parse CSV with custom logic
-        parsed_data = parse_csv_with_options(
-            content, separators, text_delimiter, start_line, merge_separators
-        )
-        
-        if not parsed_data:
-            return jsonify({"error": "No data could be parsed with these options."}), 400
+        preview_rows = int(data.get('preview_rows', IMPORT_PREVIEW_ROWS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "preview_rows must be an integer"}), 400
+    if preview_rows < 1:
+        return jsonify({"error": "preview_rows must be a positive integer"}), 400
+    preview_rows = min(preview_rows, IMPORT_PREVIEW_MAX_ROWS)
+
+    try:
+        # Parse options, defaulting to what was sniffed at upload
+        suggested = upload.get('suggested_options', {})
+        separators = data.get('separators', suggested.get('separators', [';']))
+        text_delimiter = data.get('text_delimiter', suggested.get('text_delimiter', '"'))
+        start_line = data.get('start_line', suggested.get('start_line', 1))
+        merge_separators = data.get('merge_separators', suggested.get('merge_separators', False))
+        
+        # Tokenize only what the preview shows; the import job parses the rest
+        with open_upload(upload) as stream:
+            rows = iter_csv_with_options(
+                stream, separators, text_delimiter, start_line, merge_separators
+            )
+            headers = next(rows, None)
+            
+            if not headers:
+                return jsonify({"error": "No data could be parsed with these options."}), 400
+            
+            preview_data = []
+            for row_data in itertools.islice(rows, preview_rows + 1):
+                row_dict = {}
+                for i, header in enumerate(headers):
+                    row_dict[header] = row_data[i] if i < len(row_data) else ''
+                preview_data.append(row_dict)
+        
+        # A file that fits in the preview is counted exactly; otherwise the row
+        # count comes from the newlines counted at upload
+        total_rows_estimated = len(preview_data) > preview_rows
+        if total_rows_estimated:
+            preview_data = preview_data[:preview_rows]
+            total_rows = max(estimate_data_rows(upload['line_count'], start_line), preview_rows + 1)
+        else:
+            total_rows = len(preview_data)
         
-        # Store parsed result
-        temp_csv_storage[upload_id]['parsed_data'] = parsed_data
-        temp_csv_storage[upload_id]['parse_options'] = {
+        # Store the options; the import re-tokenizes the file as it goes
+        update_upload(upload, parse_options={
             'separators': separators,
             'text_delimiter': text_delimiter,
             'start_line': start_line,
             'merge_separators': merge_separators
-        }
-        
-        # Extract headers and preview
-        headers = parsed_data[0] if parsed_data else []
-        preview_data = []
-        
-        for row_data in parsed_data[1:6]:  # Skip header, take next 5
-            row_dict = {}
-            for i, header in enumerate(headers):
-                row_dict[header] = row_data[i] if i < len(row_data) else ''
-            preview_data.append(row_dict)
+        })
         
         return jsonify({
             "headers": headers,
             "preview_data": preview_data,
-            "total_rows": len(parsed_data) - 1,  # Exclude header
+            "total_rows": total_rows,  # Exclude header
+            "total_rows_estimated": total_rows_estimated,
             "columns_detected": len(headers),
             "parse_info": {
                 "separators_used": separators,
@@ -3492,55 +6424,115 @@ def import_parse_with_options():
         app.logger.error(f"CSV parsing failed: {str(e)}")
         return jsonify({"error": f"Parsing failed: {str(e)}"}), 500
 
-def parse_csv_with_options(content, separators, text_delimiter, start_line, merge_separators):
-    """Custom CSV parser with advanced options."""
-    lines = content.split('\n')[start_line - 1:]
-    result = []
-    
-    for line in lines:
-        if line.strip() == '':
-            continue
-            
-        row = []
-        current_field = ''
-        in_quotes = False
-        i = 0
-        
-        while i < len(line):
-            char = line[i]
-            
-            # Handle text delimiter (quotes)
-            if char == text_delimiter:
-                if not in_quotes:
-                    in_quotes = True
-                elif i + 1 < len(line) and line[i + 1] == text_delimiter:
-                    # Escaped quote
-                    current_field += text_delimiter
-                    i += 1  # Skip next quote
-                else:
-                    in_quotes = False
-            elif not in_quotes and char in separators:
-                # Found separator outside quotes
-                row.append(current_field.strip())
-                current_field = ''
-                
-                # Merge consecutive separators if option is enabled
-                if merge_separators:
-                    while i + 1 < len(line) and line[i + 1] in separators:
-                        i += 1
-            else:
-                current_field += char
-            
-            i += 1
-        
-        # Add the last field
-        row.append(current_field.strip())
-        
-        # Only add non-empty rows
-        if any(field.strip() for field in row):
-            result.append(row)
-    
-    return result
+# Lines a quoted field may span; past it an unterminated quote is taken to end
+# with its own line, so a stray quote cannot swallow the rest of the file
+CSV_MAX_QUOTED_LINES = 50
+
+def iter_csv_with_options(stream, separators, text_delimiter='"', start_line=1, merge_separators=False,
+                          line_numbers=False):
+    """
+    Lazily tokenizes CSV text from an iterable of lines (a file object or
+    io.StringIO), yielding one list of stripped fields per non-empty record,
+    or (line number in the file where the record starts, fields) with line_numbers.
+    Every path follows the wizard's quote rule: a text delimiter anywhere in a
+    field opens or closes quoting, a doubled one inside quotes is literal, and
+    the delimiters are dropped. Quoted fields may span up to
+    CSV_MAX_QUOTED_LINES lines. Records without a delimiter are split with
+    str.split when there is a single separator; the rest go through a compiled
+    regex scanner.
+    """
+    separators = [s for s in (separators or []) if s]
+    if not separators:
+        raise ValueError("At least one separator is required.")
+    start_line = max(int(start_line or 1), 1)
+    lines = enumerate(itertools.islice(stream, start_line - 1, None), start_line)
+    quote = text_delimiter or None
+    separator_re, field_re, unquote_re = _csv_scanner(separators, text_delimiter, merge_separators)
+    single_separator = separators[0] if len(separators) == 1 and not merge_separators else None
+    for line_no, record in _csv_records(lines, quote):
+        record = record.rstrip('\r\n')
+        if single_separator is not None and (quote is None or quote not in record):
+            row = [value.strip() for value in record.split(single_separator)]
+        else:
+            row = _scan_csv_record(record, separator_re, field_re, unquote_re, quote)
+        if any(row):
+            yield (line_no, row) if line_numbers else row
+
+def _csv_records(lines, quote):
+    """
+    Joins numbered physical lines, (line_no, line), into logical records
+    (line_no of the first, text): an odd number of text delimiters means a quoted
+    field continues on the next line. When the quote is still open after
+    CSV_MAX_QUOTED_LINES lines, or at the end of the file, its first line is a
+    record of its own and the lines after it are read again.
+    """
+    source = iter(lines)
+    replay = deque()
+    pending = []
+    quotes = 0
+    while True:
+        if replay:
+            numbered = replay.popleft()
+        else:
+            numbered = next(source, None)
+            if numbered is None:
+                if not pending:
+                    return
+                # The file ended inside an unterminated quote
+                yield pending[0]
+                replay.extendleft(reversed(pending[1:]))
+                pending, quotes = [], 0
+                continue
+        pending.append(numbered)
+        if quote:
+            quotes += numbered[1].count(quote)
+        if quotes % 2 == 0:
+            yield pending[0][0], ''.join(line for _, line in pending)
+            pending, quotes = [], 0
+        elif len(pending) >= CSV_MAX_QUOTED_LINES:
+            yield pending[0]
+            replay.extendleft(reversed(pending[1:]))
+            pending, quotes = [], 0
+
+def _csv_scanner(separators, text_delimiter, merge_separators):
+    """Compiles the separator, field and unquote patterns for iter_csv_with_options."""
+    separator = '|'.join(re.escape(s) for s in sorted(separators, key=len, reverse=True))
+    separator_re = re.compile(f"(?:{separator})+" if merge_separators else f"(?:{separator})")
+    if not text_delimiter:
+        return separator_re, None, None
+    q = re.escape(text_delimiter)
+    if len(text_delimiter) == 1:
+        quoted = f"{q}[^{q}]*(?:{q}{q}[^{q}]*)*(?:{q}|$)"
+        unquote_re = re.compile(f"{q}([^{q}]*(?:{q}{q}[^{q}]*)*){q}?")
+    else:
+        quoted = f"{q}(?:(?!{q}).|{q}{q})*(?:{q}|$)"
+        unquote_re = re.compile(f"{q}((?:(?!{q}).|{q}{q})*){q}?", re.S)
+    if all(len(s) == 1 for s in separators) and len(text_delimiter) == 1:
+        # Single-character separators: scan unquoted text in runs, not per character
+        excluded = re.escape(''.join(separators) + text_delimiter)
+        plain = f"[^{excluded}]+"
+    else:
+        plain = f"(?:(?!{separator}|{q}).)+"
+    field_re = re.compile(f"(?:{quoted}|{plain})*", re.S)
+    return separator_re, field_re, unquote_re
+
+def _scan_csv_record(record, separator_re, field_re, unquote_re, quote):
+    """Splits one logical record into stripped, unquoted fields."""
+    if field_re is None or quote not in record:
+        return [value.strip() for value in separator_re.split(record)]
+    row = []
+    pos = 0
+    while True:
+        field = field_re.match(record, pos)
+        value = field.group(0)
+        if unquote_re is not None and quote in value:
+            value = unquote_re.sub(lambda m: m.group(1).replace(quote * 2, quote), value)
+        row.append(value.strip())
+        pos = field.end()
+        separator = separator_re.match(record, pos)
+        if separator is None:
+            return row
+        pos = separator.end()
 
 @app.route('/api/import/process-uploaded', methods=['POST'])
 @login_required
@@ -3548,125 +6540,201 @@ def parse_csv_with_options(content, separators, text_delimiter, start_line, merg
 def import_process_uploaded():
     """Process uploaded CSV file for final import."""
     data = request.get_json()
-    upload_id = data.get('upload_id')
-    
-    if not upload_id or upload_id not in temp_csv_storage:
-        return jsonify({"error": "Invalid or expired upload session."}), 400
-        
-    # Verify user owns this upload
-    if temp_csv_storage[upload_id]['user_id'] != session['user_id']:
-        return jsonify({"error": "Access denied."}), 403
     
+    # Load the staged upload and verify the user owns it
     try:
-        stored_data = temp_csv_storage[upload_id]
-        parsed_data = stored_data.get('parsed_data')
-        
-        if not parsed_data:
-            return jsonify({"error": "No parsed data available. Please parse the file first."}), 400
-        
-        target_table = data.get('target_table')
-        column_mappings = data.get('column_mappings', {})
-        merge_key_csv = data.get('merge_key_csv')
-        merge_key_db = data.get('merge_key_db')
-        
-        # Validate required fields
-        if not target_table or not column_mappings:
-            return jsonify({"error": "Missing required fields: target_table and column_mappings"}), 400
-        
-        # Process the import using existing logic
-        result = process_csv_import(
-            parsed_data, target_table, column_mappings, merge_key_csv, merge_key_db
+        upload = load_upload(data.get('upload_id'), session['user_id'])
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 400
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    
+    parse_options = upload.get('parse_options')
+    if not parse_options:
+        return jsonify({"error": "No parsed data available. Please parse the file first."}), 400
+    
+    target_table = data.get('target_table')
+    column_mappings = data.get('column_mappings', {})
+    merge_key_db = data.get('merge_key_db')
+    
+    # Validate required fields
+    if not target_table or not column_mappings:
+        return jsonify({"error": "Missing required fields: target_table and column_mappings"}), 400
+    error = validate_column_mappings(target_table, column_mappings, merge_key_db)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    if data.get('dry_run'):
+        # Validate in a staging table and report; the upload stays for the real import
+        db = get_db()
+        cursor = db.cursor()
+        try:
+            with open_upload(upload) as stream:
+                rows = iter_csv_with_options(stream, **parse_options)
+                report = dry_run_mapped_import(
+                    cursor, target_table, next(rows, []), rows, column_mappings, merge_key_db
+                )
+        finally:
+            db.rollback()
+            cursor.close()
+        return jsonify(report)
+    
+    # The stored file is tokenized and imported row by row in a background job
+    job = create_import_job('mapped', upload, target_table, {
+        'parse_options': parse_options,
+        'column_mappings': column_mappings,
+        'merge_key_db': merge_key_db,
+    })
+    return jsonify(import_job_summary(job)), 202
+
+def validate_column_mappings(target_table, column_mappings, merge_key_db):
+    """Checks a wizard mapping against the target table; returns an error message or None."""
+    if target_table not in IMPORT_WIZARD_TABLES:
+        return f"Invalid target table: {target_table}"
+    cursor = get_db().cursor()
+    column_types = table_column_types(cursor, target_table)
+    cursor.close()
+    unknown = sorted(set(column_mappings.values()) - set(column_types))
+    if unknown:
+        return f"Unknown columns for {target_table}: {', '.join(unknown)}"
+    if merge_key_db and merge_key_db not in column_types:
+        return f"Unknown merge key for {target_table}: {merge_key_db}"
+    return None
+
+def mapped_row_values(headers, row, column_mappings):
+    """Applies a {csv header: db column} mapping to one parsed row; blanks become None."""
+    row_dict = {}
+    for i, header in enumerate(headers):
+        if header in column_mappings:
+            db_column = column_mappings[header]
+            value = row[i] if i < len(row) else ''
+            row_dict[db_column] = value.strip() if value else None
+    return row_dict
+
+def mapped_columns(headers, column_mappings):
+    """Target columns of a mapping, in file order, for the headers actually present."""
+    return list(dict.fromkeys(column_mappings[h] for h in headers if h in column_mappings))
+
+def prepare_mapped_upsert(cursor, target_table, columns, merge_key_db, batch_rows=None):
+    """
+    Compiles the wizard's upsert once per import: a server-side PREPAREd
+    INSERT ... SELECT over a multi-row VALUES list of batch_rows text rows.
+    Values are cast (or looked up by name) in SQL. Returns the statement spec
+    used by execute_mapped_batch.
+    """
+    if not columns:
+        raise ValueError("None of the mapped columns are present in the file.")
+    column_types = table_column_types(cursor, target_table)
+    width = len(columns)
+    batch_rows = max(1, min(batch_rows or IMPORT_BATCH_ROWS, 65535 // width))
+    select_list = ', '.join(
+        import_column_expr(target_table, col, column_types[col], f"s.{col}") for col in columns
+    )
+    update_columns = [col for col in columns if col != merge_key_db]
+    if merge_key_db in columns and update_columns:
+        # Rows whose mapped values already match are left alone
+        conflict = f"ON CONFLICT ({merge_key_db}) DO UPDATE SET " + ', '.join(
+            f"{col} = EXCLUDED.{col}" for col in update_columns
+        ) + (
+            f" WHERE ROW({', '.join(f'{target_table}.{col}' for col in update_columns)})"
+            f" IS DISTINCT FROM ROW({', '.join(f'EXCLUDED.{col}' for col in update_columns)})"
         )
-        
-        # Clean up the temporary data after successful import
-        if upload_id in temp_csv_storage:
-            del temp_csv_storage[upload_id]
-        
-        return jsonify(result)
-        
-    except Exception as e:
-        app.logger.error(f"CSV import processing failed: {str(e)}")
-        return jsonify({"error": f"Import failed: {str(e)}"}), 500
+    elif merge_key_db in columns:
+        # Only the merge key is mapped: insert new keys, leave existing rows alone
+        conflict = f"ON CONFLICT ({merge_key_db}) DO NOTHING"
+    else:
+        conflict = ""
+    upsert = {
+        'name': f"import_upsert_{uuid.uuid4().hex[:12]}",
+        'columns': columns,
+        'merge_key': merge_key_db if conflict else None,
+        'batch_rows': batch_rows,
+        'head': f"INSERT INTO {target_table} ({', '.join(columns)}) SELECT {select_list} FROM (VALUES ",
+        'tail': f") AS s ({', '.join(columns)}) {conflict} RETURNING (xmax = 0) AS is_insert",
+    }
+    numbered = ', '.join(
+        '(' + ', '.join(f"${i * width + j + 1}" for j in range(width)) + ')' for i in range(batch_rows)
+    )
+    cursor.execute(
+        f"PREPARE {upsert['name']} ({', '.join(['text'] * width * batch_rows)}) AS "
+        f"{upsert['head']}{numbered}{upsert['tail']}"
+    )
+    return upsert
 
-def process_csv_import(parsed_data, target_table, column_mappings, merge_key_csv, merge_key_db):
-    """Process CSV import with parsed data."""
-    allowed_tables = ['phones', 'sim_cards', 'workers', 'users', 'secteurs', 'phone_numbers']
-    if target_table not in allowed_tables:
-        raise ValueError(f"Invalid target table: {target_table}")
-    
-    headers = parsed_data[0]
-    data_rows = parsed_data[1:]
-    
+def execute_mapped_batch(cursor, upsert, batch):
+    """
+    Sends one batch of value lists; full batches use the prepared statement.
+    Returns (inserted, updated, unchanged): rows the upsert skipped return nothing.
+    """
+    params = [value for values in batch for value in values]
+    if len(batch) == upsert['batch_rows']:
+        cursor.execute(f"EXECUTE {upsert['name']} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        row_sql = '(' + ', '.join(['%s'] * len(upsert['columns'])) + ')'
+        cursor.execute(upsert['head'] + ', '.join([row_sql] * len(batch)) + upsert['tail'], params)
+    results = cursor.fetchall()
+    inserted = sum(1 for r in results if r['is_insert'])
+    return inserted, len(results) - inserted, len(batch) - len(results)
+
+def upsert_mapped_rows(cursor, upsert, headers, rows, column_mappings):
+    """
+    Writes parsed CSV rows through a {csv header: db column} mapping in batches,
+    upserting on the merge key when it is mapped. A key repeated inside a batch
+    starts a new batch, since one INSERT cannot update the same row twice.
+    Returns (inserted, updated, unchanged).
+    """
     inserted = 0
     updated = 0
-    
-    db = get_db()
-    cursor = db.cursor()
-    
-    try:
-        for row in data_rows:
-            # Create data dictionary
-            row_dict = {}
-            for i, header in enumerate(headers):
-                if header in column_mappings:
-                    db_column = column_mappings[header]
-                    value = row[i] if i < len(row) else ''
-                    row_dict[db_column] = value.strip() if value else None
-            
-            if not row_dict:
-                continue
-            
-            # Build UPSERT query
-            columns = list(row_dict.keys())
-            placeholders = ['%s'] * len(columns)
-            values = list(row_dict.values())
-            
-            if merge_key_db and merge_key_db in row_dict:
-                # UPSERT logic
-                set_clause = ', '.join([f"{col} = EXCLUDED.{col}" for col in columns if col != merge_key_db])
-                upsert_query = f"""
-                    INSERT INTO {target_table} ({', '.join(columns)})
-                    VALUES ({', '.join(placeholders)})
-                    ON CONFLICT ({merge_key_db}) 
-                    DO UPDATE SET {set_clause}
-                    RETURNING (xmax = 0) as is_insert
-                """
-                
-                cursor.execute(upsert_query, values)
-                result = cursor.fetchone()
-                
-                if result and result[0]:
-                    inserted += 1
-                else:
-                    updated += 1
-            else:
-                # Simple insert
-                insert_query = f"""
-                    INSERT INTO {target_table} ({', '.join(columns)})
-                    VALUES ({', '.join(placeholders)})
-                """
-                cursor.execute(insert_query, values)
-                inserted += 1
-        
-        db.commit()
-        
-        return {
-            "message": f"Successfully processed {inserted + updated} rows.",
-            "inserted": inserted,
-            "updated": updated
-        }
-        
-    except Exception as e:
-        db.rollback()
-        raise e
-    finally:
-        cursor.close()
+    unchanged = 0
+    columns = upsert['columns']
+    merge_key = upsert['merge_key']
+    key_index = columns.index(merge_key) if merge_key else None
+    batch = []
+    batch_keys = set()
+    
+    def flush():
+        nonlocal inserted, updated, unchanged
+        if batch:
+            batch_inserted, batch_updated, batch_unchanged = execute_mapped_batch(cursor, upsert, batch)
+            inserted += batch_inserted
+            updated += batch_updated
+            unchanged += batch_unchanged
+            batch.clear()
+            batch_keys.clear()
+    
+    for row in rows:
+        row_dict = mapped_row_values(headers, row, column_mappings)
+        values = [row_dict[col] for col in columns]
+        if key_index is not None and values[key_index] is not None:
+            if values[key_index] in batch_keys:
+                flush()
+            batch_keys.add(values[key_index])
+        batch.append(values)
+        if len(batch) >= upsert['batch_rows']:
+            flush()
+    flush()
+    
+    return inserted, updated, unchanged
+
+def dry_run_mapped_import(cursor, target_table, headers, rows, column_mappings, merge_key_db):
+    """Dry run of a wizard import: maps each parsed row onto the db columns first."""
+    columns = mapped_columns(headers, column_mappings)
+    mapped_rows = (
+        [row_dict.get(col) or '' for col in columns]
+        for row_dict in (mapped_row_values(headers, row, column_mappings) for row in rows)
+    )
+    key_column = merge_key_db if merge_key_db in columns else None
+    return dry_run_import(cursor, target_table, columns, mapped_rows, key_column, keep_blank=False)
 
 @app.route('/api/import/preview', methods=['POST'])
 @login_required
 @role_required('Administrator')
 def import_preview():
-    """Handles CSV upload, reads headers and first 5 rows for preview."""
+    """
+    Handles CSV upload and returns headers and the first rows for preview.
+    Only a prefix sample is decoded and tokenized, in the posted encoding and
+    delimiter (sniffed when absent); the rest of the file is just line-counted.
+    """
     if 'file' not in request.files:
         return jsonify({"error": "No file part in the request."}), 400
     file = request.files['file']
@@ -3674,22 +6742,45 @@ def import_preview():
         return jsonify({"error": "No file selected."}), 400
 
     try:
-        import csv
-        import io
+        sample = file.stream.read(UPLOAD_SNIFF_BYTES)
+        line_count = sample.count(b'\n')
+        last_byte = sample[-1:]
+        truncated = False
+        for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_BYTES), b''):
+            truncated = True
+            line_count += chunk.count(b'\n')
+            last_byte = chunk[-1:]
+        if last_byte not in (b'', b'\n'):
+            line_count += 1
+
+        encoding = request.form.get('encoding')
+        if encoding:
+            try:
+                codecs.lookup(encoding)
+            except LookupError:
+                return jsonify({"error": f"Unknown encoding: {encoding}"}), 400
+        else:
+            try:
+                codecs.getincrementaldecoder('utf-8')().decode(sample)
+                utf8_valid = True
+            except UnicodeDecodeError:
+                utf8_valid = False
+            encoding = guess_encoding(sample, utf8_valid)
+        text = decode_upload_sample(sample, encoding, truncated)
 
-        # Read the file into memory
-        file_content = file.stream.read().decode('utf-8')
-        file.stream.seek(0) # Reset stream for full read later if needed
+        suggested = sniff_csv_options(text)
+        separators, start_line = delimiter_parse_options(suggested, request.form.get('delimiter'))
+        blanks_as_null = is_truthy(request.form.get('blanks_as_null', 'false'))
 
-        # Use DictReader to get headers and preview data
-        reader = csv.DictReader(io.StringIO(file_content))
-        headers = reader.fieldnames
-        
+        rows = iter_csv_with_options(io.StringIO(text), separators, suggested['text_delimiter'], start_line)
+        headers = next(rows, [])
         preview_data = []
-        for i, row in enumerate(reader):
-            if i >= 5:
-                break
-            preview_data.append(row)
+        for row in itertools.islice(rows, IMPORT_PREVIEW_ROWS):
+            values = [row[i] if i < len(row) else '' for i in range(len(headers))]
+            preview_data.append({
+                header: None if blanks_as_null and value == '' else value
+                for header, value in zip(headers, values)
+            })
 
         # Get available table names from the database
         db = get_db()
@@ -3705,6 +6796,10 @@ def import_preview():
         return jsonify({
             "headers": headers,
             "preview_data": preview_data,
+            "total_rows": estimate_data_rows(line_count, start_line),
+            "total_rows_estimated": True,
+            "encoding": encoding,
+            "separators": separators,
             "tables": tables
         })
 
@@ -3793,89 +6888,371 @@ def import_process():
     mappings = data['column_mappings']
     
     # Security: Whitelist tables again on the processing endpoint
-    allowed_tables = ['phones', 'sim_cards', 'workers', 'users', 'secteurs', 'phone_numbers']
-    if target_table not in allowed_tables:
+    if target_table not in IMPORT_WIZARD_TABLES:
         return jsonify({"error": "Invalid target table for import."}), 400
 
     if not mappings or not merge_key_db:
         return jsonify({"error": "A merge key and at least one mapped column are required."}), 400
+    error = validate_column_mappings(target_table, mappings, merge_key_db)
+    if error:
+        return jsonify({"error": error}), 400
 
-    import csv
-    import io
-    
-    db = get_db()
-    cursor = db.cursor()
-    
+    if data.get('dry_run'):
+        db = get_db()
+        cursor = db.cursor()
+        try:
+            rows = iter_csv_with_options(io.StringIO(data['csv_data']), [','])
+            report = dry_run_mapped_import(cursor, target_table, next(rows, []), rows, mappings, merge_key_db)
+        finally:
+            db.rollback()
+            cursor.close()
+        return jsonify(report)
+
+    # Stage the posted CSV text like an upload and import it in a background job
     try:
-        reader = csv.DictReader(io.StringIO(data['csv_data']))
-        inserted_count = 0
-        updated_count = 0
+        upload = stage_upload(
+            FileStorage(stream=io.BytesIO(data['csv_data'].encode('utf-8')), filename='import.csv'),
+            session['user_id']
+        )
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    job = create_import_job('mapped', upload, target_table, {
+        'parse_options': {'separators': [','], 'text_delimiter': '"', 'start_line': 1, 'merge_separators': False},
+        'column_mappings': mappings,
+        'merge_key_db': merge_key_db,
+    })
+    return jsonify(import_job_summary(job)), 202
+
+# --- Multi-Table HR Import ---
+# The monthly HR/IT export carries, per line, a worker, their rh_data, their
+# sector by name and the phone/SIM they hold. Sector names, worker ids, asset
+# tags, IMEIs and ICCIDs are resolved through in-memory lookups loaded once per
+# job run; each chunk then writes workers -> rh_data -> assignments, in that
+# order, inside the chunk's transaction. A line that cannot be resolved is
+# rejected as a whole.
+
+# Import field -> (table, column) it is written to or resolved through
+MULTI_TABLE_IMPORT_FIELDS = {
+    'worker_id': ('workers', 'worker_id'),
+    'full_name': ('workers', 'full_name'),
+    'secteur_name': ('secteurs', 'secteur_name'),
+    'id_philia': ('rh_data', 'id_philia'),
+    'mdp_philia': ('rh_data', 'mdp_philia'),
+    'contract_type': ('rh_data', 'contract_type'),
+    'contract_end_date': ('rh_data', 'contract_end_date'),
+    'asset_tag': ('phones', 'asset_tag'),
+    'imei': ('phones', 'imei'),
+    'iccid': ('sim_cards', 'iccid'),
+}
+RH_DATA_IMPORT_COLUMNS = ('id_philia', 'mdp_philia', 'contract_type', 'contract_end_date')
+# Layouts accepted for contract_end_date
+IMPORT_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y')
+
+def parse_import_date(value):
+    from datetime import datetime
+    for date_format in IMPORT_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+def load_multi_table_lookups(cursor):
+    """Natural key -> id hash maps for one job run, plus the varchar limits per field."""
+    cursor.execute("SELECT id, secteur_name FROM secteurs")
+    sectors = {r['secteur_name'].strip().casefold(): r['id'] for r in cursor.fetchall()}
+    cursor.execute("SELECT id, worker_id FROM workers")
+    workers = {r['worker_id']: r['id'] for r in cursor.fetchall()}
+    # A phone's SIM is the one registered on it, else the one it is assigned with
+    cursor.execute("""
+        SELECT p.id, p.asset_tag, p.imei, COALESCE(p.sim_card_id, a.sim_card_id) AS sim_card_id
+        FROM phones p
+        LEFT JOIN assignments a ON a.phone_id = p.id AND a.return_date IS NULL
+    """)
+    phones_by_tag = {}
+    phones_by_imei = {}
+    for r in cursor.fetchall():
+        phones_by_tag[r['asset_tag']] = phones_by_imei[r['imei']] = (r['id'], r['sim_card_id'])
+    cursor.execute("SELECT id, iccid FROM sim_cards")
+    sims = {r['iccid']: r['id'] for r in cursor.fetchall()}
+    rules = {table: import_column_rules(cursor, table) for table in ('workers', 'rh_data')}
+    max_lengths = {
+        field: rules[table][column]['max_length']
+        for field, (table, column) in MULTI_TABLE_IMPORT_FIELDS.items()
+        if table in rules and rules[table][column]['max_length']
+    }
+    return {
+        'sectors': sectors,
+        'workers': workers,
+        'phones_by_tag': phones_by_tag,
+        'phones_by_imei': phones_by_imei,
+        'sims': sims,
+        'max_lengths': max_lengths,
+    }
 
-        for row in reader:
-            # --- Dynamic SQL Generation (Safe with Parameterization) ---
-            
-            # Filter out the merge key from the update set
-            update_mappings = {k: v for k, v in mappings.items() if v != merge_key_db}
-            
-            insert_cols = ", ".join(mappings.values())
-            insert_placeholders = ", ".join(["%s"] * len(mappings))
-            
-            # Values for INSERT
-            insert_values = [row.get(csv_col) for csv_col in mappings.keys()]
-            
-            # Build the query based on whether we have update mappings
-            if update_mappings:
-                # We have columns to update
-                set_clause = ", ".join([f"{db_col} = %s" for db_col in update_mappings.values()])
-                update_values = [row.get(csv_col) for csv_col in update_mappings.keys()]
-                
-                query = f"""
-                    INSERT INTO {target_table} ({insert_cols})
-                    VALUES ({insert_placeholders})
-                    ON CONFLICT ({merge_key_db}) DO UPDATE
-                    SET {set_clause}
-                    RETURNING (xmax = 0) AS inserted;
-                """
-                
-                # Combine all values for the final execution
-                final_values = tuple(insert_values + update_values)
-            else:
-                # Only merge key, so just do INSERT ... ON CONFLICT DO NOTHING
-                query = f"""
-                    INSERT INTO {target_table} ({insert_cols})
-                    VALUES ({insert_placeholders})
-                    ON CONFLICT ({merge_key_db}) DO NOTHING;
-                """
-                
-                final_values = tuple(insert_values)
-            
-            cursor.execute(query, final_values)
-            
-            # Handle result based on query type
-            if update_mappings:
-                result = cursor.fetchone()
-                if result and (result[0] if isinstance(result, tuple) else result.get('inserted')):
-                    inserted_count += 1
-                else:
-                    updated_count += 1
-            else:
-                # For DO NOTHING, we check if any row was affected
-                if cursor.rowcount > 0:
-                    inserted_count += 1
-                # If no rows affected, it means the record already existed (conflict)
+def resolve_multi_table_row(values, lookups):
+    """
+    Resolves one mapped line against the lookups. Returns (record, None), with
+    secteur_id, contract_end_date, phone_id and sim_card_id resolved, or
+    (None, reason) when the line must be rejected.
+    """
+    worker_key = values.get('worker_id')
+    if not worker_key:
+        return None, "Missing worker_id."
+    for field, max_length in lookups['max_lengths'].items():
+        if values.get(field) and len(values[field]) > max_length:
+            return None, f"{field} is longer than {max_length} characters."
+    record = {field: values.get(field) for field in MULTI_TABLE_IMPORT_FIELDS}
+
+    record['secteur_id'] = None
+    if record['secteur_name']:
+        record['secteur_id'] = lookups['sectors'].get(record['secteur_name'].casefold())
+        if record['secteur_id'] is None:
+            return None, f"Unknown sector: {record['secteur_name']}"
+    if worker_key not in lookups['workers'] and not (record['full_name'] and record['secteur_id']):
+        return None, f"New worker {worker_key} needs full_name and secteur_name."
+
+    if record['contract_end_date']:
+        end_date = parse_import_date(record['contract_end_date'])
+        if end_date is None:
+            return None, f"Invalid contract_end_date: {record['contract_end_date']}"
+        record['contract_end_date'] = end_date
+
+    phone = None
+    if record['asset_tag']:
+        phone = lookups['phones_by_tag'].get(record['asset_tag'])
+        if phone is None:
+            return None, f"Unknown asset tag: {record['asset_tag']}"
+    elif record['imei']:
+        phone = lookups['phones_by_imei'].get(record['imei'])
+        if phone is None:
+            return None, f"Unknown IMEI: {record['imei']}"
+    sim_card_id = None
+    if record['iccid']:
+        sim_card_id = lookups['sims'].get(record['iccid'])
+        if sim_card_id is None:
+            return None, f"Unknown ICCID: {record['iccid']}"
+
+    record['phone_id'] = None
+    record['sim_card_id'] = None
+    if phone:
+        # Without an ICCID the phone keeps its current SIM
+        record['phone_id'], record['sim_card_id'] = phone[0], sim_card_id or phone[1]
+        if record['sim_card_id'] is None:
+            return None, f"Phone {record['asset_tag'] or record['imei']} has no SIM card; give its ICCID."
+    elif sim_card_id:
+        return None, "An ICCID needs the phone's asset_tag or imei to create an assignment."
+    return record, None
+
+def multi_table_import_chunk(cursor, job, headers, rows):
+    """
+    Imports one chunk of an HR export, given as (line number, fields) rows, in
+    dependency order: workers, then rh_data, then assignments. Returns (inserted,
+    updated, unchanged, rejected) for the worker rows; per-table counts and
+    rejected lines accumulate in the job's details, committed with the chunk.
+    """
+    if '_lookups' not in job:
+        job['_lookups'] = load_multi_table_lookups(cursor)
+    lookups = job['_lookups']
+    details = job['details']
+    column_mappings = job['options']['column_mappings']
+
+    # One record per worker: later lines win, blank fields keep earlier values
+    records = {}
+    rejected = 0
+    for line, row in rows:
+        record, reason = resolve_multi_table_row(mapped_row_values(headers, row, column_mappings), lookups)
+        if reason:
+            rejected += 1
+            rejections = details.setdefault('rejections', [])
+            if len(rejections) < IMPORT_JOB_MAX_REJECTIONS:
+                rejections.append({"row": line, "reason": reason})
+            continue
+        merged = records.pop(record['worker_id'], {})
+        merged.update((field, value) for field, value in record.items() if value is not None)
+        records[record['worker_id']] = merged
+
+    counts = defaultdict(int)
+    if records:
+        # 1. Workers; the proposed row falls back to the stored values so an
+        # update may leave full_name or the sector blank
+        results = execute_values(cursor, """
+            INSERT INTO workers (worker_id, full_name, secteur_id, status)
+            SELECT v.worker_id, COALESCE(v.full_name, w.full_name),
+                   COALESCE(v.secteur_id::integer, w.secteur_id), COALESCE(w.status, 'Active')
+            FROM (VALUES %s) AS v (worker_id, full_name, secteur_id)
+            LEFT JOIN workers w ON w.worker_id = v.worker_id
+            ON CONFLICT (worker_id) DO UPDATE SET
+                full_name = EXCLUDED.full_name,
+                secteur_id = EXCLUDED.secteur_id
+            WHERE (workers.full_name, workers.secteur_id) IS DISTINCT FROM (EXCLUDED.full_name, EXCLUDED.secteur_id)
+            RETURNING id, worker_id, (xmax = 0) AS is_insert
+        """, [(r['worker_id'], r.get('full_name'), r.get('secteur_id')) for r in records.values()],
+            page_size=IMPORT_BATCH_ROWS, fetch=True)
+        # Unchanged workers return nothing; their ids are already in the lookup
+        for r in results:
+            lookups['workers'][r['worker_id']] = r['id']
+            counts['workers_inserted' if r['is_insert'] else 'workers_updated'] += 1
+        counts['workers_unchanged'] += len(records) - len(results)
+
+        # 2. rh_data, one row per worker
+        rh_rows = [
+            (lookups['workers'][r['worker_id']],) + tuple(r.get(c) for c in RH_DATA_IMPORT_COLUMNS)
+            for r in records.values() if any(r.get(c) is not None for c in RH_DATA_IMPORT_COLUMNS)
+        ]
+        if rh_rows:
+            results = execute_values(cursor, """
+                INSERT INTO rh_data (worker_id, id_philia, mdp_philia, contract_type, contract_end_date)
+                SELECT v.worker_id, v.id_philia, v.mdp_philia, v.contract_type, v.contract_end_date::date
+                FROM (VALUES %s) AS v (worker_id, id_philia, mdp_philia, contract_type, contract_end_date)
+                ON CONFLICT (worker_id) DO UPDATE SET
+                    id_philia = COALESCE(EXCLUDED.id_philia, rh_data.id_philia),
+                    mdp_philia = COALESCE(EXCLUDED.mdp_philia, rh_data.mdp_philia),
+                    contract_type = COALESCE(EXCLUDED.contract_type, rh_data.contract_type),
+                    contract_end_date = COALESCE(EXCLUDED.contract_end_date, rh_data.contract_end_date)
+                WHERE (rh_data.id_philia, rh_data.mdp_philia, rh_data.contract_type, rh_data.contract_end_date)
+                    IS DISTINCT FROM (
+                        COALESCE(EXCLUDED.id_philia, rh_data.id_philia),
+                        COALESCE(EXCLUDED.mdp_philia, rh_data.mdp_philia),
+                        COALESCE(EXCLUDED.contract_type, rh_data.contract_type),
+                        COALESCE(EXCLUDED.contract_end_date, rh_data.contract_end_date))
+                RETURNING (xmax = 0) AS is_insert
+            """, rh_rows, page_size=IMPORT_BATCH_ROWS, fetch=True)
+            for r in results:
+                counts['rh_data_inserted' if r['is_insert'] else 'rh_data_updated'] += 1
+            counts['rh_data_unchanged'] += len(rh_rows) - len(results)
+
+        # 3. Assignments: (phone, sim, worker), the last line wins for a phone or a SIM
+        by_phone = {
+            r['phone_id']: (r['phone_id'], r['sim_card_id'], lookups['workers'][r['worker_id']])
+            for r in records.values() if r.get('phone_id')
+        }
+        wanted = list({a[1]: a for a in by_phone.values()}.values())
+        if wanted:
+            counts.update(apply_import_assignments(cursor, job, wanted))
 
-        db.commit()
-        cursor.close()
-        return jsonify({
-            "message": "Import completed successfully!",
-            "inserted": inserted_count,
-            "updated": updated_count
-        })
+    for key, value in counts.items():
+        details[key] = details.get(key, 0) + value
+    cursor.execute("UPDATE import_jobs SET details = %s WHERE id = %s", (json.dumps(details), job['id']))
+    return counts['workers_inserted'], counts['workers_updated'], counts['workers_unchanged'], rejected
 
-    except Exception as e:
-        db.rollback()
-        cursor.close()
-        return jsonify({"error": f"An error occurred during import: {str(e)}"}), 500
+def apply_import_assignments(cursor, job, wanted):
+    """
+    Makes each (phone_id, sim_card_id, worker_id) the open assignment of its
+    phone, SIM and worker. Assignments already in place are left untouched;
+    others involving the same phone, SIM or worker are closed first.
+    """
+    cursor.execute("""
+        SELECT id, phone_id, sim_card_id, worker_id FROM assignments
+        WHERE return_date IS NULL
+          AND (phone_id = ANY(%s) OR sim_card_id = ANY(%s) OR worker_id = ANY(%s))
+    """, ([a[0] for a in wanted], [a[1] for a in wanted], [a[2] for a in wanted]))
+    current = cursor.fetchall()
+    held = {(a['phone_id'], a['sim_card_id'], a['worker_id']) for a in current}
+    new = [a for a in wanted if a not in held]
+    counts = {'assignments_unchanged': len(wanted) - len(new)}
+    if not new:
+        return counts
+
+    new_phones = {a[0] for a in new}
+    new_sims = {a[1] for a in new}
+    new_workers = {a[2] for a in new}
+    closing = [
+        a for a in current
+        if a['phone_id'] in new_phones or a['sim_card_id'] in new_sims or a['worker_id'] in new_workers
+    ]
+    history = []
+    if closing:
+        cursor.execute("UPDATE assignments SET return_date = now() WHERE id = ANY(%s)", ([a['id'] for a in closing],))
+        released_phones = [a['phone_id'] for a in closing if a['phone_id'] not in new_phones]
+        released_sims = [a['sim_card_id'] for a in closing if a['sim_card_id'] not in new_sims]
+        cursor.execute("UPDATE phones SET status = 'In Stock' WHERE id = ANY(%s)", (released_phones,))
+        cursor.execute("UPDATE sim_cards SET status = 'In Stock' WHERE id = ANY(%s)", (released_sims,))
+        for a in closing:
+            history.append(('Phone', a['phone_id'], 'Returned', job['user_id'],
+                            f"Asset returned from worker ID {a['worker_id']} (import job {job['id']})."))
+            history.append(('SIM', a['sim_card_id'], 'Returned', job['user_id'],
+                            f"SIM returned from worker ID {a['worker_id']} (import job {job['id']})."))
+
+    execute_values(cursor, """
+        INSERT INTO assignments (phone_id, sim_card_id, worker_id, assignment_date) VALUES %s
+    """, new, template="(%s, %s, %s, now())", page_size=IMPORT_BATCH_ROWS)
+    cursor.execute("UPDATE phones SET status = 'In Use' WHERE id = ANY(%s)", (list(new_phones),))
+    cursor.execute("UPDATE sim_cards SET status = 'In Use' WHERE id = ANY(%s)", (list(new_sims),))
+    for phone_id, sim_card_id, worker_id in new:
+        history.append(('Phone', phone_id, 'Assigned', job['user_id'],
+                        f"Assigned to worker ID {worker_id} (import job {job['id']})."))
+        history.append(('SIM', sim_card_id, 'Assigned', job['user_id'],
+                        f"Assigned to worker ID {worker_id} with phone ID {phone_id} (import job {job['id']})."))
+    execute_values(cursor, """
+        INSERT INTO asset_history_log (asset_type, asset_id, event_type, user_id, details) VALUES %s
+    """, history, page_size=IMPORT_BATCH_ROWS)
+
+    counts['assignments_created'] = len(new)
+    counts['assignments_closed'] = len(closing)
+    return counts
+
+@app.route('/api/import/multi-table', methods=['POST'])
+@login_required
+@role_required('Administrator')
+def import_multi_table():
+    """Queues a multi-table import of an HR export: workers, rh_data and assignments."""
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part in the request."}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No file selected."}), 400
+
+    # {csv header: import field}
+    try:
+        column_mappings = json.loads(request.form.get('column_mappings') or '{}')
+    except ValueError:
+        return jsonify({"error": "column_mappings must be a JSON object."}), 400
+    if not isinstance(column_mappings, dict) or not column_mappings:
+        return jsonify({"error": "column_mappings must map at least one CSV column."}), 400
+    unknown = sorted(set(column_mappings.values()) - set(MULTI_TABLE_IMPORT_FIELDS))
+    if unknown:
+        return jsonify({"error": f"Unsupported import fields: {', '.join(unknown)}"}), 400
+    if 'worker_id' not in column_mappings.values():
+        return jsonify({"error": "A CSV column must be mapped to worker_id."}), 400
+    encoding = request.form.get('encoding')
+    if encoding:
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            return jsonify({"error": f"Unknown encoding: {encoding}"}), 400
+
+    try:
+        upload = stage_upload(file, session['user_id'])
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    # Sniffed options, unless the wizard chose the encoding or separator
+    suggested = upload['suggested_options']
+    separators, start_line = delimiter_parse_options(suggested, request.form.get('delimiter'))
+    parse_options = {
+        'separators': separators,
+        'text_delimiter': suggested['text_delimiter'],
+        'start_line': start_line,
+        'merge_separators': suggested['merge_separators'],
+    }
+    if encoding:
+        update_upload(upload, encoding=encoding)
+    try:
+        with open_upload(upload) as stream:
+            headers = next(iter_csv_with_options(stream, **parse_options), [])
+    except UnicodeDecodeError as e:
+        delete_upload(upload['upload_id'])
+        return jsonify({"error": "The CSV file does not match the selected encoding.", "details": str(e)}), 400
+    missing = [h for h in column_mappings if h not in headers]
+    if missing:
+        delete_upload(upload['upload_id'])
+        return jsonify({"error": f"Mapped columns not found in the file: {', '.join(missing)}"}), 400
+
+    job = create_import_job('multi_table', upload, None, {
+        'parse_options': parse_options,
+        'column_mappings': column_mappings,
+    })
+    return jsonify(import_job_summary(job)), 202
 
 @app.route('/api/admin/migrate_timestamps', methods=['POST'])
 @login_required
@@ -3984,10 +7361,6 @@ def get_phone_history(phone_id):
     history = cursor.fetchall()
     cursor.close()
 
-    for item in history:
-        if item.get('event_timestamp'):
-            item['event_timestamp'] = item['event_timestamp'].isoformat()
-
     return jsonify(history)
 
 
@@ -4011,7 +7384,7 @@ def get_worker_history(worker_id):
         ORDER BY t.created_at DESC;
     """
     cursor.execute(ticket_history_query, (worker_id,))
-    ticket_history_raw = cursor.fetchall()
+    ticket_history = cursor.fetchall()
     
     # Query for all phone assignments (past and present) for this worker
     assignment_history_query = """
@@ -4022,27 +7395,10 @@ def get_worker_history(worker_id):
         ORDER BY a.assignment_date DESC;
     """
     cursor.execute(assignment_history_query, (worker_id,))
-    assignment_history_raw = cursor.fetchall()
+    assignment_history = cursor.fetchall()
     
     cursor.close()
     
-    # Convert to list of dictionaries and format dates for JSON
-    ticket_history = []
-    for item in ticket_history_raw:
-        ticket_dict = dict(item)
-        if ticket_dict['created_at']:
-            ticket_dict['created_at'] = ticket_dict['created_at'].isoformat()
-        ticket_history.append(ticket_dict)
-        
-    assignment_history = []
-    for item in assignment_history_raw:
-        assignment_dict = dict(item)
-        if assignment_dict['assignment_date']:
-            assignment_dict['assignment_date'] = assignment_dict['assignment_date'].isoformat()
-        if assignment_dict['return_date']:
-            assignment_dict['return_date'] = assignment_dict['return_date'].isoformat()
-        assignment_history.append(assignment_dict)
-            
     return jsonify({
         "ticket_history": ticket_history,
         "assignment_history": assignment_history
@@ -4055,35 +7411,39 @@ def get_worker_history(worker_id):
 @login_required
 @role_required('Support')
 def get_all_tickets_history():
-    """API endpoint for Support to get ALL tickets, including solved and closed."""
+    """
+    API endpoint for Support to get ALL tickets, including solved and closed.
+    Accepts the ticket list filters, and ?limit= / ?cursor= to page through the history.
+    """
+    try:
+        conditions, params = ticket_list_filters()
+        limit = page_limit() if wants_page() else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     db = get_db()
     cursor = db.cursor()
-    query = """
-        SELECT 
-            t.id AS ticket_id, t.title, t.status, t.priority, t.created_at, t.resolved_at,
-            p.asset_tag AS phone_asset_tag, reporter.full_name AS reported_by,
-            assignee.full_name AS assigned_to
-        FROM tickets t
-        JOIN phones p ON t.phone_id = p.id
-        JOIN users reporter ON t.reported_by_manager_id = reporter.id
-        LEFT JOIN users assignee ON t.assigned_to_support_id = assignee.id
-        ORDER BY t.created_at DESC;
-    """
-    cursor.execute(query)
-    tickets_raw = cursor.fetchall()
+    where_sql = "WHERE " + " AND ".join(conditions) if conditions else ""
+    limit_sql = "LIMIT %s" if limit else ""
+    query = TICKET_HISTORY_QUERY.format(where_sql=where_sql, limit_sql=limit_sql)
+    cursor.execute(query, params + ([limit + 1] if limit else []))
+    tickets = cursor.fetchall()
+    columns = cursor_columns(cursor)
     cursor.close()
-    
-    # Convert to list of dictionaries and format dates for JSON
-    tickets = []
-    for item in tickets_raw:
-        ticket_dict = dict(item)
-        if ticket_dict['created_at']:
-            ticket_dict['created_at'] = ticket_dict['created_at'].isoformat()
-        if ticket_dict['resolved_at']:
-            ticket_dict['resolved_at'] = ticket_dict['resolved_at'].isoformat()
-        tickets.append(ticket_dict)
+
+    next_cursor = None
+    if limit:
+        tickets, next_cursor = paginate(tickets, limit, lambda t: (t['created_at'], t['ticket_id']))
         
-    return jsonify(tickets)
+    if wants_columnar():
+        payload = to_columnar(tickets, columns, dictionary_columns=(
+            'status', 'priority', 'reported_by', 'assigned_to'
+        ))
+    else:
+        payload = tickets
+    if limit:
+        return jsonify({"items": payload, "next_cursor": next_cursor})
+    return jsonify(payload)
 
 
 @app.route('/api/support/ticket/<int:ticket_id>/initiate_swap', methods=['POST'])
@@ -4102,6 +7462,7 @@ def initiate_phone_swap(ticket_id):
     try:
         cursor.execute("INSERT INTO ticket_updates (ticket_id, update_author_id, update_text, is_internal_note) VALUES (%s, %s, %s, FALSE)", (ticket_id, session['user_id'], update_text))
         cursor.execute("UPDATE tickets SET status = 'Pending', updated_at = now() WHERE id = %s", (ticket_id,))
+        notify_ticket_event(cursor, 'swap_initiated', ticket_id)
         db.commit()
         cursor.close()
         return jsonify({"message": "Phone swap initiated and logged on the ticket."})
@@ -4130,6 +7491,7 @@ def manager_confirm_receipt(ticket_id):
 
         cursor.execute("INSERT INTO ticket_updates (ticket_id, update_author_id, update_text, is_internal_note) VALUES (%s, %s, %s, FALSE)", (ticket_id, session['user_id'], update_text))
         cursor.execute("UPDATE tickets SET status = 'Open', updated_at = now() WHERE id = %s", (ticket_id,))
+        notify_ticket_event(cursor, 'swap_received', ticket_id)
         db.commit()
         cursor.close()
         return jsonify({"message": "Receipt confirmed. Support has been notified."})
@@ -4166,17 +7528,8 @@ def get_integration_requests():
     cursor.execute(query, (user_id,))
     requests = cursor.fetchall()
     cursor.close()
-    
-    # Convert datetime objects to ISO format for JSON serialization
-    result_requests = []
-    for req in requests:
-        req_dict = dict(req)
-        for key, value in req_dict.items():
-            if hasattr(value, 'isoformat'):
-                req_dict[key] = value.isoformat()
-        result_requests.append(req_dict)
             
-    return jsonify(result_requests)
+    return jsonify(requests)
 
 @app.route('/api/integration/requests', methods=['POST'])
 @login_required
@@ -4238,17 +7591,8 @@ def get_all_phone_requests():
     cursor.execute(query)
     requests = cursor.fetchall()
     cursor.close()
-    
-    # Convert datetime objects to ISO format strings for JSON serialization
-    result = []
-    for req in requests:
-        req_dict = dict(req)  # Convert RealDictRow to regular dict
-        for key, value in req_dict.items():
-            if hasattr(value, 'isoformat'):  # Check if it's a datetime object
-                req_dict[key] = value.isoformat()
-        result.append(req_dict)
             
-    return jsonify(result)
+    return jsonify(requests)
 
 @app.route('/api/admin/phone_requests/<int:request_id>', methods=['PUT'])
 @login_required
@@ -4288,4 +7632,5 @@ def update_phone_request_status(request_id):
 if __name__ == "__main__":
     # Use environment variable for debug mode
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
-    app.run(host='0.0.0.0', port=5000, debug=debug_mode)
+    # socketio.run serves both HTTP and the websocket endpoint in development
+    socketio.run(app, host='0.0.0.0', port=5000, debug=debug_mode, allow_unsafe_werkzeug=True)
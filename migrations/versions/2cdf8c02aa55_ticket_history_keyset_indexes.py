@@ -0,0 +1,30 @@
+"""Indexes for keyset pagination of the ticket history
+
+Revision ID: 2cdf8c02aa55
+Revises: add_language_preference
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2cdf8c02aa55'
+down_revision = 'add_language_preference'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Newest first, overall and per reporting manager
+    op.execute("CREATE INDEX IF NOT EXISTS idx_tickets_created_at_id ON tickets (created_at DESC, id DESC);")
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tickets_reporter_created_at_id
+            ON tickets (reported_by_manager_id, created_at DESC, id DESC);
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_tickets_reporter_created_at_id;")
+    op.execute("DROP INDEX IF EXISTS idx_tickets_created_at_id;")
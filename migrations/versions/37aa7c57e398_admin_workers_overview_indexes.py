@@ -0,0 +1,46 @@
+"""Indexes for the filters and sort keys of the admin workers overview
+
+Revision ID: 37aa7c57e398
+Revises: 2cdf8c02aa55
+Create Date: 2026-10-19 09:01:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '37aa7c57e398'
+down_revision = '2cdf8c02aa55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE INDEX IF NOT EXISTS idx_workers_secteur_full_name ON workers (secteur_id, full_name, id);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_workers_full_name ON workers (full_name, id);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_workers_status ON workers (status, full_name, id);")
+    # rh_data is created by init_database.py, not by an earlier revision
+    op.execute("""
+        DO $$
+        BEGIN
+            IF to_regclass('rh_data') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS idx_rh_data_contract ON rh_data (contract_type, contract_end_date);
+            END IF;
+        END;
+        $$;
+    """)
+    # Trigram indexes for the ?q= substring search (ILIKE '%...%') on names and worker ids
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_workers_full_name_trgm ON workers USING gin (full_name gin_trgm_ops);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_workers_worker_id_trgm ON workers USING gin (worker_id gin_trgm_ops);")
+
+
+def downgrade():
+    # pg_trgm is left installed: other objects in the database may use it
+    op.execute("DROP INDEX IF EXISTS idx_workers_worker_id_trgm;")
+    op.execute("DROP INDEX IF EXISTS idx_workers_full_name_trgm;")
+    op.execute("DROP INDEX IF EXISTS idx_rh_data_contract;")
+    op.execute("DROP INDEX IF EXISTS idx_workers_status;")
+    op.execute("DROP INDEX IF EXISTS idx_workers_full_name;")
+    op.execute("DROP INDEX IF EXISTS idx_workers_secteur_full_name;")
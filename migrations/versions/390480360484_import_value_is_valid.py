@@ -0,0 +1,35 @@
+"""Cast check used by import dry runs
+
+Revision ID: 390480360484
+Revises: 98a4b0d2dd44
+Create Date: 2026-10-19 09:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '390480360484'
+down_revision = '98a4b0d2dd44'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tests whether a CSV value casts to a column type
+    op.execute("""
+        CREATE OR REPLACE FUNCTION import_value_is_valid(value TEXT, type_name TEXT)
+        RETURNS BOOLEAN AS $$
+        BEGIN
+            EXECUTE format('SELECT %L::%s', value, type_name);
+            RETURN TRUE;
+        EXCEPTION WHEN others THEN
+            RETURN FALSE;
+        END;
+        $$ language 'plpgsql' STABLE;
+    """)
+
+
+def downgrade():
+    op.execute("DROP FUNCTION IF EXISTS import_value_is_valid(TEXT, TEXT);")
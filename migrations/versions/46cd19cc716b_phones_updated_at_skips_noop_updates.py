@@ -0,0 +1,43 @@
+"""Keep phones.updated_at on no-op updates
+
+Revision ID: 46cd19cc716b
+Revises: 390480360484
+Create Date: 2026-10-19 09:06:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '46cd19cc716b'
+down_revision = '390480360484'
+branch_labels = None
+depends_on = None
+
+
+def _recreate_trigger(when_sql):
+    # update_updated_at_column() is created by init_database.py, not by an earlier revision
+    op.execute(f"""
+        DO $$
+        BEGIN
+            IF to_regprocedure('update_updated_at_column()') IS NOT NULL THEN
+                DROP TRIGGER IF EXISTS update_phones_updated_at ON phones;
+                CREATE TRIGGER update_phones_updated_at
+                    BEFORE UPDATE ON phones
+                    FOR EACH ROW
+                    {when_sql}
+                    EXECUTE FUNCTION update_updated_at_column();
+            END IF;
+        END;
+        $$;
+    """)
+
+
+def upgrade():
+    # Re-imports of unchanged rows keep the old timestamp
+    _recreate_trigger("WHEN (OLD.* IS DISTINCT FROM NEW.*)")
+
+
+def downgrade():
+    _recreate_trigger("")
@@ -0,0 +1,33 @@
+"""Per-phone indexes for the asset lifecycle timeline
+
+Revision ID: 59727549fb07
+Revises: ecf723f0f0de
+Create Date: 2026-10-19 09:08:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '59727549fb07'
+down_revision = 'ecf723f0f0de'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE INDEX IF NOT EXISTS idx_assignments_phone_date ON assignments (phone_id, assignment_date);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_tickets_phone_created_at ON tickets (phone_id, created_at);")
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_asset_history_log_asset
+            ON asset_history_log (asset_type, asset_id, event_timestamp);
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_ticket_updates_ticket_created_at ON ticket_updates (ticket_id, created_at);")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_ticket_updates_ticket_created_at;")
+    op.execute("DROP INDEX IF EXISTS idx_asset_history_log_asset;")
+    op.execute("DROP INDEX IF EXISTS idx_tickets_phone_created_at;")
+    op.execute("DROP INDEX IF EXISTS idx_assignments_phone_date;")
@@ -0,0 +1,81 @@
+"""Change feed for delta sync
+
+Revision ID: 5a779a8d021b
+Revises: bae7d37c9352
+Create Date: 2026-10-19 09:03:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a779a8d021b'
+down_revision = 'bae7d37c9352'
+branch_labels = None
+depends_on = None
+
+SYNCED_TABLES = ('workers', 'phones', 'assignments', 'tickets')
+
+
+def upgrade():
+    # One row per insert, update or delete on the synced tables, stamped with the
+    # writing transaction's id. Deletes keep the old row so tombstones can still be
+    # scoped to the right users.
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            id BIGSERIAL PRIMARY KEY,
+            txid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+            table_name VARCHAR(50) NOT NULL,
+            row_id INTEGER NOT NULL,
+            op CHAR(1) NOT NULL CHECK (op IN ('I', 'U', 'D')),
+            row_data JSONB NOT NULL,
+            old_data JSONB NULL,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_change_log_txid ON change_log (txid);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_change_log_changed_at ON change_log (changed_at);")
+    # Highest txid removed by pruning: sync tokens at or below it must do a full reload
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS change_log_horizon (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            max_pruned_txid XID8 NOT NULL
+        );
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION record_change()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO change_log (table_name, row_id, op, row_data)
+                VALUES (TG_TABLE_NAME, OLD.id, 'D', to_jsonb(OLD));
+            ELSIF TG_OP = 'UPDATE' THEN
+                -- An update that changed nothing is not a change
+                IF OLD IS NOT DISTINCT FROM NEW THEN
+                    RETURN NULL;
+                END IF;
+                INSERT INTO change_log (table_name, row_id, op, row_data, old_data)
+                VALUES (TG_TABLE_NAME, NEW.id, 'U', to_jsonb(NEW), to_jsonb(OLD));
+            ELSE
+                INSERT INTO change_log (table_name, row_id, op, row_data)
+                VALUES (TG_TABLE_NAME, NEW.id, 'I', to_jsonb(NEW));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+    """)
+    for table in SYNCED_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_change_log ON {table};")
+        op.execute(f"""
+            CREATE TRIGGER {table}_change_log AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION record_change();
+        """)
+
+
+def downgrade():
+    for table in SYNCED_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_change_log ON {table};")
+    op.execute("DROP FUNCTION IF EXISTS record_change();")
+    op.execute("DROP TABLE IF EXISTS change_log_horizon;")
+    op.execute("DROP TABLE IF EXISTS change_log;")
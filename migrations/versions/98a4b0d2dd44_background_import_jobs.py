@@ -0,0 +1,52 @@
+"""Background CSV import jobs
+
+Revision ID: 98a4b0d2dd44
+Revises: 5a779a8d021b
+Create Date: 2026-10-19 09:04:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '98a4b0d2dd44'
+down_revision = '5a779a8d021b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # One row per job, updated after every committed chunk.
+    # rows_processed doubles as the resume offset into the staged upload.
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            kind VARCHAR(20) NOT NULL,
+            target_table VARCHAR(50),
+            upload_id VARCHAR(36) NOT NULL,
+            options JSONB NOT NULL DEFAULT '{}',
+            status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'completed', 'failed', 'cancelled')),
+            rows_processed INTEGER NOT NULL DEFAULT 0,
+            run_start_rows INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            unchanged INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            bytes_processed BIGINT NOT NULL DEFAULT 0,
+            bytes_total BIGINT NOT NULL DEFAULT 0,
+            cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+            error TEXT NULL,
+            details JSONB NOT NULL DEFAULT '{}',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            started_at TIMESTAMPTZ NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            finished_at TIMESTAMPTZ NULL
+        );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_import_jobs_user_created ON import_jobs (user_id, created_at DESC);")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS import_jobs;")
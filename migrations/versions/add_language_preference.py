@@ -0,0 +1,27 @@
+"""Add language preference to users
+
+Revision ID: add_language_preference
+Revises: 6e74b2b49c9c
+Create Date: 2025-07-22 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_language_preference'
+down_revision = '6e74b2b49c9c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The initial migration already has the column; databases created before it was
+    # added there get it here
+    op.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS language_preference VARCHAR(5) NULL DEFAULT 'en';")
+
+
+def downgrade():
+    # The column belongs to the initial migration's schema, so it stays
+    pass
@@ -0,0 +1,106 @@
+"""Phone status changes and daily trend rollups
+
+Revision ID: b45acdddc28d
+Revises: 59727549fb07
+Create Date: 2026-10-19 09:09:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b45acdddc28d'
+down_revision = '59727549fb07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Status transitions of phones, recorded by trigger whichever code path made them
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS phone_status_changes (
+            id BIGSERIAL PRIMARY KEY,
+            phone_id INTEGER NOT NULL REFERENCES phones(id) ON DELETE CASCADE,
+            old_status VARCHAR(50) NULL,
+            new_status VARCHAR(50) NOT NULL,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_phone_status_changes_changed_at ON phone_status_changes (changed_at);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_phone_status_changes_phone ON phone_status_changes (phone_id, new_status);")
+    # Retirements logged before phone_status_changes existed are a rollup source too
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_asset_history_log_retired ON asset_history_log (event_timestamp)
+            WHERE asset_type = 'Phone' AND event_type = 'Retired';
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION record_phone_status_change()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO phone_status_changes (phone_id, old_status, new_status)
+            VALUES (NEW.id, CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END, NEW.status);
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+    """)
+    op.execute("DROP TRIGGER IF EXISTS phones_status_insert ON phones;")
+    op.execute("DROP TRIGGER IF EXISTS phones_status_update ON phones;")
+    op.execute("""
+        CREATE TRIGGER phones_status_insert AFTER INSERT ON phones
+            FOR EACH ROW EXECUTE FUNCTION record_phone_status_change();
+    """)
+    op.execute("""
+        CREATE TRIGGER phones_status_update AFTER UPDATE OF status ON phones
+            FOR EACH ROW
+            WHEN (OLD.status IS DISTINCT FROM NEW.status)
+            EXECUTE FUNCTION record_phone_status_change();
+    """)
+    # Daily trend rollups, per sector (NULL: no sector could be attributed). The
+    # refresh thread builds them from scratch while daily_rollup_state is empty.
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS daily_sector_rollups (
+            day DATE NOT NULL,
+            secteur_id INTEGER NULL REFERENCES secteurs(id) ON DELETE CASCADE,
+            assignments_created INTEGER NOT NULL DEFAULT 0,
+            assignments_returned INTEGER NOT NULL DEFAULT 0,
+            phones_to_repair INTEGER NOT NULL DEFAULT 0,
+            phones_retired INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_daily_sector_rollups_day ON daily_sector_rollups (day, secteur_id);")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS daily_ticket_rollups (
+            day DATE NOT NULL,
+            secteur_id INTEGER NULL REFERENCES secteurs(id) ON DELETE CASCADE,
+            priority VARCHAR(20) NOT NULL,
+            tickets_opened INTEGER NOT NULL DEFAULT 0,
+            tickets_resolved INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_daily_ticket_rollups_day ON daily_ticket_rollups (day, secteur_id);")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS daily_rollup_state (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            rolled_up_through DATE NOT NULL,
+            refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+    # Range reads on the event timestamps for the rollup refresh
+    op.execute("CREATE INDEX IF NOT EXISTS idx_assignments_assignment_date ON assignments (assignment_date);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_assignments_return_date ON assignments (return_date);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_tickets_resolved_at ON tickets (resolved_at);")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_tickets_resolved_at;")
+    op.execute("DROP INDEX IF EXISTS idx_assignments_return_date;")
+    op.execute("DROP INDEX IF EXISTS idx_assignments_assignment_date;")
+    op.execute("DROP TABLE IF EXISTS daily_rollup_state;")
+    op.execute("DROP TABLE IF EXISTS daily_ticket_rollups;")
+    op.execute("DROP TABLE IF EXISTS daily_sector_rollups;")
+    op.execute("DROP TRIGGER IF EXISTS phones_status_update ON phones;")
+    op.execute("DROP TRIGGER IF EXISTS phones_status_insert ON phones;")
+    op.execute("DROP FUNCTION IF EXISTS record_phone_status_change();")
+    op.execute("DROP INDEX IF EXISTS idx_asset_history_log_retired;")
+    op.execute("DROP TABLE IF EXISTS phone_status_changes;")
@@ -0,0 +1,28 @@
+"""Indexes for the status filter and sort of the inventory lists
+
+Revision ID: bae7d37c9352
+Revises: 37aa7c57e398
+Create Date: 2026-10-19 09:02:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bae7d37c9352'
+down_revision = '37aa7c57e398'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE INDEX IF NOT EXISTS idx_phones_status_id ON phones (status, id);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_sim_cards_status_id ON sim_cards (status, id);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_phone_numbers_status_id ON phone_numbers (status, id);")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_phone_numbers_status_id;")
+    op.execute("DROP INDEX IF EXISTS idx_sim_cards_status_id;")
+    op.execute("DROP INDEX IF EXISTS idx_phones_status_id;")
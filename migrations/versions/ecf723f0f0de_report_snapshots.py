@@ -0,0 +1,37 @@
+"""Report snapshots
+
+Revision ID: ecf723f0f0de
+Revises: 46cd19cc716b
+Create Date: 2026-10-19 09:07:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ecf723f0f0de'
+down_revision = '46cd19cc716b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Point-in-time copies of the admin reports, stored as gzip-compressed JSON
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS report_snapshots (
+            id SERIAL PRIMARY KEY,
+            report VARCHAR(50) NOT NULL,
+            taken_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            trigger VARCHAR(20) NOT NULL DEFAULT 'scheduled' CHECK (trigger IN ('scheduled', 'manual')),
+            created_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+            payload BYTEA NOT NULL,
+            raw_bytes INTEGER NOT NULL,
+            compressed_bytes INTEGER NOT NULL
+        );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_report_snapshots_report_taken ON report_snapshots (report, taken_at DESC);")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS report_snapshots;")
@@ -0,0 +1,107 @@
+"""Per-ticket response and resolution times for SLA analytics
+
+Revision ID: f8241a107f64
+Revises: b45acdddc28d
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f8241a107f64'
+down_revision = 'b45acdddc28d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Kept current by the triggers below. First response: the first public update
+    # by someone other than the reporting manager.
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_metrics (
+            ticket_id INTEGER PRIMARY KEY REFERENCES tickets(id) ON DELETE CASCADE,
+            priority VARCHAR(20) NOT NULL,
+            secteur_id INTEGER NULL REFERENCES secteurs(id) ON DELETE SET NULL,
+            assignee_id INTEGER NULL REFERENCES users(id) ON DELETE SET NULL,
+            created_at TIMESTAMPTZ NOT NULL,
+            first_response_at TIMESTAMPTZ NULL,
+            resolved_at TIMESTAMPTZ NULL,
+            first_response_seconds DOUBLE PRECISION
+                GENERATED ALWAYS AS (EXTRACT(epoch FROM first_response_at - created_at)::double precision) STORED,
+            resolution_seconds DOUBLE PRECISION
+                GENERATED ALWAYS AS (EXTRACT(epoch FROM resolved_at - created_at)::double precision) STORED
+        );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_ticket_metrics_created_at ON ticket_metrics (created_at);")
+    # Recomputes one ticket's metrics row; the sector is that of the worker who last
+    # received the ticket's phone before it was opened
+    op.execute("""
+        CREATE OR REPLACE FUNCTION refresh_ticket_metrics(p_ticket_id INTEGER)
+        RETURNS VOID AS $$
+        BEGIN
+            INSERT INTO ticket_metrics
+                (ticket_id, priority, secteur_id, assignee_id, created_at, first_response_at, resolved_at)
+            SELECT t.id, t.priority, holder.secteur_id, t.assigned_to_support_id, t.created_at,
+                   (SELECT MIN(tu.created_at) FROM ticket_updates tu
+                    WHERE tu.ticket_id = t.id AND NOT tu.is_internal_note
+                      AND tu.update_author_id <> t.reported_by_manager_id),
+                   t.resolved_at
+            FROM tickets t
+            LEFT JOIN LATERAL (
+                SELECT w.secteur_id
+                FROM assignments a
+                JOIN workers w ON a.worker_id = w.id
+                WHERE a.phone_id = t.phone_id AND a.assignment_date <= t.created_at
+                ORDER BY a.assignment_date DESC
+                LIMIT 1
+            ) holder ON TRUE
+            WHERE t.id = p_ticket_id
+            ON CONFLICT (ticket_id) DO UPDATE
+                SET priority = EXCLUDED.priority,
+                    secteur_id = EXCLUDED.secteur_id,
+                    assignee_id = EXCLUDED.assignee_id,
+                    created_at = EXCLUDED.created_at,
+                    first_response_at = EXCLUDED.first_response_at,
+                    resolved_at = EXCLUDED.resolved_at;
+        END;
+        $$ language 'plpgsql';
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION ticket_metrics_changed()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'tickets' THEN
+                PERFORM refresh_ticket_metrics(NEW.id);
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM refresh_ticket_metrics(OLD.ticket_id);
+            ELSE
+                PERFORM refresh_ticket_metrics(NEW.ticket_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+    """)
+    op.execute("DROP TRIGGER IF EXISTS tickets_metrics ON tickets;")
+    op.execute("DROP TRIGGER IF EXISTS ticket_updates_metrics ON ticket_updates;")
+    op.execute("""
+        CREATE TRIGGER tickets_metrics
+            AFTER INSERT OR UPDATE OF priority, assigned_to_support_id, resolved_at, created_at, phone_id, reported_by_manager_id
+            ON tickets
+            FOR EACH ROW EXECUTE FUNCTION ticket_metrics_changed();
+    """)
+    op.execute("""
+        CREATE TRIGGER ticket_updates_metrics AFTER INSERT OR UPDATE OR DELETE ON ticket_updates
+            FOR EACH ROW EXECUTE FUNCTION ticket_metrics_changed();
+    """)
+    # Tickets opened before the triggers existed
+    op.execute("SELECT COUNT(refresh_ticket_metrics(id)) FROM tickets;")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS ticket_updates_metrics ON ticket_updates;")
+    op.execute("DROP TRIGGER IF EXISTS tickets_metrics ON tickets;")
+    op.execute("DROP FUNCTION IF EXISTS ticket_metrics_changed();")
+    op.execute("DROP FUNCTION IF EXISTS refresh_ticket_metrics(INTEGER);")
+    op.execute("DROP TABLE IF EXISTS ticket_metrics;")
@@ -0,0 +1,148 @@
+"""
+Differential tests of the import tokenizer (iter_csv_with_options) against the
+line-by-line parser the import wizard used before it, kept below as the reference.
+"""
+import io
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import CSV_MAX_QUOTED_LINES, iter_csv_with_options  # noqa: E402
+
+
+def parse_csv_with_options(content, separators, text_delimiter, start_line, merge_separators):
+    """The previous wizard parser, unchanged: the reference for the quote rule."""
+    lines = content.split('\n')[start_line - 1:]
+    result = []
+    for line in lines:
+        if line.strip() == '':
+            continue
+        row = []
+        current_field = ''
+        in_quotes = False
+        i = 0
+        while i < len(line):
+            char = line[i]
+            if char == text_delimiter:
+                if not in_quotes:
+                    in_quotes = True
+                elif i + 1 < len(line) and line[i + 1] == text_delimiter:
+                    current_field += text_delimiter
+                    i += 1
+                else:
+                    in_quotes = False
+            elif not in_quotes and char in separators:
+                row.append(current_field.strip())
+                current_field = ''
+                if merge_separators:
+                    while i + 1 < len(line) and line[i + 1] in separators:
+                        i += 1
+            else:
+                current_field += char
+            i += 1
+        row.append(current_field.strip())
+        if any(field.strip() for field in row):
+            result.append(row)
+    return result
+
+
+def tokenize(content, separators, text_delimiter='"', start_line=1, merge_separators=False):
+    return list(iter_csv_with_options(io.StringIO(content), separators, text_delimiter, start_line, merge_separators))
+
+
+@pytest.mark.parametrize('separators', [[';'], [';', ','], [',', ';', '\t']])
+@pytest.mark.parametrize('line', [
+    'ab"c;d',
+    'a"b"c;d',
+    '"a;b";c',
+    '"a""b";c',
+    '""',
+    'x;"";y',
+    '  "a b" ;c',
+    'a;b"',
+    '"unterminated;rest',
+    'a,b;c"d,e"f',
+])
+def test_stray_quotes_match_previous_parser(line, separators):
+    assert tokenize(line, separators) == parse_csv_with_options(line, separators, '"', 1, False)
+
+
+def test_adding_a_separator_keeps_the_quote_rule():
+    line = 'ab"c;d'
+    assert tokenize(line, [';']) == tokenize(line, [';', ',']) == [['abc;d']]
+
+
+def test_random_lines_match_previous_parser():
+    rng = random.Random(20261019)
+    pieces = ['a', 'b', ' ', ';', ',', '"', '""', '\t']
+    for _ in range(2000):
+        line = ''.join(rng.choice(pieces) for _ in range(rng.randint(1, 12)))
+        separators = rng.choice([[';'], [';', ','], [';', ',', '\t']])
+        merge = rng.random() < 0.3
+        # One line at a time: an odd quote count is then an unterminated quote at the end of the file
+        assert tokenize(line, separators, merge_separators=merge) == \
+            parse_csv_with_options(line, separators, '"', 1, merge), (line, separators, merge)
+
+
+def test_unterminated_quote_ends_with_its_line():
+    content = 'id;name\n1;"Ann\n2;Bob\n3;Cy\n'
+    expected = parse_csv_with_options(content, [';'], '"', 1, False)
+    assert tokenize(content, [';']) == expected == [['id', 'name'], ['1', 'Ann'], ['2', 'Bob'], ['3', 'Cy']]
+
+
+def test_unterminated_quote_does_not_swallow_a_long_file():
+    body = ''.join(f'{i};row{i}\n' for i in range(2, CSV_MAX_QUOTED_LINES * 3))
+    content = '1;"open\n' + body + 'last;"x\n'
+    rows = tokenize(content, [';'])
+    assert rows == parse_csv_with_options(content, [';'], '"', 1, False)
+    assert len(rows) == CSV_MAX_QUOTED_LINES * 3
+
+
+def test_quoted_field_spanning_lines():
+    assert tokenize('a;"line one\nline two";b\nc;d\n', [';']) == [['a', 'line one\nline two', 'b'], ['c', 'd']]
+
+
+@pytest.mark.parametrize('separators', [['||'], ['||', ';'], ['::', '|']])
+@pytest.mark.parametrize('line', [
+    'a||b||c',
+    'a||"b||c"||d',
+    'ab"c||d',
+    '"x""y"||z',
+    'a||||b',
+    '"open||rest',
+])
+@pytest.mark.parametrize('merge', [False, True])
+def test_multi_character_separators(line, separators, merge):
+    # The previous parser only split on single characters: map each
+    # multi-character separator to a control character it does split on
+    # (and back inside quoted values)
+    single = []
+    placeholders = {}
+    reference_line = line
+    for index, separator in enumerate(sorted(separators, key=len, reverse=True)):
+        if len(separator) > 1:
+            placeholder = chr(0x1c + index)
+            placeholders[placeholder] = separator
+            reference_line = reference_line.replace(separator, placeholder)
+            single.append(placeholder)
+        else:
+            single.append(separator)
+
+    def restore(value):
+        for placeholder, separator in placeholders.items():
+            value = value.replace(placeholder, separator)
+        return value
+
+    expected = [[restore(value) for value in row]
+                for row in parse_csv_with_options(reference_line, single, '"', 1, merge)]
+    assert tokenize(line, separators, merge_separators=merge) == expected
+
+
+def test_line_numbers_count_skipped_blank_and_continued_lines():
+    content = 'Title\nid;name\n1;Ann\n\n2;"Bob\nJr"\n3;"open\n4;Dee\n'
+    rows = list(iter_csv_with_options(io.StringIO(content), [';'], '"', 2, line_numbers=True))
+    assert rows == [(2, ['id', 'name']), (3, ['1', 'Ann']), (5, ['2', 'Bob\nJr']), (7, ['3', 'open']), (8, ['4', 'Dee'])]